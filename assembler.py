@@ -0,0 +1,128 @@
+# The assembler (a.k.a. linker) sits between the compiler and the VM.
+#
+# The compiler emits symbolic code, with named labels and jumps that refer to those names:
+#
+#      ('LABEL', 'LBL1')
+#      ('LINE', 3)
+#      ('LOAD_GLOBAL', 0)
+#      ('JMPZ', 'LBL2')
+#      ('SET_SLOT', '0 (x)')
+#      ...
+#      ('JMP', 'LBL1')
+#      ('LABEL', 'LBL2')
+#
+# The assembler removes the pseudo-instructions (LABEL, SET_SLOT and LINE), which do nothing at
+# runtime, and rewrites the label operand of every jump (JMP, JMPZ, JSR, TAIL_JSR, the fused JMPZ_*
+# compare and branch instructions, and the FOR_PREP/FOR_LOOP loop instructions) with the absolute
+# PC of the instruction that follows the target label. The label is always the last operand of a
+# jump, so the same assembler also links the code of the register VM (see regvm.py), which passes
+# its own list of jump instructions:
+#
+#      00000000 ('LOAD_GLOBAL', 0)
+#      00000001 ('JMPZ', 7)
+#      ...
+#      00000006 ('JMP', 0)
+#
+# The label names are kept in a side table so the program can still be disassembled and so
+# runtime errors can report where they happened. The LINE pseudo-instructions (emitted by the
+# compiler at the start of every statement) become a debug line table of (pc, line) entries, one
+# for every PC where the source line changes.
+
+from utils import *
+import bisect
+import math
+
+# Pseudo-instructions that are consumed by the assembler and never reach the VM
+PSEUDO_OPS = ('LABEL', 'SET_SLOT', 'LINE')
+
+# Instructions whose last operand is a label name that must be resolved to a PC
+JUMP_OPS = ('JMP', 'JMPZ', 'JSR', 'TAIL_JSR', 'JMPZ_LT_NUM', 'JMPZ_GT_NUM', 'JMPZ_LE_NUM', 'JMPZ_GE_NUM',
+            'FOR_PREP', 'FOR_LOOP')
+
+class Program:
+  '''
+  An assembled program: the executable instruction stream plus a side table of label names
+  '''
+  def __init__(self, code, labels, lines=None):
+    self.code = code            # List of instruction tuples with jump targets resolved to PCs
+    self.labels = labels        # Dictionary mapping label names to their PC positions in the code
+    self.lines = lines or []    # List of (pc, line) entries, sorted by PC
+    self.names = {}             # Dictionary mapping a PC to the first label name that points to it
+    for name, pc in labels.items():
+      self.names.setdefault(pc, name)
+
+  def line_for(self, pc):
+    '''
+    Returns the source line of the instruction at a given PC (or None if it is unknown)
+    '''
+    index = bisect.bisect_right(self.lines, (pc, math.inf)) - 1
+    return self.lines[index][1] if index >= 0 else None
+
+  def names_at(self, pc):
+    '''
+    Returns the list of label names that point to a given PC
+    '''
+    return [name for name, target in self.labels.items() if target == pc]
+
+  def label_for(self, pc):
+    '''
+    Describes a PC relative to the closest label at or before it (for example 'factorial+3')
+    '''
+    closest = None
+    for name, target in self.labels.items():
+      if target <= pc and (closest is None or target > self.labels[closest]):
+        closest = name
+    if closest is None:
+      return str(pc)
+    offset = pc - self.labels[closest]
+    return closest if offset == 0 else f'{closest}+{offset}'
+
+  def disassemble(self):
+    for pc, instruction in enumerate(self.code):
+      for name in self.names_at(pc):
+        print(f'{pc:08} {name}:')
+      opcode, *args = instruction
+      if opcode == 'PUSH':
+        print(f'{pc:08}     {opcode} {stringify(args[0][1])}')
+      elif opcode in JUMP_OPS:
+        operands = ''.join(f'{arg} ' for arg in args[:-1])
+        print(f'{pc:08}     {opcode} {operands}{args[-1]} ({self.label_for(args[-1])})')
+      else:
+        print(f'{pc:08}     {opcode} {" ".join(str(arg) for arg in args)}'.rstrip())
+
+class Assembler:
+  def __init__(self, jump_ops=JUMP_OPS):
+    self.jump_ops = jump_ops
+
+  def assemble(self, instructions):
+    # First pass: compute the PC of every label (the position of the next real instruction) and
+    # the line table
+    labels = {}
+    lines = []
+    pc = 0
+    for instruction in instructions:
+      opcode = instruction[0]
+      if opcode == 'LABEL':
+        labels[instruction[1]] = pc
+      elif opcode == 'LINE':
+        if lines and lines[-1][0] == pc:
+          lines.pop()
+        if not lines or lines[-1][1] != instruction[1]:
+          lines.append((pc, instruction[1]))
+      elif opcode not in PSEUDO_OPS:
+        pc += 1
+
+    # Second pass: drop the pseudo-instructions and resolve jump targets
+    code = []
+    for instruction in instructions:
+      opcode = instruction[0]
+      if opcode in PSEUDO_OPS:
+        continue
+      if opcode in self.jump_ops:
+        target = labels.get(instruction[-1])
+        if target is None:
+          vm_error(f'Undefined label {instruction[-1]!r}.', len(code))
+        instruction = instruction[:-1] + (target,)
+      code.append(instruction)
+
+    return Program(code, labels, lines)
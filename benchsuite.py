@@ -0,0 +1,234 @@
+# A benchmark suite for the whole pipeline. It runs generated workloads (that grow with --scale) and
+# the scripts/*.pinky programs, and times every phase separately:
+#
+#      lex         Lexer.tokenize
+#      parse       Parser.parse
+#      optimize    Optimizer.optimize
+#      compile     Compiler.generate_code
+#      assemble    Peephole.optimize and Assembler.assemble
+#      vm          VM.run
+#      interpret   Interpreter.interpret_ast
+#      transpile   Transpiler.run (the Python code generation, compile() and exec() of the program)
+#
+# Every time is the best of --repeat runs. The results are printed as a table and can be saved as
+# JSON, so the runs of two commits can be compared phase by phase:
+#
+#      python3 benchsuite.py --json before.json
+#      python3 benchsuite.py --json after.json --compare before.json
+#      python3 benchsuite.py --scale 4 --only loop,recursion --phases lex,parse,vm
+import io
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import subprocess
+from lexer import *
+from parser import *
+from optimizer import *
+from interpreter import *
+from transpiler import *
+from compiler import *
+from peephole import *
+from assembler import *
+from vm import *
+
+PHASES = ['lex', 'parse', 'optimize', 'compile', 'assemble', 'vm', 'interpret', 'transpile']
+
+def deep_expression(scale):
+  '''
+  Arithmetic expressions nested deep in parentheses
+  '''
+  depth = 40
+  expr = 'x'
+  for i in range(depth):
+    expr = f'({expr} + {i} * (x - {i % 7}))'
+  lines = ['x := 1']
+  for i in range(25 * scale):
+    lines.append(f'y := {expr}')
+  lines.append('println y')
+  return '\n'.join(lines)
+
+def straight_line(scale):
+  '''
+  Long straight-line code: assignments, expressions and ifs, without loops or calls
+  '''
+  lines = ['a := 1', 'b := 2']
+  for i in range(2000 * scale):
+    lines.append(f'a := (a * {i % 13 + 1} + b) % 1000')
+    lines.append(f'b := b + a - {i % 5}')
+    if i % 10 == 0:
+      lines.append(f'if a > b then b := b + 1 else a := a + 1 end')
+  lines.append('println a + " " + b')
+  return '\n'.join(lines)
+
+def tight_loop(scale):
+  '''
+  Nested loops doing arithmetic on a few variables
+  '''
+  return f'''
+total := 0
+for i := 1, {100 * scale} do
+  j := 0
+  while j < 100 do
+    total := (total + i * j) % 1000003
+    j := j + 1
+  end
+end
+println total
+'''
+
+def recursion(scale):
+  '''
+  Recursive calls: fib and a function calling itself deep enough to need many frames
+  '''
+  return f'''
+func fib(n)
+  if n < 2 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+func depth(n)
+  if n == 0 then
+    ret 0
+  end
+  ret 1 + depth(n - 1)
+end
+i := 0
+while i < {scale} do
+  println fib(16) + depth(200)
+  i := i + 1
+end
+'''
+
+def heavy_printing(scale):
+  '''
+  Many small print statements, like the ASCII renderings of the scripts
+  '''
+  return f'''
+for y := 1, {40 * scale} do
+  for x := 1, 200 do
+    if (x + y) % 3 == 0 then print "*" else print " " end
+  end
+  println ""
+end
+'''
+
+WORKLOADS = [
+  ('deep-expression', deep_expression),
+  ('straight-line', straight_line),
+  ('loop', tight_loop),
+  ('recursion', recursion),
+  ('printing', heavy_printing),
+]
+
+def best_time(run, repeat):
+  '''
+  Returns the result of the last run and the best time of all the runs
+  '''
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return result, best
+
+def run_quietly(run):
+  # The program output goes to memory (the printing still happens, but not the terminal I/O)
+  def quiet():
+    try:
+      run(Output(io.StringIO()))
+    except PinkyError:
+      pass
+  return quiet
+
+def benchmark(source, phases, repeat):
+  '''
+  Times the phases of the pipeline on a source, and returns a dict of phase name -> seconds
+  '''
+  times = {}
+  tokens, times['lex'] = best_time(lambda: Lexer(source).tokenize(), repeat)
+  ast, times['parse'] = best_time(lambda: Parser(tokens).parse(), repeat)
+  ast, times['optimize'] = best_time(lambda: Optimizer().optimize(ast), repeat)
+  if 'compile' in phases or 'assemble' in phases or 'vm' in phases:
+    code, times['compile'] = best_time(lambda: Compiler().generate_code(ast), repeat)
+    program, times['assemble'] = best_time(lambda: Assembler().assemble(Peephole().optimize(code)), repeat)
+    if 'vm' in phases:
+      _, times['vm'] = best_time(run_quietly(lambda output: VM(output).run(program)), repeat)
+  if 'interpret' in phases:
+    _, times['interpret'] = best_time(run_quietly(lambda output: Interpreter(output).interpret_ast(ast)), repeat)
+  if 'transpile' in phases:
+    # The native Python fast path, to compare the VM with
+    _, times['transpile'] = best_time(run_quietly(lambda output: Transpiler(output).run(ast)), repeat)
+  return {phase: times[phase] for phase in PHASES if phase in phases}
+
+def current_commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+  except OSError:
+    return None
+
+def load_workloads(scale, only):
+  workloads = [(name, generate(scale)) for name, generate in WORKLOADS]
+  for filename in sorted(glob.glob('scripts/*.pinky')):
+    with open(filename) as file:
+      workloads.append((filename, file.read()))
+  if only:
+    workloads = [(name, source) for name, source in workloads if any(part in name for part in only)]
+  return workloads
+
+def print_table(results, phases, baseline=None):
+  print(f'{Colors.MAGENTA}{"workload":<32}' + ''.join(f'{phase:>11}' for phase in phases) + f'{Colors.WHITE}')
+  for name, times in results.items():
+    row = f'{name:<32}' + ''.join(f'{times[phase]:>10.4f}s' for phase in phases)
+    print(row)
+    if baseline and name in baseline:
+      old = baseline[name]
+      ratios = ''
+      for phase in phases:
+        if phase in old and times[phase] > 0:
+          ratio = old[phase] / times[phase]
+          color = Colors.GREEN if ratio >= 1.1 else Colors.RED if ratio <= 0.9 else Colors.WHITE
+          ratios += f'{color}{ratio:>10.2f}x{Colors.WHITE}'
+        else:
+          ratios += f'{"-":>11}'
+      print(f'{"  speedup vs baseline":<32}{ratios}')
+
+if __name__ == '__main__':
+  argparser = argparse.ArgumentParser(description='Time every phase of the Pinky pipeline on generated workloads and the scripts.')
+  argparser.add_argument('--scale', type=int, default=1, help='size factor of the generated workloads')
+  argparser.add_argument('--repeat', type=int, default=3, help='number of timed runs of each phase (the best one is reported)')
+  argparser.add_argument('--phases', default=','.join(PHASES), help='comma-separated phases to time (lex, parse and optimize always run)')
+  argparser.add_argument('--only', default='', help='comma-separated parts of the names of the workloads to run')
+  argparser.add_argument('--json', metavar='FILE', help='save the results as JSON')
+  argparser.add_argument('--compare', metavar='FILE', help='JSON results of an earlier run to compare with')
+  args = argparser.parse_args()
+
+  phases = [phase for phase in PHASES if phase in args.phases.split(',')]
+  only = [part for part in args.only.split(',') if part]
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000)) # <-- deep expressions and recursion in the interpreter
+
+  results = {}
+  for name, source in load_workloads(args.scale, only):
+    results[name] = benchmark(source, phases, args.repeat)
+
+  baseline = None
+  if args.compare:
+    with open(args.compare) as file:
+      baseline = json.load(file)['results']
+  print_table(results, phases, baseline)
+
+  if args.json:
+    report = {
+      'commit': current_commit(),
+      'python': platform.python_version(),
+      'scale': args.scale,
+      'repeat': args.repeat,
+      'phases': phases,
+      'results': results,
+    }
+    with open(args.json, 'w') as file:
+      json.dump(report, file, indent=2)
@@ -0,0 +1,267 @@
+# The binary bytecode format of an assembled program, so compiled programs can be saved to disk
+# and loaded by the VM without running the lexer, parser and compiler again.
+#
+# All integers are little-endian. A file is made of five sections:
+#
+#      header          magic 'PNKY' (4 bytes), format version (u16), reserved (u16),
+#                      SHA-256 hash of the source code (32 bytes)
+#      constant pool   count (u32), then each constant as a type byte and its value:
+#                        0 = number (f64), 1 = string (u32 length + UTF-8 bytes, with its escape
+#                        sequences already processed), 2 = bool (u8)
+#      label table     count (u32), then each label as its name (u32 length + UTF-8 bytes) and PC (u32)
+#      opcode stream   count (u32), then each instruction as its opcode (u8) and its operands,
+#                      whose layout depends on the opcode (see OPERANDS)
+#      line table      count (u32), then (pc, line) pairs (u32, u32)
+#
+# Constant operands (PUSH values and the constants of the fused instructions) are stored in the
+# constant pool and referred to by their index, so repeated constants are only stored once.
+#
+# The cache keeps the bytecode of every compiled script in a directory, in a file named after the
+# hash of its source, so running an unchanged script skips the front end entirely.
+
+from defs import *
+from utils import *
+from assembler import *
+import hashlib
+import struct
+import os
+
+BYTECODE_MAGIC   = b'PNKY'
+BYTECODE_VERSION = 6
+
+HEADER = struct.Struct('<4sHH32s')
+U8     = struct.Struct('<B')
+U32    = struct.Struct('<I')
+F64    = struct.Struct('<d')
+PAIR   = struct.Struct('<II')
+LOOP   = struct.Struct('<IIBI')
+
+CONST_NUMBER = 0
+CONST_STRING = 1
+CONST_BOOL   = 2
+
+# The operand layout of the instructions that have operands (the others are just the opcode byte):
+#
+#   int    a single u32 (a slot, a PC or a count)
+#   const  a u32 index in the constant pool
+#   number a u32 index in the constant pool of an unboxed number
+#   pair   two u32 slots
+#   inc    a u32 slot and a u32 index in the constant pool of an unboxed number
+#   call   the u32 number of args and the u32 PC of the function
+#   loop   the u32 base slot and u32 variable slot of a for loop, a u8 of flags (1 = the variable is
+#          a global, 2 = the loop has an explicit step) and the u32 PC of the jump
+OPERANDS = {
+  'PUSH': 'const',
+  'JMP': 'int', 'JMPZ': 'int', 'JSR': 'call', 'TAIL_JSR': 'call',
+  'JMPZ_LT_NUM': 'int', 'JMPZ_GT_NUM': 'int', 'JMPZ_LE_NUM': 'int', 'JMPZ_GE_NUM': 'int',
+  'LOAD_GLOBAL': 'int', 'STORE_GLOBAL': 'int', 'LOAD_LOCAL': 'int', 'STORE_LOCAL': 'int', 'POPN': 'int',
+  'LOAD_LOCAL2': 'pair', 'LOAD_GLOBAL2': 'pair',
+  'ADD_NUM_CONST': 'number', 'SUB_NUM_CONST': 'number', 'MUL_NUM_CONST': 'number', 'DIV_NUM_CONST': 'number',
+  'INC_LOCAL': 'inc', 'INC_GLOBAL': 'inc',
+  'FOR_PREP': 'loop', 'FOR_LOOP': 'loop',
+}
+
+LOOP_GLOBAL = 1
+LOOP_STEP   = 2
+
+def source_hash(source):
+  return hashlib.sha256(source.encode('utf-8')).digest()
+
+class BytecodeWriter:
+  '''
+  Serializes an assembled program
+  '''
+  def __init__(self):
+    from vm import opcodes # <-- the VM imports this module to load programs
+    self.opcodes = opcodes
+    self.constants = []
+    self.constant_index = {}
+
+  def constant(self, value):
+    # The type is part of the key, so that 1.0, True and '1' are different constants
+    key = (value[0], value[1] if value[0] != TYPE_NUMBER else float(value[1]))
+    if key not in self.constant_index:
+      self.constant_index[key] = len(self.constants)
+      self.constants.append(key)
+    return self.constant_index[key]
+
+  def write_string(self, out, text):
+    data = text.encode('utf-8')
+    out.append(U32.pack(len(data)))
+    out.append(data)
+
+  def write(self, program, source):
+    stream = []
+    for opcode, *args in program.code:
+      stream.append(U8.pack(self.opcodes[opcode]))
+      kind = OPERANDS.get(opcode)
+      if kind == 'const':
+        stream.append(U32.pack(self.constant(args[0])))
+      elif kind == 'int':
+        stream.append(U32.pack(args[0]))
+      elif kind == 'number':
+        stream.append(U32.pack(self.constant((TYPE_NUMBER, args[0]))))
+      elif kind == 'pair':
+        stream.append(PAIR.pack(*args[0]))
+      elif kind == 'inc':
+        stream.append(PAIR.pack(args[0][0], self.constant((TYPE_NUMBER, args[0][1]))))
+      elif kind == 'call':
+        stream.append(PAIR.pack(*args))
+      elif kind == 'loop':
+        base, var, is_global, *has_step = args[0]
+        flags = (LOOP_GLOBAL if is_global else 0) | (LOOP_STEP if has_step and has_step[0] else 0)
+        stream.append(LOOP.pack(base, var, flags, args[1]))
+
+    out = [HEADER.pack(BYTECODE_MAGIC, BYTECODE_VERSION, 0, source_hash(source))]
+    out.append(U32.pack(len(self.constants)))
+    for valtype, value in self.constants:
+      if valtype == TYPE_NUMBER:
+        out.append(U8.pack(CONST_NUMBER) + F64.pack(value))
+      elif valtype == TYPE_STRING:
+        out.append(U8.pack(CONST_STRING))
+        self.write_string(out, value)
+      else:
+        out.append(U8.pack(CONST_BOOL) + U8.pack(value))
+    out.append(U32.pack(len(program.labels)))
+    for name, pc in program.labels.items():
+      self.write_string(out, name)
+      out.append(U32.pack(pc))
+    out.append(U32.pack(len(program.code)))
+    out.extend(stream)
+    out.append(U32.pack(len(program.lines)))
+    for pc, line in program.lines:
+      out.append(PAIR.pack(pc, line))
+    return b''.join(out)
+
+class BytecodeReader:
+  '''
+  Deserializes a program (the reverse of BytecodeWriter)
+  '''
+  def __init__(self, data):
+    from vm import OPCODE_NAMES # <-- the VM imports this module to load programs
+    self.opcode_names = OPCODE_NAMES
+    self.data = data
+    self.offset = 0
+
+  def unpack(self, fmt):
+    values = fmt.unpack_from(self.data, self.offset)
+    self.offset += fmt.size
+    return values if len(values) > 1 else values[0]
+
+  def read_string(self):
+    length = self.unpack(U32)
+    text = self.data[self.offset:self.offset + length].decode('utf-8')
+    self.offset += length
+    return text
+
+  def read_header(self):
+    '''
+    Returns the hash of the source code, or None if the data is not bytecode of this version
+    '''
+    if len(self.data) < HEADER.size:
+      return None
+    magic, version, _, digest = self.unpack(HEADER)
+    if magic != BYTECODE_MAGIC or version != BYTECODE_VERSION:
+      return None
+    return digest
+
+  def read(self):
+    '''
+    Returns the program, or None if the data is not bytecode of this version
+    '''
+    digest = self.read_header()
+    if digest is None:
+      return None
+
+    constants = []
+    for _ in range(self.unpack(U32)):
+      tag = self.unpack(U8)
+      if tag == CONST_NUMBER:
+        constants.append((TYPE_NUMBER, self.unpack(F64)))
+      elif tag == CONST_STRING:
+        constants.append((TYPE_STRING, self.read_string()))
+      else:
+        constants.append((TYPE_BOOL, bool(self.unpack(U8))))
+
+    labels = {}
+    for _ in range(self.unpack(U32)):
+      name = self.read_string()
+      labels[name] = self.unpack(U32)
+
+    code = []
+    for _ in range(self.unpack(U32)):
+      opcode = self.opcode_names[self.unpack(U8)]
+      kind = OPERANDS.get(opcode)
+      if kind == 'const':
+        code.append((opcode, constants[self.unpack(U32)]))
+      elif kind == 'int':
+        code.append((opcode, self.unpack(U32)))
+      elif kind == 'number':
+        code.append((opcode, constants[self.unpack(U32)][1]))
+      elif kind == 'pair':
+        code.append((opcode, self.unpack(PAIR)))
+      elif kind == 'inc':
+        slot, index = self.unpack(PAIR)
+        code.append((opcode, (slot, constants[index][1])))
+      elif kind == 'call':
+        code.append((opcode, *self.unpack(PAIR)))
+      elif kind == 'loop':
+        base, var, flags, target = self.unpack(LOOP)
+        operands = (base, var, bool(flags & LOOP_GLOBAL))
+        if opcode == 'FOR_PREP':
+          operands += (bool(flags & LOOP_STEP),)
+        code.append((opcode, operands, target))
+      else:
+        code.append((opcode,))
+
+    lines = [self.unpack(PAIR) for _ in range(self.unpack(U32))]
+    program = Program(code, labels, lines)
+    program.source_hash = digest
+    return program
+
+def write_bytecode(filename, program, source):
+  '''
+  Saves an assembled program (compiled from the given source code) to a bytecode file
+  '''
+  data = BytecodeWriter().write(program, source)
+  # Write to a temporary file first, so a concurrent reader never sees a partial file
+  temp = f'{filename}.{os.getpid()}.tmp'
+  with open(temp, 'wb') as file:
+    file.write(data)
+  os.replace(temp, filename)
+
+def read_bytecode(filename):
+  '''
+  Loads a program from a bytecode file (returns None if the file is not valid bytecode)
+  '''
+  with open(filename, 'rb') as file:
+    return BytecodeReader(file.read()).read()
+
+class BytecodeCache:
+  '''
+  A directory of bytecode files named after the hash of the source code they were compiled from
+  '''
+  def __init__(self, directory):
+    self.directory = directory
+
+  def path(self, source):
+    return os.path.join(self.directory, source_hash(source).hex() + '.pkc')
+
+  def load(self, source):
+    '''
+    Returns the cached program for the source code, or None if there is no valid cached bytecode
+    '''
+    try:
+      program = read_bytecode(self.path(source))
+    except (OSError, ValueError, IndexError, struct.error):
+      return None
+    if program is None or program.source_hash != source_hash(source):
+      return None
+    return program
+
+  def store(self, source, program):
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      write_bytecode(self.path(source), program, source)
+    except OSError:
+      pass # <-- the cache is only an optimization (e.g. the directory may be read-only)
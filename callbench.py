@@ -0,0 +1,76 @@
+# A call-heavy benchmark for the VM: recursive fib, recursive factorial and the dragon curve script.
+# It reports the best run time of each program (the front end is not timed).
+#
+#      python3 callbench.py
+#      python3 callbench.py --repeat 10
+import io
+import time
+import argparse
+import contextlib
+from lexer import *
+from parser import *
+from optimizer import *
+from compiler import *
+from peephole import *
+from assembler import *
+from vm import *
+
+FIB = '''
+func fib(n)
+  if n < 2 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+println fib(22)
+'''
+
+FACTORIAL = '''
+func factorial(n)
+  if n <= 1 then
+    ret 1
+  end
+  ret n * factorial(n - 1)
+end
+i := 0
+while i < 2000 do
+  factorial(20)
+  i := i + 1
+end
+println factorial(20)
+'''
+
+def load_script(filename):
+  with open(filename) as file:
+    return file.read()
+
+BENCHMARKS = [
+  ('fib(22)', lambda: FIB),
+  ('factorial(20) x 2000', lambda: FACTORIAL),
+  ('scripts/dragon.pinky', lambda: load_script('scripts/dragon.pinky')),
+]
+
+def compile_program(source):
+  tokens = Lexer(source).tokenize()
+  ast = Parser(tokens).parse()
+  ast = Optimizer().optimize(ast)
+  return Assembler().assemble(Peephole().optimize(Compiler().generate_code(ast)))
+
+def time_program(program, repeat):
+  best = None
+  for _ in range(repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+      start = time.perf_counter()
+      VM().run(program)
+      elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+if __name__ == '__main__':
+  argparser = argparse.ArgumentParser(description='Time call-heavy Pinky programs on the VM.')
+  argparser.add_argument('--repeat', type=int, default=5, help='number of timed runs (the best one is reported)')
+  args = argparser.parse_args()
+
+  for name, source in BENCHMARKS:
+    program = compile_program(source())
+    print(f'{name:<24}{time_program(program, args.repeat):>9.3f}s')
@@ -0,0 +1,487 @@
+from defs import *
+from utils import *
+from model import *
+from tokens import *
+from inference import *
+from resolver import *
+
+###############################################################################
+# The closure interpreter compiles the AST (only once) into a tree of nested Python closures,
+# one per node. Each closure receives the current frame and:
+#
+#   - for expressions, returns the value of the expression
+#   - for statements, returns None, or the value of a "ret" that must unwind to the caller
+#
+# The dispatch on the node type and on the operator is done at compile time, and operators whose
+# operand types are known statically (see inference.py) skip the runtime type checks.
+# Runtime values are unboxed: a Python float, str or bool (never None).
+#
+# Variables live in frames (Python lists) laid out by the resolver (see resolver.py): slot 0 of a
+# frame is the parent frame, and an unset slot holds None. Every name is looked up through its
+# candidate (depth, index) slots, so no names are hashed at runtime.
+###############################################################################
+
+# Arithmetic operators, specialised for operands that are known to be numbers
+NUMBER_OPS = {
+  TOK_PLUS:  lambda left, right: lambda frame: left(frame) + right(frame),
+  TOK_MINUS: lambda left, right: lambda frame: left(frame) - right(frame),
+  TOK_STAR:  lambda left, right: lambda frame: left(frame) * right(frame),
+  TOK_LT:    lambda left, right: lambda frame: left(frame) < right(frame),
+  TOK_GT:    lambda left, right: lambda frame: left(frame) > right(frame),
+  TOK_LE:    lambda left, right: lambda frame: left(frame) <= right(frame),
+  TOK_GE:    lambda left, right: lambda frame: left(frame) >= right(frame),
+  TOK_EQEQ:  lambda left, right: lambda frame: left(frame) == right(frame),
+  TOK_NE:    lambda left, right: lambda frame: left(frame) != right(frame),
+}
+
+# Same as above, when the right operand is a numeric literal
+NUMBER_CONST_OPS = {
+  TOK_PLUS:  lambda left, c: lambda frame: left(frame) + c,
+  TOK_MINUS: lambda left, c: lambda frame: left(frame) - c,
+  TOK_STAR:  lambda left, c: lambda frame: left(frame) * c,
+  TOK_LT:    lambda left, c: lambda frame: left(frame) < c,
+  TOK_GT:    lambda left, c: lambda frame: left(frame) > c,
+  TOK_LE:    lambda left, c: lambda frame: left(frame) <= c,
+  TOK_GE:    lambda left, c: lambda frame: left(frame) >= c,
+  TOK_EQEQ:  lambda left, c: lambda frame: left(frame) == c,
+  TOK_NE:    lambda left, c: lambda frame: left(frame) != c,
+}
+
+# Operators that are checked at runtime (the Python function applied to the values after the check)
+ARITHMETIC_OPS = {
+  TOK_MINUS: lambda a, b: a - b,
+  TOK_STAR:  lambda a, b: a * b,
+}
+
+COMPARISON_OPS = {
+  TOK_LT: lambda a, b: a < b,
+  TOK_GT: lambda a, b: a > b,
+  TOK_LE: lambda a, b: a <= b,
+  TOK_GE: lambda a, b: a >= b,
+}
+
+EQUALITY_OPS = {
+  TOK_EQEQ: lambda a, b: a == b,
+  TOK_NE:   lambda a, b: a != b,
+}
+
+def compile_load(candidates):
+  '''
+  Returns a function that reads the first set slot among the candidates of a frame (or None)
+  '''
+  if len(candidates) == 1:
+    depth, index = candidates[0]
+    if depth == 0:
+      return lambda frame: frame[index]
+    if depth == 1:
+      return lambda frame: frame[0][index]
+    if depth == 2:
+      return lambda frame: frame[0][0][index]
+  def load(frame):
+    current = 0
+    for depth, index in candidates:
+      while current < depth:
+        frame = frame[0]
+        current += 1
+      value = frame[index]
+      if value is not None:
+        return value
+    return None
+  return load
+
+def compile_store(candidates):
+  '''
+  Returns a function that writes a value to the first set slot among the candidates of a frame
+  (or to the first candidate, which is in the current scope, when none of them is set)
+  '''
+  if len(candidates) == 1:
+    # A single candidate is either in the current scope, or a variable that is known to be set
+    depth, index = candidates[0]
+    def store(frame, value):
+      for _ in range(depth):
+        frame = frame[0]
+      frame[index] = value
+    return store
+  def store(frame, value):
+    first = frame
+    current = 0
+    for depth, index in candidates:
+      while current < depth:
+        frame = frame[0]
+        current += 1
+      if frame[index] is not None:
+        frame[index] = value
+        return
+    first[candidates[0][1]] = value
+  return store
+
+class ClosureInterpreter:
+  '''
+  A tree-walking interpreter that compiles every node into a closure before running the program.
+  It has the same semantics (and prints the same output and errors) as the reference Interpreter.
+  '''
+  def __init__(self, output=None):
+    self.output = Output() if output is None else output # <-- the sink of print/println
+    self.types = TypeInference()
+    self.resolver = Resolver()
+
+  def new_frame(self, node):
+    '''
+    Returns a function that creates the frame of the scope of a block (or None if it needs no frame)
+    '''
+    size = self.resolver.scopes[id(node)].size
+    if size == 1:
+      return None
+    slots = [None] * (size - 1)
+    return lambda parent: [parent] + slots
+
+  def is_number(self, node):
+    return self.types.type_of(node) == TYPE_NUMBER
+
+  def compile_binop(self, node):
+    op = node.op.token_type
+    lexeme = node.op.lexeme
+    line = node.op.line
+    left = self.compile(node.left)
+    right = self.compile(node.right)
+
+    def unsupported(leftval, rightval):
+      runtime_error(f'Unsupported operator {lexeme!r} between {type_of(leftval)} and {type_of(rightval)}.', line)
+
+    if op == TOK_SLASH:
+      # The division by zero is reported before the types of the operands are checked
+      numeric = self.is_number(node.left) and self.is_number(node.right)
+      def divide(frame):
+        leftval = left(frame)
+        rightval = right(frame)
+        if rightval == 0:
+          runtime_error(f'Division by zero.', node.line)
+        if numeric or (type(leftval) is float and type(rightval) is float):
+          return leftval / rightval
+        unsupported(leftval, rightval)
+      return divide
+
+    if op == TOK_MOD:
+      # Like the division, the modulo by zero is reported before the types of the operands are checked
+      numeric = self.is_number(node.left) and self.is_number(node.right)
+      def modulo(frame):
+        leftval = left(frame)
+        rightval = right(frame)
+        if rightval == 0:
+          runtime_error(f'Division by zero.', node.line)
+        if numeric or (type(leftval) is float and type(rightval) is float):
+          return leftval % rightval
+        unsupported(leftval, rightval)
+      return modulo
+
+    if op == TOK_CARET:
+      # A power can overflow (e.g. 10 ^ 400), or divide by zero (0 ^ -1)
+      numeric = self.is_number(node.left) and self.is_number(node.right)
+      def power(frame):
+        leftval = left(frame)
+        rightval = right(frame)
+        if numeric or (type(leftval) is float and type(rightval) is float):
+          try:
+            return leftval ** rightval
+          except ArithmeticError as exception:
+            runtime_error(arithmetic_error_message(exception), node.line)
+        unsupported(leftval, rightval)
+      return power
+
+    if self.is_number(node.left) and self.is_number(node.right):
+      if isinstance(node.right, (Integer, Float)) and op in NUMBER_CONST_OPS:
+        return NUMBER_CONST_OPS[op](left, float(node.right.value))
+      return NUMBER_OPS[op](left, right)
+
+    if op == TOK_PLUS:
+      def add(frame):
+        leftval = left(frame)
+        rightval = right(frame)
+        if type(leftval) is float and type(rightval) is float:
+          return leftval + rightval
+        if type(leftval) is str or type(rightval) is str:
+          return stringify(leftval) + stringify(rightval)
+        unsupported(leftval, rightval)
+      return add
+
+    elif op in ARITHMETIC_OPS:
+      func = ARITHMETIC_OPS[op]
+      def arithmetic(frame):
+        leftval = left(frame)
+        rightval = right(frame)
+        if type(leftval) is float and type(rightval) is float:
+          return func(leftval, rightval)
+        unsupported(leftval, rightval)
+      return arithmetic
+
+    elif op in COMPARISON_OPS:
+      func = COMPARISON_OPS[op]
+      def compare(frame):
+        leftval = left(frame)
+        rightval = right(frame)
+        if type(leftval) is type(rightval) and type(leftval) is not bool:
+          return func(leftval, rightval)
+        unsupported(leftval, rightval)
+      return compare
+
+    else:
+      func = EQUALITY_OPS[op]
+      def equal(frame):
+        leftval = left(frame)
+        rightval = right(frame)
+        if type(leftval) is type(rightval):
+          return func(leftval, rightval)
+        unsupported(leftval, rightval)
+      return equal
+
+  def compile_unop(self, node):
+    op = node.op.token_type
+    lexeme = node.op.lexeme
+    line = node.op.line
+    operand = self.compile(node.operand)
+
+    if op == TOK_MINUS and self.is_number(node.operand):
+      return lambda frame: -operand(frame)
+
+    def unop(frame):
+      value = operand(frame)
+      if op == TOK_MINUS and type(value) is float:
+        return -value
+      if op == TOK_PLUS and type(value) is float:
+        return value
+      if op == TOK_NOT and type(value) is bool:
+        return not value
+      runtime_error(f'Unsupported operator {lexeme!r} with {type_of(value)}.', line)
+    return unop
+
+  def compile_block(self, node):
+    stmts = [self.compile(stmt) for stmt in node.stmts]
+    if len(stmts) == 1:
+      return stmts[0]
+    def block(frame):
+      for stmt in stmts:
+        result = stmt(frame)
+        if result is not None:
+          return result # <-- a "ret" is unwinding to the caller
+    return block
+
+  def compile_print(self, node):
+    end = node.end
+    write = self.output.write
+    if isinstance(node.value, String):
+      text = node.value.value + end
+      def print_literal(frame):
+        write(text)
+      return print_literal
+    value = self.compile(node.value)
+    def print_stmt(frame):
+      write(stringify(value(frame)) + end)
+    return print_stmt
+
+  def compile_if(self, node):
+    test = self.compile(node.test)
+    then_stmts = self.compile(node.then_stmts)
+    then_frame = self.new_frame(node.then_stmts)
+    else_stmts = self.compile(node.else_stmts) if node.else_stmts else None
+    else_frame = self.new_frame(node.else_stmts) if node.else_stmts else None
+    def if_stmt(frame):
+      testval = test(frame)
+      if type(testval) is not bool:
+        runtime_error("Condition test is not a boolean expression.", node.line)
+      if testval:
+        return then_stmts(frame if then_frame is None else then_frame(frame)) # A new child scope for the then-block
+      elif else_stmts is not None:
+        return else_stmts(frame if else_frame is None else else_frame(frame)) # A new child scope for the else-block
+    return if_stmt
+
+  def compile_while(self, node):
+    test = self.compile(node.test)
+    body = self.compile(node.body_stmts)
+    body_frame = self.new_frame(node.body_stmts)
+    def while_stmt(frame):
+      new_frame = frame if body_frame is None else body_frame(frame)
+      while True:
+        testval = test(frame)
+        if type(testval) is not bool:
+          runtime_error(f'While test is not a boolean expression.', node.line)
+        if not testval:
+          break
+        result = body(new_frame)
+        if result is not None:
+          return result
+    return while_stmt
+
+  def compile_for(self, node):
+    store = compile_store(self.resolver.slots[id(node)])
+    start = self.compile(node.start)
+    end = self.compile(node.end)
+    step = self.compile(node.step) if node.step is not None else None
+    body = self.compile(node.body_stmts)
+    body_frame = self.new_frame(node.body_stmts)
+    line = node.ident.line
+    def for_stmt(frame):
+      i = start(frame)
+      endval = end(frame)
+      stepval = None if step is None else step(frame)
+      if type(i) is not float or type(endval) is not float or (stepval is not None and type(stepval) is not float):
+        runtime_error(f'For loop start, end and step must be numbers.', line)
+      block_frame = frame if body_frame is None else body_frame(frame)
+      if i < endval:
+        if stepval is None:
+          stepval = 1
+        while i <= endval:
+          store(frame, i)
+          result = body(block_frame)
+          if result is not None:
+            return result
+          i = i + stepval
+      else:
+        if stepval is None:
+          stepval = -1
+        while i >= endval:
+          store(frame, i)
+          result = body(block_frame)
+          if result is not None:
+            return result
+          i = i + stepval
+    return for_stmt
+
+  def compile_func_decl(self, node):
+    [(_, index)] = self.resolver.slots[id(node)]
+    params = [self.resolver.slots[id(param)][0][1] for param in node.params]
+    size = self.resolver.scopes[id(node.body_stmts)].size
+    function = (node.name, params, self.compile(node.body_stmts), size)
+    def func_decl(frame):
+      frame[index] = (function, frame) # we also store the frame in which the function was declared
+    return func_decl
+
+  def compile_func_call(self, node):
+    name = node.name
+    load = compile_load(self.resolver.slots[id(node)])
+    args = [self.compile(arg) for arg in node.args]
+    def func_call(frame):
+      func = load(frame)
+      if func is None:
+        runtime_error(f'Function {name!r} not declared.', node.line)
+      (func_name, params, body, size), func_frame = func
+      if len(args) != len(params):
+        runtime_error(f'Function {func_name!r} expected {len(params)} params but {len(args)} args were passed.', node.line)
+      if size == 1:
+        new_frame = func_frame
+      else:
+        new_frame = [None] * size
+        new_frame[0] = func_frame
+        for index, arg in zip(params, args):
+          new_frame[index] = arg(frame)
+      try:
+        result = body(new_frame)
+      except RecursionError:
+        # Every call nests several Python calls, so deep recursion overflows the Python stack
+        runtime_error(f'Maximum recursion depth exceeded.', node.line)
+      return 0.0 if result is None else result # <-- implicit return value
+    return func_call
+
+  def compile(self, node):
+    '''
+    Returns the closure that executes a node
+    '''
+    if isinstance(node, (Integer, Float)):
+      value = float(node.value)
+      return lambda frame: value
+
+    elif isinstance(node, String):
+      value = str(node.value)
+      return lambda frame: value
+
+    elif isinstance(node, Bool):
+      value = node.value
+      return lambda frame: value
+
+    elif isinstance(node, Grouping):
+      return self.compile(node.value)
+
+    elif isinstance(node, Identifier):
+      name = node.name
+      candidates = self.resolver.slots[id(node)]
+      if len(candidates) == 1 and candidates[0][0] == 0:
+        index = candidates[0][1]
+        def local_identifier(frame):
+          value = frame[index]
+          if value is None:
+            runtime_error(f'Undeclared identifier {name!r}', node.line)
+          return value
+        return local_identifier
+      load = compile_load(candidates)
+      def identifier(frame):
+        value = load(frame)
+        if value is None:
+          runtime_error(f'Undeclared identifier {name!r}', node.line)
+        return value
+      return identifier
+
+    elif isinstance(node, (Assignment, LocalAssignment)):
+      candidates = self.resolver.slots[id(node)]
+      right = self.compile(node.right)
+      if len(candidates) == 1 and candidates[0][0] == 0:
+        index = candidates[0][1]
+        def local_assignment(frame):
+          frame[index] = right(frame)
+        return local_assignment
+      store = compile_store(candidates)
+      def assignment(frame):
+        store(frame, right(frame))
+      return assignment
+
+    elif isinstance(node, BinOp):
+      return self.compile_binop(node)
+
+    elif isinstance(node, UnOp):
+      return self.compile_unop(node)
+
+    elif isinstance(node, LogicalOp):
+      left = self.compile(node.left)
+      right = self.compile(node.right)
+      if node.op.token_type == TOK_OR:
+        return lambda frame: left(frame) or right(frame)
+      else:
+        return lambda frame: left(frame) and right(frame)
+
+    elif isinstance(node, Stmts):
+      return self.compile_block(node)
+
+    elif isinstance(node, PrintStmt):
+      return self.compile_print(node)
+
+    elif isinstance(node, IfStmt):
+      return self.compile_if(node)
+
+    elif isinstance(node, WhileStmt):
+      return self.compile_while(node)
+
+    elif isinstance(node, ForStmt):
+      return self.compile_for(node)
+
+    elif isinstance(node, FuncDecl):
+      return self.compile_func_decl(node)
+
+    elif isinstance(node, FuncCall):
+      return self.compile_func_call(node)
+
+    elif isinstance(node, FuncCallStmt):
+      expr = self.compile(node.expr)
+      def func_call_stmt(frame):
+        expr(frame) # <-- the value is discarded (a statement never returns it)
+      return func_call_stmt
+
+    elif isinstance(node, RetStmt):
+      return self.compile(node.value)
+
+  def interpret_ast(self, node):
+    # Compile the whole program once, and run it in a brand new global frame
+    self.types.infer(node)
+    self.resolver.resolve_program(node)
+    program = self.compile(node)
+    try:
+      program([None] * self.resolver.scopes[id(node)].size)
+    finally:
+      self.output.flush()
@@ -2,6 +2,9 @@ from defs import *
 from model import *
 from tokens import *
 from utils import *
+from inference import *
+from assembler import *
+from bytecode import *
 
 SYM_VAR  = 'SYM_VAR'
 SYM_FUNC = 'SYM_FUNC'
@@ -14,13 +17,16 @@ class Symbol:
     self.arity = arity
 
 class Compiler:
-  def __init__(self):
+  def __init__(self, inputs=()):
     self.code = []
     self.locals = []
-    self.globals = []
+    self.globals = [Symbol(name, symtype=SYM_VAR, depth=0) for name in inputs] # <-- input variables set by the host take the first global slots
+    self.inputs = list(inputs)
     self.functions = []
     self.scope_depth = 0
+    self.function_depth = 0
     self.label_counter = 0
+    self.types = TypeInference()
 
   def make_label(self):
     self.label_counter += 1
@@ -46,6 +52,28 @@ class Compiler:
         return (symbol, index)
     return None
 
+  def tail_call(self, node):
+    '''
+    Returns the function call of a "ret f(...)" statement inside a function (or None)
+    '''
+    value = node.value
+    while isinstance(value, Grouping):
+      value = value.value
+    if isinstance(value, FuncCall) and self.function_depth > 0:
+      return value
+    return None
+
+  def compile_call(self, node, jump='JSR'):
+    func = self.get_func_symbol(node.name)
+    if not func:
+      compile_error(f'Not found declaration for function {node.name}', node.line)
+    if func.arity != len(node.args):
+      compile_error(f'Function expected {func.arity} params but {len(node.args)} args were passed', node.line)
+    # Evaluate all args
+    for arg in node.args:
+      self.compile(arg)
+    self.emit((jump, len(node.args), node.name))
+
   def begin_block(self):
     self.scope_depth += 1
 
@@ -78,26 +106,28 @@ class Compiler:
     elif isinstance(node, BinOp):
       self.compile(node.left)
       self.compile(node.right)
+      # When both operands are statically known to be numbers we emit the specialised opcodes that skip the runtime type checks
+      numeric = self.types.type_of(node.left) == TYPE_NUMBER and self.types.type_of(node.right) == TYPE_NUMBER
       if node.op.token_type == TOK_PLUS:
-        self.emit(('ADD',))
+        self.emit(('ADD_NUM',) if numeric else ('ADD',))
       elif node.op.token_type == TOK_MINUS:
-        self.emit(('SUB',))
+        self.emit(('SUB_NUM',) if numeric else ('SUB',))
       elif node.op.token_type == TOK_STAR:
-        self.emit(('MUL',))
+        self.emit(('MUL_NUM',) if numeric else ('MUL',))
       elif node.op.token_type == TOK_SLASH:
-        self.emit(('DIV',))
+        self.emit(('DIV_NUM',) if numeric else ('DIV',))
       elif node.op.token_type == TOK_CARET:
         self.emit(('EXP',))
       elif node.op.token_type == TOK_MOD:
-        self.emit(('MOD',))
+        self.emit(('MOD_NUM',) if numeric else ('MOD',))
       elif node.op.token_type == TOK_LT:
-        self.emit(('LT',))
+        self.emit(('LT_NUM',) if numeric else ('LT',))
       elif node.op.token_type == TOK_GT:
-        self.emit(('GT',))
+        self.emit(('GT_NUM',) if numeric else ('GT',))
       elif node.op.token_type == TOK_LE:
-        self.emit(('LE',))
+        self.emit(('LE_NUM',) if numeric else ('LE',))
       elif node.op.token_type == TOK_GE:
-        self.emit(('GE',))
+        self.emit(('GE_NUM',) if numeric else ('GE',))
       elif node.op.token_type == TOK_EQEQ:
         self.emit(('EQ',))
       elif node.op.token_type == TOK_NE:
@@ -161,8 +191,49 @@ class Compiler:
       self.emit(('JMP', test_label))
       self.emit(('LABEL', exit_label))
 
+    elif isinstance(node, ForStmt):
+      # The loop variable is assigned in the scope of the for statement (like the interpreter does)
+      symbol = self.get_var_symbol(node.ident.name)
+      if not symbol:
+        new_symbol = Symbol(node.ident.name, symtype=SYM_VAR, depth=self.scope_depth)
+        if self.scope_depth == 0:
+          self.globals.append(new_symbol)
+          symbol = (new_symbol, len(self.globals) - 1)
+        else:
+          self.emit(('PUSH', (TYPE_NUMBER, 0))) # <-- the slot is set to the start value when the loop begins
+          self.locals.append(new_symbol)
+          self.emit(('SET_SLOT', str(len(self.locals) - 1) + f" ({new_symbol.name})"))
+          symbol = (new_symbol, len(self.locals) - 1)
+      sym, var_slot = symbol
+      is_global = sym.depth == 0
+
+      # The counter, end value, step and direction of the loop live in four hidden local slots
+      self.begin_block()
+      base = len(self.locals)
+      hidden = [(node.start, 'start'), (node.end, 'end'), (node.step, 'step'), (None, 'up')]
+      for expr, name in hidden:
+        if expr is None:
+          self.emit(('PUSH', (TYPE_BOOL, True) if name == 'up' else (TYPE_NUMBER, 0)))
+        else:
+          self.compile(expr)
+        self.locals.append(Symbol(f'for:{name}', symtype=SYM_VAR, depth=self.scope_depth))
+        self.emit(('SET_SLOT', str(len(self.locals) - 1) + f" (for:{name})"))
+
+      body_label = self.make_label()
+      exit_label = self.make_label()
+      self.emit(('FOR_PREP', (base, var_slot, is_global, node.step is not None), exit_label))
+      self.emit(('LABEL', body_label))
+      self.begin_block()
+      self.compile(node.body_stmts)
+      self.end_block()
+      self.emit(('FOR_LOOP', (base, var_slot, is_global), body_label))
+      self.emit(('LABEL', exit_label))
+      self.end_block()
+
     elif isinstance(node, Stmts):
       for stmt in node.stmts:
+        # Record the source line of each statement (the assembler collects these into a line table)
+        self.emit(('LINE', statement_line(stmt)))
         self.compile(stmt)
 
     elif isinstance(node, Assignment):
@@ -214,7 +285,12 @@ class Compiler:
       end_label = self.make_label()
       self.emit(('JMP', end_label))
       self.emit(('LABEL', new_func.name))
+      # The frame of the function starts at its params, so its local slots are numbered from zero
+      # (the locals of the enclosing blocks, like the hidden slots of a for loop, are not in it)
+      outer_locals = self.locals
+      self.locals = []
       self.begin_block()
+      self.function_depth += 1
       # Set params as local variables
       for param in node.params:
         new_symbol = Symbol(name=param.name, symtype=SYM_VAR, depth=self.scope_depth)
@@ -222,26 +298,27 @@ class Compiler:
         self.emit(('SET_SLOT', str(len(self.locals) - 1) + " (" + str(new_symbol.name) + ")"))
       self.compile(node.body_stmts)
       self.end_block()
+      self.function_depth -= 1
+      self.locals = outer_locals
       self.emit(('PUSH', (TYPE_NUMBER, 0)))
       self.emit(('RTS',))
       self.emit(('LABEL', end_label))
 
     elif isinstance(node, FuncCall):
-      func = self.get_func_symbol(node.name)
-      if not func:
-        compile_error(f'Not found declaration for function {node.name}', node.line)
-      if func.arity != len(node.args):
-        compile_error(f'Function expected {func.arity} params but {len(node.args)} args were passed', node.line)
-      # Evaluate all args
-      for arg in node.args:
-        self.compile(arg)
-      numargs = (TYPE_NUMBER, len(node.args))
-      self.emit(('PUSH', numargs))
-      self.emit(('JSR', node.name))
+      self.compile_call(node)
 
     elif isinstance(node, RetStmt):
-      self.compile(node.value)
-      self.emit(('RTS',))
+      call = self.tail_call(node)
+      if call:
+        # A call in tail position reuses the frame of the current function (so no RTS is needed)
+        self.compile_call(call, jump='TAIL_JSR')
+      elif self.function_depth > 0:
+        self.compile(node.value)
+        self.emit(('RTS',))
+      else:
+        # A "ret" outside functions ends the program (like in the interpreters and the register VM)
+        self.compile(node.value)
+        self.emit(('HALT',))
 
     elif isinstance(node, FuncCallStmt):
       self.compile(node.expr)
@@ -250,6 +327,8 @@ class Compiler:
   def print_code(self):
     i = 0
     for instruction in self.code:
+      if instruction[0] == 'LINE':
+        continue
       if instruction[0] == 'LABEL':
         print(f'{i:08} {instruction[1]}:')
         i += 1
@@ -262,9 +341,23 @@ class Compiler:
         print(f'{i:08}     {instruction[0]}')
       elif len(instruction) == 2:
         print(f'{i:08}     {instruction[0]} {instruction[1]}')
+      else:
+        print(f'{i:08}     {instruction[0]} {" ".join(str(arg) for arg in instruction[1:])}')
       i += 1
 
+  def write_bytecode(self, filename, source, code=None):
+    '''
+    Assembles the generated code (or an optimized version of it) and saves it to a bytecode file
+    '''
+    program = Assembler().assemble(self.code if code is None else code)
+    write_bytecode(filename, program, source)
+    return program
+
   def generate_code(self, node):
+    self.types = TypeInference()
+    for name in self.inputs:
+      self.types.assign(name, TYPE_ANY) # <-- the host can set an input to a value of any type
+    self.types.infer(node)
     self.emit(('LABEL', 'START'))
     self.compile(node)
     self.emit(('HALT',))
@@ -4,3 +4,13 @@
 TYPE_NUMBER = 'TYPE_NUMBER'  # Default to 64-bit float
 TYPE_STRING = 'TYPE_STRING'  # String managed by the host language
 TYPE_BOOL   = 'TYPE_BOOL'    # true | false
+
+def type_of(value):
+  '''
+  Recovers the type tag of an unboxed runtime value (a Python float, str or bool)
+  '''
+  if type(value) is bool:
+    return TYPE_BOOL
+  if type(value) is str:
+    return TYPE_STRING
+  return TYPE_NUMBER
@@ -0,0 +1,148 @@
+import io
+from utils import *
+from defs import *
+from lexer import *
+from parser import *
+from optimizer import *
+from interpreter import *
+from compiler import *
+from peephole import *
+from assembler import *
+from vm import *
+
+###############################################################################
+# The engine is the API to embed Pinky in a Python program. A program is compiled once, and then
+# run any number of times, each time with fresh global variables:
+#
+#      engine = Engine()                                   # backend='vm' or 'interpreter'
+#      script = engine.compile(source, inputs=['n'])       # lexed, parsed and optimized once
+#      result = engine.run(script, {'n': 10})              # or engine.run(source, {'n': 10})
+#      result.output                                       # what the program printed
+#      result.globals                                      # {'n': 10.0, 'total': 55.0, ...}
+#
+# The inputs are global variables that the host sets before every run (numbers, strings or bools).
+# They must be named when the program is compiled, because the compiler resolves every variable to
+# a slot. The engine keeps the compiled scripts (by source and inputs), the assembled program of
+# every script, and one VM and one interpreter that are reused by every run, so running a program
+# again only costs its execution.
+#
+# The engine is quiet by default: the output of a run is captured in result.output. With
+# quiet=False (or an output passed to run), it goes to the standard output (or that output) instead.
+# Errors are raised as PinkyError exceptions (see utils.py), and the engine stays usable after them.
+###############################################################################
+
+BACKENDS = ('vm', 'interpreter')
+
+def box(value):
+  '''
+  Converts a Python value into a tagged (type, value) Pinky value
+  '''
+  if isinstance(value, bool):
+    return (TYPE_BOOL, value)
+  if isinstance(value, (int, float)):
+    return (TYPE_NUMBER, float(value))
+  if isinstance(value, str):
+    return (TYPE_STRING, value)
+  raise TypeError(f'Unsupported input value {value!r} (Pinky values are numbers, strings and bools).')
+
+class Script:
+  '''
+  A program compiled by an engine: its optimized AST, and its assembled code once it runs on the VM
+  '''
+  def __init__(self, source, inputs, ast):
+    self.source = source
+    self.inputs = inputs      # Names of the input variables, in the order of their global slots
+    self.ast = ast
+    self.program = None       # Assembled program (for the VM backend)
+    self.global_names = None  # Name of the global variable of every slot of the program
+
+class Result:
+  '''
+  The output printed by a run (None when it was not captured) and the global variables at its end
+  '''
+  def __init__(self, output, global_vars):
+    self.output = output
+    self.globals = global_vars
+
+  def __repr__(self):
+    return f'Result(output={self.output!r}, globals={self.globals!r})'
+
+class Engine:
+  def __init__(self, backend='vm', quiet=True, optimize=True):
+    if backend not in BACKENDS:
+      raise ValueError(f'Unknown backend {backend!r} (expected one of {", ".join(BACKENDS)}).')
+    self.backend = backend
+    self.quiet = quiet
+    self.optimize = optimize
+    self.scripts = {}            # (source, inputs) -> Script
+    self.vm = VM()               # The VM keeps the prepared code of the last program and its frame pool
+    self.interpreter = Interpreter()
+
+  def compile(self, source, inputs=()):
+    '''
+    Returns the script of a program with the given input variables (compiled on the first request)
+    '''
+    inputs = tuple(inputs)
+    script = self.scripts.get((source, inputs))
+    if script is None:
+      ast = Parser(Lexer(source).generate()).parse()
+      if self.optimize:
+        ast = Optimizer().optimize(ast)
+      script = self.scripts[(source, inputs)] = Script(source, inputs, ast)
+    return script
+
+  def assemble(self, script):
+    '''
+    Compiles and assembles the code of a script for the VM (once)
+    '''
+    if script.program is None:
+      compiler = Compiler(script.inputs)
+      code = compiler.generate_code(script.ast)
+      if self.optimize:
+        code = Peephole().optimize(code)
+      script.program = Assembler().assemble(code)
+      script.global_names = [symbol.name for symbol in compiler.globals]
+    return script.program
+
+  def run(self, script, inputs=None, output=None):
+    '''
+    Runs a script (or the source of a program) with fresh globals and the given input values, and
+    returns its Result
+    '''
+    inputs = inputs or {}
+    if isinstance(script, str):
+      script = self.compile(script, inputs.keys())
+    for name in script.inputs:
+      if name not in inputs:
+        raise ValueError(f'Missing value for the input {name!r}.')
+    for name in inputs:
+      if name not in script.inputs:
+        raise ValueError(f'{name!r} is not an input of the script (inputs: {", ".join(script.inputs) or "none"}).')
+    values = {name: box(value) for name, value in inputs.items()}
+
+    buffer = None
+    if output is None:
+      buffer = io.StringIO() if self.quiet else None
+      output = Output(buffer)
+    elif not isinstance(output, Output):
+      output = Output(output) # <-- any file-like object with write()
+
+    if self.backend == 'vm':
+      global_vars = self.run_vm(script, values, output)
+    else:
+      global_vars = self.run_interpreter(script, values, output)
+    return Result(buffer.getvalue() if buffer is not None else None, global_vars)
+
+  def run_vm(self, script, values, output):
+    program = self.assemble(script)
+    vm = self.vm
+    vm.output = output
+    vm.globals = {slot: unbox(values[name]) for slot, name in enumerate(script.inputs)}
+    vm.run(program)
+    return {name: vm.globals[slot] for slot, name in enumerate(script.global_names) if slot in vm.globals}
+
+  def run_interpreter(self, script, values, output):
+    interpreter = self.interpreter
+    interpreter.output = output
+    global_vars = interpreter.interpret_ast(script.ast, {name: values[name] for name in script.inputs})
+    return {name: value for name, (_, value) in global_vars.items()}
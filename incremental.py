@@ -0,0 +1,194 @@
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from model import *
+
+###############################################################################
+# The incremental front end keeps the source, the tokens and the AST of a program, and applies text
+# edits to them. An edit re-lexes and re-parses only the region of the top-level statements (and
+# function declarations) it touches:
+#
+#   - the region is a range of whole lines: the lines of the edit, extended to the lines of every
+#     top-level statement that shares a line with it
+#   - the statement before the region is re-parsed too when it does not end with "end", because
+#     the token after an expression statement decides where it ends (e.g. "x := 1" and "+ 2")
+#   - the region is parsed with the first token after it as lookahead, and it must end exactly
+#     at that token (otherwise its last statement continues past the region)
+#
+# The other statements are reused as they are (the same node objects); those after the region only
+# get their line numbers shifted when the edit adds or removes lines. Whenever the region cannot be
+# parsed on its own (an error, or a statement that does not end in the region), the whole source is
+# parsed again, so the result is always the same AST as a full parse.
+#
+# The lexer does not count the newlines inside a string, so once a string spans lines, the lines of
+# the tokens after it no longer match the lines of the source text. Sources with such strings are
+# always parsed in full.
+###############################################################################
+
+def is_multiline_string(token):
+  return token.token_type == TOK_STRING and '\n' in token.lexeme
+
+def shift_lines(node, delta):
+  '''
+  Adds delta to the line of a node and all the nodes inside it (the tokens are shifted separately)
+  '''
+  pending = [node]
+  while pending:
+    node = pending.pop()
+    if isinstance(node, list):
+      pending.extend(node)
+    elif isinstance(node, Node):
+      for cls in type(node).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+          if name == 'line':
+            node.line += delta
+          else:
+            pending.append(getattr(node, name))
+
+class IncrementalParser:
+  '''
+  The source, tokens and AST of a program, updated by edit() as the source is edited
+  '''
+  def __init__(self, source):
+    self.full_parse(source)
+
+  def full_parse(self, source):
+    '''
+    Lexes and parses the whole source, and records how many tokens each top-level statement takes
+    '''
+    # The source is the edited text even when it does not parse, but the tokens and the AST are only
+    # replaced once the parse succeeds, so until then the next edit parses the whole source again
+    self.source = source
+    self.complete = False
+    tokens = Lexer(source).tokenize()
+    parser = Parser(tokens)
+    stmts = []
+    counts = []
+    while not parser.is_at_end() and not parser.is_next(TOK_ELSE) and not parser.is_next(TOK_END):
+      start = parser.curr
+      stmts.append(parser.stmt())
+      counts.append(parser.curr - start)
+    self.tokens = tokens
+    self.counts = counts
+    self.ast = Stmts(stmts, line=parser.previous_token().line if parser.previous_token() is not None else 1)
+    # A program that stops at a stray "end" or "else" leaves tokens that are never parsed, and it is
+    # always parsed again from scratch (as are the sources with strings that span lines)
+    self.complete = parser.is_at_end() and not any(is_multiline_string(token) for token in tokens)
+    self.reparsed = len(stmts)
+
+  def line_offset(self, pos, lines):
+    '''
+    Returns the offset of the start of the line that is a number of lines above the one at pos
+    '''
+    for _ in range(lines):
+      pos = self.source.rfind('\n', 0, pos)
+    return self.source.rfind('\n', 0, pos) + 1
+
+  def line_end(self, pos, lines):
+    '''
+    Returns the offset of the end of the line that is a number of lines below the one at pos
+    '''
+    for _ in range(lines + 1):
+      pos = self.source.find('\n', pos)
+      if pos < 0:
+        return len(self.source)
+      pos += 1
+    return pos - 1
+
+  def edit(self, start, end, text):
+    '''
+    Replaces the source text between the offsets start and end with text, and returns the new AST
+    '''
+    source = self.source[:start] + text + self.source[end:]
+    if not self.complete or not self.counts:
+      self.full_parse(source)
+      return self.ast
+
+    # Token index where each top-level statement starts (plus the end of the tokens)
+    firsts = [0]
+    for count in self.counts:
+      firsts.append(firsts[-1] + count)
+    tokens = self.tokens
+    first_lines = [tokens[first].line for first in firsts[:-1]]
+    last_lines = [tokens[first - 1].line for first in firsts[1:]]
+
+    # Lines touched by the edit, and the statements that share a line with them
+    first_line = self.source.count('\n', 0, start) + 1
+    last_line = first_line + self.source.count('\n', start, end)
+    a, b = first_line, last_line
+    s0 = 0
+    while s0 < len(self.counts) and last_lines[s0] < a:
+      s0 += 1
+    if s0 > 0 and tokens[firsts[s0] - 1].token_type != TOK_END:
+      s0 -= 1 # <-- the statement before the region ends with an expression, so it is parsed again
+    s1 = s0
+    while s1 < len(self.counts) and first_lines[s1] <= b:
+      s1 += 1
+    if s1 > s0:
+      a = min(a, first_lines[s0])
+      b = max(b, max(last_lines[s0:s1]))
+      while s1 < len(self.counts) and first_lines[s1] <= b:
+        b = max(b, last_lines[s1])
+        s1 += 1
+    if s0 > 0 and last_lines[s0 - 1] >= a:
+      self.full_parse(source) # <-- the statement before the region ends on its first line
+      return self.ast
+
+    # Offsets of the region (whole lines) in the old source and in the new one
+    region_start = self.line_offset(start, first_line - a)
+    region_end = self.line_end(end, b - last_line)
+    delta = len(text) - (end - start)
+    new_region = source[region_start:region_end + delta]
+    line_delta = text.count('\n') - self.source.count('\n', start, end)
+
+    result = self.parse_region(new_region, a, tokens[firsts[s1]] if s1 < len(self.counts) else None)
+    if result is None:
+      self.full_parse(source)
+      return self.ast
+    region_tokens, region_stmts, region_counts = result
+
+    # Splice the region into the tokens and statements, and shift the lines of what comes after it
+    # (the region parsed, so nothing below can fail and leave the state half updated)
+    rest_tokens = tokens[firsts[s1]:]
+    rest_stmts = self.ast.stmts[s1:]
+    new_tokens = tokens[:firsts[s0]] + region_tokens + rest_tokens
+    new_counts = self.counts[:s0] + region_counts + self.counts[s1:]
+    new_stmts = self.ast.stmts[:s0] + region_stmts + rest_stmts
+    if line_delta:
+      for token in rest_tokens:
+        token.line += line_delta
+      shift_lines(rest_stmts, line_delta)
+    self.source = source
+    self.tokens = new_tokens
+    self.counts = new_counts
+    self.ast = Stmts(new_stmts, line=new_tokens[-1].line if new_tokens else 1)
+    self.reparsed = len(region_stmts)
+    return self.ast
+
+  def parse_region(self, region, line, lookahead):
+    '''
+    Lexes and parses the text of a region that starts at a line, with the token after the region as
+    lookahead. Returns its tokens, statements and token counts, or None if the region cannot be
+    parsed on its own.
+    '''
+    try:
+      lexer = Lexer(region)
+      lexer.line = line
+      tokens = lexer.tokenize()
+      if any(is_multiline_string(token) for token in tokens):
+        return None
+      parser = Parser(tokens + [lookahead] if lookahead is not None else tokens)
+      stmts = []
+      counts = []
+      while parser.curr < len(tokens):
+        if parser.is_next(TOK_ELSE) or parser.is_next(TOK_END):
+          return None
+        start = parser.curr
+        stmts.append(parser.stmt())
+        counts.append(parser.curr - start)
+    except PinkyError:
+      return None # <-- the error may not be an error of the whole program (or not the same one)
+    if parser.curr != len(tokens):
+      return None # <-- the last statement continued with the token after the region
+    return tokens, stmts, counts
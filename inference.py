@@ -0,0 +1,188 @@
+from defs import *
+from model import *
+from tokens import *
+
+###############################################################################
+# Static types used by the inference pass (on top of the runtime TYPE_* tags)
+###############################################################################
+TYPE_ANY = 'TYPE_ANY'  # The value can have different types at runtime
+
+def join(a, b):
+  '''
+  Combines two static types (None means that no value has been seen yet)
+  '''
+  if a is None:
+    return b
+  if b is None or a == b:
+    return a
+  return TYPE_ANY
+
+class TypeInference:
+  '''
+  A whole-program type inference pass over the AST.
+
+  Variables are tracked by name across every scope (so all variables with the same name share a
+  single type), the type of a function parameter is the join of the arguments of all calls to that
+  name (a nested declaration can reuse the name of a function, so a call can reach any of them),
+  and the return type of a function is the join of all its "ret" values plus a number (the
+  implicit return). The pass is repeated until no type changes, and the resulting types are sound:
+  an expression with a known type can only produce values of that type at runtime.
+  '''
+  def __init__(self):
+    self.var_types = {}   # Variable name -> static type
+    self.ret_types = {}   # Function name -> static return type
+    self.funcs = {}       # Function name -> list of the FuncDecl nodes with that name
+    self.types = {}       # id(expr node) -> static type of that expression
+    self.func_stack = []  # Names of the functions that enclose the node being visited
+    self.changed = False
+
+  def assign(self, name, valtype):
+    newtype = join(self.var_types.get(name), valtype)
+    if newtype != self.var_types.get(name):
+      self.var_types[name] = newtype
+      self.changed = True
+
+  def returns(self, name, valtype):
+    newtype = join(self.ret_types.get(name), valtype)
+    if newtype != self.ret_types.get(name):
+      self.ret_types[name] = newtype
+      self.changed = True
+
+  def visit(self, node):
+    if isinstance(node, (Integer, Float)):
+      valtype = TYPE_NUMBER
+
+    elif isinstance(node, String):
+      valtype = TYPE_STRING
+
+    elif isinstance(node, Bool):
+      valtype = TYPE_BOOL
+
+    elif isinstance(node, Grouping):
+      valtype = self.visit(node.value)
+
+    elif isinstance(node, Identifier):
+      valtype = self.var_types.get(node.name)
+
+    elif isinstance(node, BinOp):
+      lefttype = self.visit(node.left)
+      righttype = self.visit(node.right)
+      if node.op.token_type == TOK_PLUS:
+        if lefttype == TYPE_STRING or righttype == TYPE_STRING:
+          valtype = TYPE_STRING
+        elif lefttype is None or righttype is None:
+          valtype = None
+        elif lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+          valtype = TYPE_NUMBER
+        else:
+          valtype = TYPE_ANY
+      elif node.op.token_type in (TOK_MINUS, TOK_STAR, TOK_SLASH, TOK_MOD, TOK_CARET):
+        valtype = TYPE_NUMBER
+      else:
+        valtype = TYPE_BOOL
+
+    elif isinstance(node, UnOp):
+      operandtype = self.visit(node.operand)
+      if node.op.token_type == TOK_MINUS:
+        valtype = TYPE_NUMBER
+      elif node.op.token_type == TOK_NOT:
+        valtype = TYPE_BOOL
+      else:
+        valtype = operandtype
+
+    elif isinstance(node, LogicalOp):
+      valtype = join(self.visit(node.left), self.visit(node.right))
+
+    elif isinstance(node, FuncCall):
+      func_decls = self.funcs.get(node.name, [])
+      for i, arg in enumerate(node.args):
+        argtype = self.visit(arg)
+        for func_decl in func_decls: # <-- the call can reach any of the declarations with that name
+          if i < len(func_decl.params):
+            self.assign(func_decl.params[i].name, argtype)
+      valtype = self.ret_types.get(node.name) if func_decls else TYPE_ANY
+
+    elif isinstance(node, Stmts):
+      for stmt in node.stmts:
+        self.visit(stmt)
+      return None
+
+    elif isinstance(node, (Assignment, LocalAssignment)):
+      self.assign(node.left.name, self.visit(node.right))
+      return None
+
+    elif isinstance(node, PrintStmt):
+      self.visit(node.value)
+      return None
+
+    elif isinstance(node, IfStmt):
+      self.visit(node.test)
+      self.visit(node.then_stmts)
+      if node.else_stmts:
+        self.visit(node.else_stmts)
+      return None
+
+    elif isinstance(node, WhileStmt):
+      self.visit(node.test)
+      self.visit(node.body_stmts)
+      return None
+
+    elif isinstance(node, ForStmt):
+      self.assign(node.ident.name, join(self.visit(node.start), TYPE_NUMBER))
+      self.visit(node.end)
+      if node.step is not None:
+        self.visit(node.step)
+      self.visit(node.body_stmts)
+      return None
+
+    elif isinstance(node, FuncDecl):
+      self.returns(node.name, TYPE_NUMBER) # <-- the implicit return value at the end of the body
+      self.func_stack.append(node.name)
+      self.visit(node.body_stmts)
+      self.func_stack.pop()
+      return None
+
+    elif isinstance(node, RetStmt):
+      rettype = self.visit(node.value)
+      if self.func_stack:
+        self.returns(self.func_stack[-1], rettype)
+      return None
+
+    elif isinstance(node, FuncCallStmt):
+      self.visit(node.expr)
+      return None
+
+    else:
+      return None
+
+    self.types[id(node)] = valtype
+    return valtype
+
+  def collect_funcs(self, node):
+    if isinstance(node, Stmts):
+      for stmt in node.stmts:
+        self.collect_funcs(stmt)
+    elif isinstance(node, FuncDecl):
+      self.funcs.setdefault(node.name, []).append(node)
+      self.collect_funcs(node.body_stmts)
+    elif isinstance(node, IfStmt):
+      self.collect_funcs(node.then_stmts)
+      if node.else_stmts:
+        self.collect_funcs(node.else_stmts)
+    elif isinstance(node, (WhileStmt, ForStmt)):
+      self.collect_funcs(node.body_stmts)
+
+  def infer(self, node):
+    self.collect_funcs(node)
+    self.changed = True
+    while self.changed:
+      self.changed = False
+      self.visit(node)
+    return self
+
+  def type_of(self, node):
+    '''
+    Returns the static type of an expression (TYPE_NUMBER, TYPE_STRING, TYPE_BOOL or TYPE_ANY)
+    '''
+    valtype = self.types.get(id(node))
+    return TYPE_ANY if valtype is None else valtype
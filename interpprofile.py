@@ -0,0 +1,142 @@
+import json
+import time
+from utils import *
+from model import *
+from interpreter import *
+
+###############################################################################
+# The interpreter profiler is an Interpreter that times every statement and every function call it
+# runs (a deterministic profiler, with perf_counter). It collects:
+#
+#   - for every source line: the number of statements executed on it, their self time (without the
+#     nested statements, e.g. the body of a loop or of the functions it calls) and their total time
+#   - for every function (FuncDecl name): the number of calls, the self time (without the functions
+#     it calls) and the total time of the calls (recursive calls are only counted once in the total)
+#
+# The code outside functions is the function MAIN_FUNCTION. A tail call ends the call of the function
+# that makes it, and starts a new call of the function being called. The plain Interpreter is not
+# slowed down at all: the timing only happens in this subclass.
+#
+#      python3 pinky.py -q --interpret --profile scripts/dragon.pinky
+#      python3 pinky.py -q --interpret --profile --sort total --profile-json dragon.json scripts/dragon.pinky
+###############################################################################
+
+MAIN_FUNCTION = '<main>'
+
+SORT_KEYS = ['self', 'total', 'count']
+
+class InterpreterProfiler(Interpreter):
+  def __init__(self, output=None, source=None):
+    super().__init__(output)
+    self.source_lines = source.split('\n') if source is not None else []
+    self.line_stats = {}     # <-- line: [function, count, self time, total time]
+    self.function_stats = {} # <-- name: [calls, self time, total time]
+    self.line_stack = []     # <-- [line, start time, time of the nested statements]
+    self.function_stack = [] # <-- [name, start time, time of the nested calls]
+    self.active_lines = {}
+    self.active_functions = {}
+
+  def enter(self, stack, active, key):
+    active[key] = active.get(key, 0) + 1
+    stack.append([key, time.perf_counter(), 0.0])
+
+  def leave(self, stack, active, stats):
+    '''
+    Ends the innermost entry of a stack, and adds its times to the stats of its key
+    '''
+    key, start, nested = stack.pop()
+    elapsed = time.perf_counter() - start
+    entry = stats[key]
+    entry[-2] += elapsed - nested
+    active[key] -= 1
+    if not active[key]:
+      entry[-1] += elapsed # <-- only the outermost of the recursive activations counts in the total
+    if stack:
+      stack[-1][2] += elapsed
+
+  def interpret(self, node, frame):
+    if not isinstance(node, Stmt):
+      return Interpreter.interpret(self, node, frame)
+    line = statement_line(node)
+    entry = self.line_stats.get(line)
+    if entry is None:
+      entry = self.line_stats[line] = [self.function_stack[-1][0], 0, 0.0, 0.0]
+    entry[1] += 1
+    self.enter(self.line_stack, self.active_lines, line)
+    try:
+      return Interpreter.interpret(self, node, frame)
+    finally:
+      self.leave(self.line_stack, self.active_lines, self.line_stats)
+
+  def run_function(self, func_decl, func_frame, args):
+    entry = self.function_stats.get(func_decl.name)
+    if entry is None:
+      entry = self.function_stats[func_decl.name] = [0, 0.0, 0.0]
+    entry[0] += 1
+    self.enter(self.function_stack, self.active_functions, func_decl.name)
+    try:
+      return Interpreter.run_function(self, func_decl, func_frame, args)
+    finally:
+      self.leave(self.function_stack, self.active_functions, self.function_stats)
+
+  def interpret_ast(self, node, inputs=None):
+    self.function_stats[MAIN_FUNCTION] = [1, 0.0, 0.0]
+    self.enter(self.function_stack, self.active_functions, MAIN_FUNCTION)
+    try:
+      return Interpreter.interpret_ast(self, node, inputs)
+    finally:
+      self.leave(self.function_stack, self.active_functions, self.function_stats)
+
+  def total_time(self):
+    return self.function_stats[MAIN_FUNCTION][2] if MAIN_FUNCTION in self.function_stats else 0.0
+
+  def functions(self, sort='self'):
+    '''
+    Returns (name, calls, self time, total time) for every function that was called
+    '''
+    rows = [(name, calls, self_time, total_time) for name, (calls, self_time, total_time) in self.function_stats.items()]
+    index = {'self': 2, 'total': 3, 'count': 1}[sort]
+    return sorted(rows, key=lambda row: (-row[index], row[0]))
+
+  def lines(self, sort='self'):
+    '''
+    Returns (line, function, count, self time, total time) for every line with executed statements
+    '''
+    rows = [(line, function, count, self_time, total_time) for line, (function, count, self_time, total_time) in self.line_stats.items()]
+    index = {'self': 3, 'total': 4, 'count': 2}[sort]
+    return sorted(rows, key=lambda row: (-row[index], row[0]))
+
+  def source_line(self, line):
+    return self.source_lines[line - 1].strip() if 0 < line <= len(self.source_lines) else ''
+
+  def report(self, sort='self', limit=15, file=None):
+    '''
+    Prints the flat report of the functions and of the source lines, sorted by self time, total time or count
+    '''
+    total_time = self.total_time() or 1.0
+    print(f'{Colors.MAGENTA}{"function":<20}{"calls":>10}{"self":>11}{"%":>8}{"total":>11}{"%":>8}{Colors.WHITE}', file=file)
+    for name, calls, self_time, func_time in self.functions(sort)[:limit]:
+      print(f'{name:<20}{calls:>10}{self_time:>10.4f}s{100 * self_time / total_time:>7.1f}%'
+            f'{func_time:>10.4f}s{100 * func_time / total_time:>7.1f}%', file=file)
+    print(file=file)
+    print(f'{Colors.MAGENTA}{"line":>6}  {"function":<20}{"count":>10}{"self":>11}{"%":>8}{"total":>11}{"%":>8}  source{Colors.WHITE}', file=file)
+    for line, function, count, self_time, line_time in self.lines(sort)[:limit]:
+      print(f'{line:>6}  {function:<20}{count:>10}{self_time:>10.4f}s{100 * self_time / total_time:>7.1f}%'
+            f'{line_time:>10.4f}s{100 * line_time / total_time:>7.1f}%  {self.source_line(line)[:40]}', file=file)
+
+  def to_json(self, sort='self'):
+    return {
+      'total_time': self.total_time(),
+      'functions': [
+        {'name': name, 'calls': calls, 'self_time': self_time, 'total_time': total_time}
+        for name, calls, self_time, total_time in self.functions(sort)
+      ],
+      'lines': [
+        {'line': line, 'function': function, 'count': count, 'self_time': self_time, 'total_time': total_time, 'source': self.source_line(line)}
+        for line, function, count, self_time, total_time in self.lines(sort)
+      ],
+    }
+
+  def save_json(self, filename, sort='self'):
+    with open(filename, 'w') as file:
+      json.dump(self.to_json(sort), file, indent=2)
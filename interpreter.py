@@ -2,11 +2,40 @@ from defs import *
 from utils import *
 from model import *
 from tokens import *
-from state import *
-import codecs
+from resolver import *
+
+# Interpreting a statement returns None, or one of these status values when a "ret" statement must
+# unwind the statements up to the function call. The value being returned (or the prepared call of
+# a tail call) is kept in the interpreter, so returning from a function never raises an exception.
+STATUS_RETURN    = 'STATUS_RETURN'
+STATUS_TAIL_CALL = 'STATUS_TAIL_CALL'
 
 class Interpreter:
-  def interpret(self, node, env):
+  '''
+  The reference tree-walking interpreter. Variables and functions live in frames laid out by the
+  resolver (see resolver.py): a Python list per scope, with the parent frame in slot 0, and every
+  name is read and written through the (depth, index) candidate slots resolved for its node.
+  '''
+  def __init__(self, output=None):
+    self.output = Output() if output is None else output # <-- the sink of print/println
+    self.resolver = None
+    self.program = None # <-- the AST (and the input names) that the resolver was run on
+    self.return_value = None
+    self.tail_call = None
+    self.function_depth = 0 # <-- only a "ret" inside a function body can make a tail call
+
+  def new_frame(self, node, frame):
+    '''
+    Returns the frame of the scope of a block (or the current frame if the scope has no slots)
+    '''
+    size = self.resolver.scopes[id(node)].size
+    if size == 1:
+      return frame
+    new_frame = [None] * size
+    new_frame[0] = frame
+    return new_frame
+
+  def interpret(self, node, frame):
     if isinstance(node, Integer):
       return (TYPE_NUMBER, float(node.value))
 
@@ -20,10 +49,10 @@ class Interpreter:
       return (TYPE_BOOL, node.value)
 
     elif isinstance(node, Grouping):
-      return self.interpret(node.value, env)
+      return self.interpret(node.value, frame)
 
     elif isinstance(node, Identifier):
-      value = env.get_var(node.name)
+      value = load_slot(frame, self.resolver.slots[id(node)])
       if value is None:
         runtime_error(f'Undeclared identifier {node.name!r}', node.line)
       if value[1] is None:
@@ -32,19 +61,20 @@ class Interpreter:
 
     elif isinstance(node, Assignment):
       # Evaluate the right-hand side expression
-      righttype, rightval = self.interpret(node.right, env)
+      righttype, rightval = self.interpret(node.right, frame)
       # Update the value of the variable or create a new one
-      env.set_var(node.left.name, (righttype, rightval))
+      store_slot(frame, self.resolver.slots[id(node)], (righttype, rightval))
 
     elif isinstance(node, LocalAssignment):
       # Evaluate the right-hand side expression
-      righttype, rightval = self.interpret(node.right, env)
-      # Always create a new variable in the current scope/environment
-      env.set_local(node.left.name, (righttype, rightval))
+      righttype, rightval = self.interpret(node.right, frame)
+      # Always create a new variable in the current scope (its only candidate slot)
+      [(_, index)] = self.resolver.slots[id(node)]
+      frame[index] = (righttype, rightval)
 
     elif isinstance(node, BinOp):
-      lefttype, leftval  = self.interpret(node.left, env)
-      righttype, rightval = self.interpret(node.right, env)
+      lefttype, leftval  = self.interpret(node.left, frame)
+      righttype, rightval = self.interpret(node.right, frame)
       if node.op.token_type == TOK_PLUS:
         if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
           return (TYPE_NUMBER, leftval + rightval)
@@ -74,6 +104,8 @@ class Interpreter:
           runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
 
       elif node.op.token_type == TOK_MOD:
+        if rightval == 0:
+          runtime_error(f'Division by zero.', node.line)
         if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
           return (TYPE_NUMBER, leftval % rightval)
         else:
@@ -81,7 +113,10 @@ class Interpreter:
 
       elif node.op.token_type == TOK_CARET:
         if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, leftval ** rightval)
+          try:
+            return (TYPE_NUMBER, leftval ** rightval)
+          except ArithmeticError as exception: # <-- e.g. 10 ^ 400 overflows, and 0 ^ -1 divides by zero
+            runtime_error(arithmetic_error_message(exception), node.line)
         else:
           runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
 
@@ -122,7 +157,7 @@ class Interpreter:
           runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
 
     elif isinstance(node, UnOp):
-      operandtype, operandval = self.interpret(node.operand, env)
+      operandtype, operandval = self.interpret(node.operand, frame)
       if node.op.token_type == TOK_MINUS:
         if operandtype == TYPE_NUMBER:
           return (TYPE_NUMBER, -operandval)
@@ -142,116 +177,176 @@ class Interpreter:
           runtime_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
 
     elif isinstance(node, LogicalOp):
-      lefttype, leftval = self.interpret(node.left, env)
+      lefttype, leftval = self.interpret(node.left, frame)
       if node.op.token_type == TOK_OR:
         if leftval:
           return (lefttype, leftval)
       elif node.op.token_type == TOK_AND:
         if not leftval:
           return (lefttype, leftval)
-      return self.interpret(node.right, env)
+      return self.interpret(node.right, frame)
 
     elif isinstance(node, Stmts):
       #Evaluate statements in sequence, one after the other.
       for stmt in node.stmts:
-        self.interpret(stmt, env)
+        status = self.interpret(stmt, frame)
+        if status is not None:
+          return status # <-- a "ret" unwinds the rest of the block
 
     elif isinstance(node, PrintStmt):
-      exprtype, exprval = self.interpret(node.value, env)
-      val = stringify(exprval)
-      print(codecs.escape_decode(bytes(val, "utf-8"))[0].decode("utf-8"), end=node.end)
+      exprtype, exprval = self.interpret(node.value, frame)
+      self.output.write(stringify(exprval) + node.end)
 
     elif isinstance(node, IfStmt):
-      testtype, testval = self.interpret(node.test, env)
+      testtype, testval = self.interpret(node.test, frame)
       if testtype != TYPE_BOOL:
         runtime_error("Condition test is not a boolean expression.", node.line)
       if testval:
-        self.interpret(node.then_stmts, env.new_env()) # We must create a new child scope for the then-block
-      else:
-        self.interpret(node.else_stmts, env.new_env()) # We must create a new child scope for the else-block
+        return self.interpret(node.then_stmts, self.new_frame(node.then_stmts, frame)) # We must create a new child scope for the then-block
+      elif node.else_stmts:
+        return self.interpret(node.else_stmts, self.new_frame(node.else_stmts, frame)) # We must create a new child scope for the else-block
 
     elif isinstance(node, WhileStmt):
-      new_env = env.new_env()
+      body_frame = self.new_frame(node.body_stmts, frame)
       while True:
-        testtype, testval = self.interpret(node.test, env)
+        testtype, testval = self.interpret(node.test, frame)
         if testtype != TYPE_BOOL:
           runtime_error(f'While test is not a boolean expression.', node.line)
         if not testval:
           break
-        self.interpret(node.body_stmts, new_env) # pass the new child environment for the scope of the while block
+        status = self.interpret(node.body_stmts, body_frame) # pass the new child frame for the scope of the while block
+        if status is not None:
+          return status
 
     elif isinstance(node, ForStmt):
-      varname = node.ident.name
-      itype, i = self.interpret(node.start, env)
-      endtype, end = self.interpret(node.end, env)
-      block_new_env = env.new_env()
+      candidates = self.resolver.slots[id(node)]
+      itype, i = self.interpret(node.start, frame)
+      endtype, end = self.interpret(node.end, frame)
+      steptype, step = self.interpret(node.step, frame) if node.step is not None else (TYPE_NUMBER, None)
+      if itype != TYPE_NUMBER or endtype != TYPE_NUMBER or steptype != TYPE_NUMBER:
+        runtime_error(f'For loop start, end and step must be numbers.', node.ident.line)
+      block_frame = self.new_frame(node.body_stmts, frame)
       if i < end:
-        if node.step is None:
+        if step is None:
           step = 1
-        else:
-          steptype, step = self.interpret(node.step, env)
         while i <= end:
           newval = (TYPE_NUMBER, i)
-          env.set_var(varname, newval)
-          self.interpret(node.body_stmts, block_new_env) # pass the new child environment for the scope of the while block
+          store_slot(frame, candidates, newval)
+          status = self.interpret(node.body_stmts, block_frame) # pass the new child frame for the scope of the while block
+          if status is not None:
+            return status
           i = i + step
       else:
-        if node.step is None:
+        if step is None:
           step = -1
-        else:
-          steptype, step = self.interpret(node.step, env)
         while i >= end:
           newval = (TYPE_NUMBER, i)
-          env.set_var(varname, newval)
-          self.interpret(node.body_stmts, block_new_env) # pass the new child environment for the scope of the while block
+          store_slot(frame, candidates, newval)
+          status = self.interpret(node.body_stmts, block_frame) # pass the new child frame for the scope of the while block
+          if status is not None:
+            return status
           i = i + step
 
     elif isinstance(node, FuncDecl):
-      env.set_func(node.name, (node, env)) # we also store the environment in which the function was declared
+      [(_, index)] = self.resolver.slots[id(node)]
+      frame[index] = (node, frame) # we also store the frame in which the function was declared
 
     elif isinstance(node, FuncCall):
-      # We must make sure the function was declared
-      func = env.get_func(node.name)
-      if not func:
-        runtime_error(f'Function {node.name!r} not declared.', node.line)
-
-      # Fetch the function declaration
-      func_decl = func[0] #--> get the function declaration node that was saved in the environment
-      func_env  = func[1] #--> get the environment in which the function was originally declared
-
-      # Does the number of args match the expected number of params
-      if len(node.args) != len(func_decl.params):
-        runtime_error(f'Function {func_decl.name!r} expected {len(func_decl.params)} params but {len(node.args)} args were passed.', node.line)
-
-      # We need to evaluate all the args
-      args = []
-      for arg in node.args:
-        args.append(self.interpret(arg, env))
-
-      # Create a new nested block environment for the function
-      new_func_env = func_env.new_env()
-
-      # We must create local variables in the new child environment of the function for the parameters and bind the argument values to them!
-      for param, argval in zip(func_decl.params, args):
-        new_func_env.set_local(param.name, argval)
-
-      # Finally, we ask to interpret the body_stmts of the function declaration
+      func_decl, func_frame, args = self.prepare_call(node, frame)
       try:
-        self.interpret(func_decl.body_stmts, new_func_env)
-        return (TYPE_NUMBER, 0)
-      except Return as e:
-        return e.args[0] # <-- args is the arguments passed to the exception
+        return self.call_function(func_decl, func_frame, args)
+      except RecursionError:
+        # Only tail calls run in the trampoline, so deep recursion can still overflow the Python stack
+        runtime_error(f'Maximum recursion depth exceeded.', node.line)
 
     elif isinstance(node, FuncCallStmt):
-      self.interpret(node.expr, env)
+      self.interpret(node.expr, frame)
 
     elif isinstance(node, RetStmt):
-      raise Return(self.interpret(node.value, env))
-
-  def interpret_ast(self, node):
-    # Entry point of our interpreter creating a brand new global/parent environment
-    env = Environment()
-    self.interpret(node, env)
+      value = node.value
+      while isinstance(value, Grouping):
+        value = value.value
+      if isinstance(value, FuncCall) and self.function_depth > 0:
+        # A call in tail position is not made here: the function being called replaces the current
+        # one in the trampoline of call_function, so tail recursion does not grow the Python stack
+        self.tail_call = self.prepare_call(value, frame)
+        return STATUS_TAIL_CALL
+      self.return_value = self.interpret(node.value, frame)
+      return STATUS_RETURN
+
+  def prepare_call(self, node, frame):
+    '''
+    Finds the declaration of the called function and evaluates the args of a function call
+    '''
+    # We must make sure the function was declared
+    func = load_slot(frame, self.resolver.slots[id(node)])
+    if not func:
+      runtime_error(f'Function {node.name!r} not declared.', node.line)
+
+    # Fetch the function declaration
+    func_decl = func[0] #--> get the function declaration node that was saved in the frame
+    func_frame  = func[1] #--> get the frame in which the function was originally declared
+
+    # Does the number of args match the expected number of params
+    if len(node.args) != len(func_decl.params):
+      runtime_error(f'Function {func_decl.name!r} expected {len(func_decl.params)} params but {len(node.args)} args were passed.', node.line)
+
+    # We need to evaluate all the args
+    args = []
+    for arg in node.args:
+      args.append(self.interpret(arg, frame))
+    return func_decl, func_frame, args
+
+  def call_function(self, func_decl, func_frame, args):
+    '''
+    Runs the body of a function, and then the body of every function it tail-calls (a trampoline)
+    '''
+    self.function_depth += 1
+    try:
+      while True:
+        status = self.run_function(func_decl, func_frame, args)
+        if status is None:
+          return (TYPE_NUMBER, 0) # <-- the implicit return value of a function
+        if status is STATUS_RETURN:
+          return self.return_value
+        func_decl, func_frame, args = self.tail_call
+    finally:
+      self.function_depth -= 1
+
+  def run_function(self, func_decl, func_frame, args):
+    '''
+    Runs the body of a function once, and returns its status
+    '''
+    # Create a new nested frame for the function
+    new_func_frame = self.new_frame(func_decl.body_stmts, func_frame)
+
+    # We must set the slots of the parameters in the new frame of the function and bind the argument values to them!
+    for param, argval in zip(func_decl.params, args):
+      [(_, index)] = self.resolver.slots[id(param)]
+      new_func_frame[index] = argval
+
+    # Finally, we ask to interpret the body_stmts of the function declaration
+    return self.interpret(func_decl.body_stmts, new_func_frame)
+
+  def interpret_ast(self, node, inputs=None):
+    '''
+    Entry point of our interpreter: runs a program in a brand new global frame, with the values of
+    its input variables (name -> tagged value, e.g. set by the host of an embedded program), and
+    returns the global variables that are set at the end (name -> tagged value)
+    '''
+    inputs = inputs or {}
+    program = (node, tuple(inputs))
+    # The resolver only runs again when the program (or the names of its inputs) change
+    if self.program != program:
+      self.resolver = Resolver().resolve_program(node, program[1])
+      self.program = program
+    scope = self.resolver.scopes[id(node)]
+    frame = [None] * scope.size
+    for name, index in self.resolver.input_slots():
+      frame[index] = inputs[name]
+    try:
+      self.interpret(node, frame)
+    finally:
+      self.output.flush()
+    return {name: frame[index] for name, index in scope.vars.items() if frame[index] is not None}
 
-class Return(Exception):
-  pass
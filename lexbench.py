@@ -0,0 +1,56 @@
+# A throughput benchmark for the lexer: it scans Pinky sources with the regex Lexer and with the
+# original character-at-a-time CharLexer, checks that both produce the same tokens, and reports the
+# best time and the number of tokens per second of each scanner.
+#
+#      python3 lexbench.py
+#      python3 lexbench.py --repeat 10 scripts/*.pinky
+import time
+import argparse
+from lexer import *
+
+def generated_source(copies):
+  '''
+  A large source made of many copies of all the scripts (like the generated sources we lex)
+  '''
+  sources = []
+  for filename in ['scripts/dragon.pinky', 'scripts/mandel.pinky', 'scripts/myscript.pinky']:
+    with open(filename) as file:
+      sources.append(file.read())
+  return '\n'.join(sources * copies)
+
+def time_lexer(lexer_class, source, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    tokens = lexer_class(source).tokenize()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return tokens, best
+
+def same_tokens(tokens, reference):
+  return [(t.token_type, t.lexeme, t.line) for t in tokens] == [(t.token_type, t.lexeme, t.line) for t in reference]
+
+if __name__ == '__main__':
+  argparser = argparse.ArgumentParser(description='Measure the throughput of the Pinky lexer.')
+  argparser.add_argument('files', nargs='*', help='Pinky source files (default: a large generated source)')
+  argparser.add_argument('--repeat', type=int, default=5, help='number of timed runs (the best one is reported)')
+  argparser.add_argument('--copies', type=int, default=200, help='number of copies of the scripts in the generated source')
+  args = argparser.parse_args()
+
+  if args.files:
+    sources = []
+    for filename in args.files:
+      with open(filename) as file:
+        sources.append((filename, file.read()))
+  else:
+    sources = [(f'generated (x{args.copies})', generated_source(args.copies))]
+
+  print(f'{Colors.MAGENTA}{"source":<32}{"lexer":<11}{"tokens":>9}{"time":>10}{"tokens/s":>13}{Colors.WHITE}')
+  for name, source in sources:
+    tokens, regex_time = time_lexer(Lexer, source, args.repeat)
+    reference, char_time = time_lexer(CharLexer, source, args.repeat)
+    for lexer_name, elapsed in [('CharLexer', char_time), ('Lexer', regex_time)]:
+      print(f'{name:<32}{lexer_name:<11}{len(tokens):>9}{elapsed:>9.3f}s{len(tokens) / elapsed:>13,.0f}')
+    same = 'same tokens' if same_tokens(tokens, reference) else f'{Colors.RED}different tokens{Colors.WHITE}'
+    print(f'{"":<32}{"speedup":<11}{"":>9}{char_time / regex_time:>9.2f}x  {same}')
+    print()
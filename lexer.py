@@ -1,7 +1,150 @@
 from utils import *
 from tokens import *
+import re
+from sys import intern
+
+###############################################################################
+# The lexer scans the source with a single compiled regular expression. Each match skips the blanks
+# before a token, and the name of the group that matched the token (match.lastgroup) tells what it is:
+#
+#      NEWLINE    newlines and the blanks after them (newlines are counted to keep track of the line)
+#      COMMENT    from -- to the end of the line
+#      NAME       identifiers and keywords (a letter or _, then letters, digits or _)
+#      NUMBER     integers and floats (a float needs digits on both sides of its '.')
+#      STRING     text between double or single quotes (it can span lines)
+#      OPERATOR   one and two-char tokens, looked up in OPERATORS
+#      QUOTE      the opening quote of a string that is never closed
+#      ERROR      any other character
+#
+# The regex engine consumes whole tokens in C, instead of one Python call per character, and every
+# source character is matched by some group, so the scan never skips over text. Only the blanks at
+# the very end of the source match no group at all.
+###############################################################################
+TOKEN_REGEX = re.compile(r'''
+  [ \t\r]*
+  (?:(?P<NEWLINE>\n[ \t\r\n]*)
+    |(?P<COMMENT>--[^\n]*)
+    |(?P<NAME>[^\W\d]\w*)
+    |(?P<NUMBER>\d+(?:\.\d+)?)
+    |(?P<STRING>"[^"]*"|'[^']*')
+    |(?P<OPERATOR>==|~=|<=|>=|:=|[-+*/^%(){}\[\].,;?=~<>:])
+    |(?P<QUOTE>["'])
+    |(?P<ERROR>.)
+    |$)
+''', re.VERBOSE)
+
+OPERATORS = {
+  '('  : TOK_LPAREN,
+  ')'  : TOK_RPAREN,
+  '{'  : TOK_LCURLY,
+  '}'  : TOK_RCURLY,
+  '['  : TOK_LSQUAR,
+  ']'  : TOK_RSQUAR,
+  '.'  : TOK_DOT,
+  ','  : TOK_COMMA,
+  '+'  : TOK_PLUS,
+  '-'  : TOK_MINUS,
+  '*'  : TOK_STAR,
+  '^'  : TOK_CARET,
+  '/'  : TOK_SLASH,
+  ';'  : TOK_SEMICOLON,
+  '?'  : TOK_QUESTION,
+  '%'  : TOK_MOD,
+  '='  : TOK_EQ,
+  '~'  : TOK_NOT,
+  '<'  : TOK_LT,
+  '>'  : TOK_GT,
+  ':'  : TOK_COLON,
+  '==' : TOK_EQEQ,
+  '~=' : TOK_NE,
+  '<=' : TOK_LE,
+  '>=' : TOK_GE,
+  ':=' : TOK_ASSIGN,
+}
 
 class Lexer:
+  def __init__(self, source):
+    self.source = source
+    self.line = 1
+    self.tokens = []
+
+  def tokenize(self):
+    '''
+    Scans the whole source and returns the list of its tokens
+    '''
+    self.tokens.extend(self.generate())
+    return self.tokens
+
+  def generate(self):
+    '''
+    A generator of the tokens of the source, scanned lazily as they are requested (so the parser
+    can consume them while the source is still being scanned, and without a list of all the tokens)
+    '''
+    source = self.source
+    match = TOKEN_REGEX.match
+    line = self.line
+    pos = 0
+    while pos < len(source):
+      m = match(source, pos)
+      kind = m.lastgroup
+      if kind is None:
+        break # <-- only blanks are left
+      text = m.group(kind)
+      if kind == 'NAME' or kind == 'NUMBER':
+        # \w matches every char of a word of the original scanner, but a NAME can also start with a
+        # char that is not a letter there (e.g. '²', a digit for isdigit() but not for \d, or 'Ⅻ'),
+        # and a NUMBER can be followed by such a digit (directly or after its '.'). Those words are
+        # scanned again as the original scanner does
+        end = m.end()
+        if kind == 'NAME':
+          rescan = not (text[0].isalpha() or text[0] == '_')
+        else:
+          rescan = source[end:end + 1].isdigit() or (source[end:end + 1] == '.' and source[end + 1:end + 2].isdigit())
+        if rescan:
+          token, pos = self.scan_word(m.start(kind), line)
+          yield token
+          continue
+        if kind == 'NAME':
+          text = intern(text) # <-- every occurrence of a name shares one string (in the tokens and the AST)
+          yield Token(keywords.get(text, TOK_IDENTIFIER), text, line)
+        else:
+          yield Token(TOK_FLOAT if '.' in text else TOK_INTEGER, text, line)
+      elif kind == 'OPERATOR':
+        yield Token(OPERATORS[text], intern(text), line)
+      elif kind == 'NEWLINE':
+        line += text.count('\n')
+        self.line = line
+      elif kind == 'STRING':
+        yield Token(TOK_STRING, text, line) # <-- newlines inside a string are not counted
+      elif kind == 'QUOTE':
+        lexing_error(f'Unterminated string.', line)
+      elif kind == 'ERROR':
+        lexing_error(f'Error at {text!r}: Unexpected character.', line)
+      pos = m.end()
+
+  def scan_word(self, pos, line):
+    '''
+    Scans the identifier or number at pos with the original scanner, and returns its token and the
+    position where it ends
+    '''
+    lexer = CharLexer(self.source)
+    lexer.start = pos
+    lexer.curr = pos + 1
+    lexer.line = line
+    ch = self.source[pos]
+    if ch.isdigit():
+      lexer.handle_number()
+    elif ch.isalpha() or ch == '_':
+      lexer.handle_identifier()
+    else:
+      lexing_error(f'Error at {ch!r}: Unexpected character.', line)
+    return lexer.tokens[-1], lexer.curr
+
+class CharLexer:
+  '''
+  The original scanner, that reads the source one character at a time. It is kept as the reference
+  implementation: the Lexer must produce the same tokens (see tests-lexer.py and lexbench.py).
+  '''
   def __init__(self, source):
     self.source = source
     self. start = 0
@@ -20,7 +163,7 @@ class Lexer:
     return self.source[self.curr]
 
   def lookahead(self, n=1):
-    if self.curr >= len(self.source):
+    if self.curr + n >= len(self.source):
       return '\0'
     return self.source[self.curr + n]
 
@@ -42,6 +185,10 @@ class Lexer:
       self.add_token(TOK_FLOAT)
     else:
       self.add_token(TOK_INTEGER)
+    # Digits like '²' are digits for isdigit(), but a number can only be made of decimal digits
+    for ch in self.source[self.start:self.curr]:
+      if not ch.isdecimal() and ch != '.':
+        lexing_error(f'Error at {ch!r}: Unexpected character.', self.line)
 
   def handle_string(self, start_quote):
     while self.peek() != start_quote and not(self.curr >= len(self.source)):
@@ -0,0 +1,59 @@
+# A memory benchmark for the front end: it lexes and parses a large Pinky program and reports the
+# memory taken by the tokens and by the AST (measured with tracemalloc), in total and per token/node,
+# next to the size of the source text.
+#
+#      python3 memorybench.py
+#      python3 memorybench.py --copies 500
+#      python3 memorybench.py scripts/mandel.pinky
+import argparse
+import tracemalloc
+from lexer import *
+from parser import *
+from lexbench import generated_source
+
+def count_nodes(node):
+  '''
+  Counts the AST nodes reachable from a node (the nodes store their children in their slots)
+  '''
+  count = 0
+  pending = [node]
+  while pending:
+    node = pending.pop()
+    if isinstance(node, list):
+      pending.extend(node)
+    elif isinstance(node, Node):
+      count += 1
+      for cls in type(node).__mro__:
+        pending.extend(getattr(node, name) for name in cls.__dict__.get('__slots__', ()))
+  return count
+
+def measure(build):
+  '''
+  Returns the result of build() and the number of bytes allocated for it (and still alive)
+  '''
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  result = build()
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return result, after - before
+
+if __name__ == '__main__':
+  argparser = argparse.ArgumentParser(description='Measure the memory taken by the tokens and the AST of a Pinky program.')
+  argparser.add_argument('filename', nargs='?', help='Pinky source file (default: a large generated source)')
+  argparser.add_argument('--copies', type=int, default=200, help='number of copies of the scripts in the generated source')
+  args = argparser.parse_args()
+
+  if args.filename:
+    with open(args.filename) as file:
+      source = file.read()
+  else:
+    source = generated_source(args.copies)
+
+  tokens, token_bytes = measure(lambda: Lexer(source).tokenize())
+  ast, ast_bytes = measure(lambda: Parser(tokens).parse())
+  nodes = count_nodes(ast)
+
+  print(f'source  {len(source):>10,} chars')
+  print(f'tokens  {len(tokens):>10,}        {token_bytes:>12,} bytes  {token_bytes / len(tokens):>7.1f} bytes/token')
+  print(f'nodes   {nodes:>10,}        {ast_bytes:>12,} bytes  {ast_bytes / nodes:>7.1f} bytes/node')
@@ -4,33 +4,35 @@ class Node:
   '''
   The parent class for every node in the AST
   '''
-  pass
+  __slots__ = ()
 
 class Expr(Node):
   '''
   Expressions evaluate to a result, like x + (3 * y) >= 6
   '''
-  pass
+  __slots__ = ()
 
 
 class Stmt(Node):
   '''
   Statements perform an action
   '''
-  pass
+  __slots__ = ()
 
 
 class Decl(Stmt):
   '''
   Declarations are statements to declare a new name (in our case, functions)
   '''
-  pass
+  __slots__ = ()
 
 
 class Integer(Expr):
   '''
   Example: 17
   '''
+  __slots__ = ('value', 'line')
+
   def __init__(self, value, line):
     assert isinstance(value, int), value
     self.value = value
@@ -43,6 +45,8 @@ class Float(Expr):
   '''
   Example: 3.141592
   '''
+  __slots__ = ('value', 'line')
+
   def __init__(self, value, line):
     assert isinstance(value,float), value
     self.value = value
@@ -55,6 +59,8 @@ class Bool(Expr):
   '''
   Example: true, false
   '''
+  __slots__ = ('value', 'line')
+
   def __init__(self, value, line):
     assert isinstance(value, bool), value
     self.value = value
@@ -67,6 +73,8 @@ class String(Expr):
   '''
   Example: 'this is a string'
   '''
+  __slots__ = ('value', 'line')
+
   def __init__(self, value, line):
     assert isinstance(value, str), value
     self.value = value
@@ -79,6 +87,8 @@ class UnOp(Expr):
   '''
   Example: -operand
   '''
+  __slots__ = ('op', 'operand', 'line')
+
   def __init__(self, op: Token, operand: Expr, line):
     assert isinstance(op, Token), op
     assert isinstance(operand, Expr), operand
@@ -93,6 +103,8 @@ class BinOp(Expr):
   '''
   Example: x + y
   '''
+  __slots__ = ('op', 'left', 'right', 'line')
+
   def __init__(self, op: Token, left: Expr, right: Expr, line):
     assert isinstance(op, Token), op
     assert isinstance(left, Expr), left
@@ -109,6 +121,8 @@ class LogicalOp(Expr):
   '''
   Example: x and y, x or y
   '''
+  __slots__ = ('op', 'left', 'right', 'line')
+
   def __init__(self, op: Token, left: Expr, right: Expr, line):
     assert isinstance(op, Token), op
     assert isinstance(left, Expr), left
@@ -125,6 +139,8 @@ class Grouping(Expr):
   '''
   Example: ( <expr> )
   '''
+  __slots__ = ('value', 'line')
+
   def __init__(self, value, line):
     assert isinstance(value, Expr), value
     self.value = value
@@ -137,6 +153,8 @@ class Identifier(Expr):
   '''
   Example: x, PI, _score, numLives, start_vel
   '''
+  __slots__ = ('name', 'line')
+
   def __init__(self, name, line):
     assert isinstance(name, str), name
     self.name = name
@@ -149,6 +167,8 @@ class Stmts(Node):
   '''
   A list of statements
   '''
+  __slots__ = ('stmts', 'line')
+
   def __init__(self, stmts, line):
     assert all(isinstance(stmt, Stmt) for stmt in stmts), stmts
     self.stmts = stmts
@@ -161,6 +181,8 @@ class PrintStmt(Stmt):
   '''
   Example: print value, println value
   '''
+  __slots__ = ('value', 'end', 'line')
+
   def __init__(self, value, end, line):
     assert isinstance(value, Expr), value
     self.value = value
@@ -174,6 +196,8 @@ class IfStmt(Stmt):
   '''
   "if" <expr> "then" <then_stmts> ("else" <else_stmts>)? "end"
   '''
+  __slots__ = ('test', 'then_stmts', 'else_stmts', 'line')
+
   def __init__(self, test, then_stmts, else_stmts, line):
     assert isinstance(test, Expr), test
     assert isinstance(then_stmts, Stmts), then_stmts
@@ -190,6 +214,8 @@ class WhileStmt(Stmt):
   '''
   "while" <expr> "do" <body_stmts> "end"
   '''
+  __slots__ = ('test', 'body_stmts', 'line')
+
   def __init__(self, test, body_stmts, line):
     assert isinstance(test, Expr), test
     assert isinstance(body_stmts, Stmts), body_stmts
@@ -204,6 +230,8 @@ class Assignment(Stmt):
   '''
   left := right
   '''
+  __slots__ = ('left', 'right', 'line')
+
   def __init__(self, left, right, line):
     assert isinstance(left, Expr), left
     assert isinstance(right, Expr), right
@@ -218,6 +246,8 @@ class LocalAssignment(Stmt):
   '''
   "local" left := right
   '''
+  __slots__ = ('left', 'right', 'line')
+
   def __init__(self, left, right, line):
     assert isinstance(left, Expr), left
     assert isinstance(right, Expr), right
@@ -232,6 +262,8 @@ class ForStmt(Stmt):
   '''
   "for" <identifier> ":=" <start> "," <end> ("," <step>)? "do" <body_stmts> "end"
   '''
+  __slots__ = ('ident', 'start', 'end', 'step', 'body_stmts', 'line')
+
   def __init__(self, ident, start, end, step, body_stmts, line):
     assert isinstance(ident, Identifier), ident
     assert isinstance(start, Expr), start
@@ -252,6 +284,8 @@ class FuncDecl(Decl):
   '''
   "func" <name> "(" <params>? ")" <body_stmts> "end"
   '''
+  __slots__ = ('name', 'params', 'body_stmts', 'line')
+
   def __init__(self, name, params, body_stmts, line):
     assert isinstance(name, str), name
     assert all(isinstance(param, Param) for param in params), params
@@ -267,6 +301,8 @@ class Param(Decl):
   '''
   A single function parameter
   '''
+  __slots__ = ('name', 'line')
+
   def __init__(self, name, line):
     assert isinstance(name, str), name
     self.name = name
@@ -280,6 +316,8 @@ class FuncCall(Expr):
   <func_call>  ::=  <name> "(" <args>? ")"
   <args> ::= <expr> ( ',' <expr> )*
   '''
+  __slots__ = ('name', 'args', 'line')
+
   def __init__(self, name, args, line):
     self.name = name
     self.args = args
@@ -292,6 +330,8 @@ class FuncCallStmt(Stmt):
   '''
   A special type of statement used to wrap FuncCall expressions
   '''
+  __slots__ = ('expr',)
+
   def __init__(self, expr):
     assert isinstance(expr, FuncCall), expr
     self.expr = expr
@@ -303,9 +343,24 @@ class RetStmt(Stmt):
   '''
   "ret" <expr>
   '''
+  __slots__ = ('value', 'line')
+
   def __init__(self, value, line):
     assert isinstance(value, Expr), value
     self.value = value
     self.line = line
   def __repr__(self):
     return f'RetStmt[{self.value}]'
+
+
+def statement_line(node):
+  '''
+  The line where a statement starts (the parser gives if, while and for the line of their "end")
+  '''
+  if isinstance(node, (IfStmt, WhileStmt)):
+    return node.test.line
+  if isinstance(node, ForStmt):
+    return node.ident.line
+  if isinstance(node, FuncCallStmt):
+    return node.expr.line # <-- the wrapper of a call has no line
+  return node.line
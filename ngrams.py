@@ -0,0 +1,91 @@
+# Mines the most frequent n-grams (short sequences of opcodes) from compiled Pinky programs.
+# This is the data used to choose the superinstructions fused by the peephole optimizer.
+#
+#      python3 ngrams.py scripts/*.pinky                  # static counts (how often a sequence appears in the code)
+#      python3 ngrams.py --dynamic scripts/dragon.pinky   # dynamic counts (how often a sequence is executed)
+#      python3 ngrams.py --fused -n 2 3 scripts/*.pinky   # mine what remains after the peephole optimizer
+#
+# An n-gram never spans a jump target (LABEL), and control-flow instructions can only appear at
+# its last position, so every reported sequence is a candidate for fusion.
+import sys
+import io
+import argparse
+import contextlib
+from lexer import *
+from parser import *
+from compiler import *
+from peephole import *
+from assembler import *
+from vm import *
+
+# Instructions that transfer control (they can only end an n-gram)
+CONTROL_OPS = ('JMP', 'JMPZ', 'JSR', 'TAIL_JSR', 'RTS', 'HALT', 'JMPZ_LT_NUM', 'JMPZ_GT_NUM', 'JMPZ_LE_NUM', 'JMPZ_GE_NUM', 'FOR_PREP', 'FOR_LOOP')
+
+def count_hits(program):
+  '''
+  Runs an assembled program one instruction at a time (using the reference handlers of the VM)
+  and returns a list with the number of times each PC was executed
+  '''
+  vm = VM()
+  vm.program = program
+  code = vm.prepare(program.code)
+  handlers = [getattr(vm, name) for name in OPCODE_NAMES]
+  hits = [0] * len(code)
+  vm.is_running = True
+  with contextlib.redirect_stdout(io.StringIO()):
+    while vm.is_running:
+      op, arg = code[vm.pc]
+      hits[vm.pc] += 1
+      vm.pc = vm.pc + 1
+      if arg is None:
+        handlers[op]()
+      else:
+        handlers[op](arg)
+  return hits
+
+def mine(program, n, hits=None):
+  '''
+  Counts the n-grams of an assembled program (weighted by the PC hit counts, if given)
+  '''
+  targets = set(program.labels.values())
+  counts = {}
+  for pc in range(len(program.code) - n + 1):
+    window = program.code[pc:pc + n]
+    if any(pc + i in targets for i in range(1, n)):
+      continue
+    if any(instruction[0] in CONTROL_OPS for instruction in window[:-1]):
+      continue
+    key = ' '.join(instruction[0] for instruction in window)
+    counts[key] = counts.get(key, 0) + (1 if hits is None else hits[pc])
+  return counts
+
+if __name__ == '__main__':
+  argparser = argparse.ArgumentParser(description='Mine the most frequent opcode n-grams from Pinky programs.')
+  argparser.add_argument('files', nargs='+', help='Pinky source files')
+  argparser.add_argument('-n', type=int, nargs='+', default=[2, 3, 4], help='n-gram sizes (default: 2 3 4)')
+  argparser.add_argument('--top', type=int, default=15, help='number of n-grams to report per size')
+  argparser.add_argument('--dynamic', action='store_true', help='weight each n-gram by its execution count')
+  argparser.add_argument('--fused', action='store_true', help='mine the code after the peephole optimizer')
+  args = argparser.parse_args()
+
+  totals = {n: {} for n in args.n}
+  for filename in args.files:
+    with open(filename) as file:
+      source = file.read()
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens).parse()
+    code = Compiler().generate_code(ast)
+    if args.fused:
+      code = Peephole().optimize(code)
+    program = Assembler().assemble(code)
+    hits = count_hits(program) if args.dynamic else None
+    for n in args.n:
+      for key, count in mine(program, n, hits).items():
+        totals[n][key] = totals[n].get(key, 0) + count
+
+  for n in args.n:
+    print(f'{Colors.MAGENTA}{n}-grams ({"dynamic" if args.dynamic else "static"} counts):{Colors.WHITE}')
+    ranked = sorted(totals[n].items(), key=lambda item: item[1], reverse=True)
+    for key, count in ranked[:args.top]:
+      print(f'{count:>12}  {key}')
+    print()
@@ -0,0 +1,203 @@
+from defs import *
+from utils import *
+from model import *
+from tokens import *
+
+# Statements that can be moved out of a dead if-else into the enclosing block without changing
+# which scope their variables end up in (assignments, local assignments, for loops and function
+# declarations create names in the block where they are executed, so they must keep their block)
+SCOPE_NEUTRAL_STMTS = (PrintStmt, IfStmt, WhileStmt, FuncCallStmt, RetStmt)
+
+def is_literal(node):
+  return isinstance(node, (Integer, Float, Bool, String))
+
+def is_number(node):
+  return isinstance(node, (Integer, Float))
+
+def declares_function(stmts):
+  '''
+  Tells whether a block (or a block nested in it) declares a function. The compiler declares every
+  function of the program, even in a branch that never runs, so such a branch cannot be dropped
+  '''
+  if stmts is None:
+    return False
+  for stmt in stmts.stmts:
+    if isinstance(stmt, FuncDecl):
+      return True
+    if isinstance(stmt, IfStmt) and (declares_function(stmt.then_stmts) or declares_function(stmt.else_stmts)):
+      return True
+    if isinstance(stmt, (WhileStmt, ForStmt)) and declares_function(stmt.body_stmts):
+      return True
+  return False
+
+class Optimizer:
+  '''
+  An optimization pass over the AST that runs before both the interpreter and the compiler.
+  It folds constant subtrees (only when the result does not depend on the back end and does not
+  raise a runtime error), removes the Grouping wrappers, and drops unreachable branches.
+  '''
+  def fold_binop(self, node, left, right):
+    # Returns a literal node with the result of the operation, or None if it cannot be folded
+    op = node.op.token_type
+    if is_number(left) and is_number(right):
+      leftval = float(left.value)
+      rightval = float(right.value)
+      try:
+        if op == TOK_PLUS:
+          return Float(leftval + rightval, node.line)
+        elif op == TOK_MINUS:
+          return Float(leftval - rightval, node.line)
+        elif op == TOK_STAR:
+          return Float(leftval * rightval, node.line)
+        elif op == TOK_SLASH and rightval != 0:
+          return Float(leftval / rightval, node.line)
+        elif op == TOK_MOD and rightval != 0:
+          return Float(leftval % rightval, node.line)
+        elif op == TOK_CARET:
+          result = leftval ** rightval
+          return Float(result, node.line) if isinstance(result, float) else None
+        elif op == TOK_LT:
+          return Bool(leftval < rightval, node.line)
+        elif op == TOK_GT:
+          return Bool(leftval > rightval, node.line)
+        elif op == TOK_LE:
+          return Bool(leftval <= rightval, node.line)
+        elif op == TOK_GE:
+          return Bool(leftval >= rightval, node.line)
+        elif op == TOK_EQEQ:
+          return Bool(leftval == rightval, node.line)
+        elif op == TOK_NE:
+          return Bool(leftval != rightval, node.line)
+      except (ArithmeticError, ValueError):
+        return None
+
+    elif op == TOK_PLUS and (isinstance(left, String) or isinstance(right, String)):
+      leftval = float(left.value) if is_number(left) else left.value
+      rightval = float(right.value) if is_number(right) else right.value
+      return String(stringify(leftval) + stringify(rightval), node.line)
+
+    elif isinstance(left, String) and isinstance(right, String):
+      if op == TOK_LT:
+        return Bool(left.value < right.value, node.line)
+      elif op == TOK_GT:
+        return Bool(left.value > right.value, node.line)
+      elif op == TOK_LE:
+        return Bool(left.value <= right.value, node.line)
+      elif op == TOK_GE:
+        return Bool(left.value >= right.value, node.line)
+      elif op == TOK_EQEQ:
+        return Bool(left.value == right.value, node.line)
+      elif op == TOK_NE:
+        return Bool(left.value != right.value, node.line)
+
+    elif isinstance(left, Bool) and isinstance(right, Bool):
+      if op == TOK_EQEQ:
+        return Bool(left.value == right.value, node.line)
+      elif op == TOK_NE:
+        return Bool(left.value != right.value, node.line)
+
+    return None
+
+  def optimize_block(self, node):
+    '''
+    Optimizes a list of statements, dropping dead statements and splicing live branches in place
+    '''
+    stmts = []
+    for stmt in node.stmts:
+      stmt = self.optimize(stmt)
+      if stmt is None:
+        continue
+      if isinstance(stmt, Stmts):
+        stmts.extend(stmt.stmts)
+      else:
+        stmts.append(stmt)
+    return Stmts(stmts, node.line)
+
+  def optimize(self, node):
+    if isinstance(node, (Integer, Float, Bool, String, Identifier)):
+      return node
+
+    elif isinstance(node, Grouping):
+      return self.optimize(node.value)
+
+    elif isinstance(node, BinOp):
+      left = self.optimize(node.left)
+      right = self.optimize(node.right)
+      if is_literal(left) and is_literal(right):
+        folded = self.fold_binop(node, left, right)
+        if folded is not None:
+          return folded
+      return BinOp(node.op, left, right, node.line)
+
+    elif isinstance(node, UnOp):
+      operand = self.optimize(node.operand)
+      if node.op.token_type == TOK_MINUS and is_number(operand):
+        return Float(-float(operand.value), node.line)
+      if node.op.token_type == TOK_PLUS and is_number(operand):
+        return Float(float(operand.value), node.line)
+      if node.op.token_type == TOK_NOT and isinstance(operand, Bool):
+        return Bool(not operand.value, node.line)
+      return UnOp(node.op, operand, node.line)
+
+    elif isinstance(node, LogicalOp):
+      left = self.optimize(node.left)
+      right = self.optimize(node.right)
+      # Only fold booleans, where the short-circuit (interpreter) and bitwise (VM) semantics agree
+      if isinstance(left, Bool) and isinstance(right, Bool):
+        if node.op.token_type == TOK_AND:
+          return Bool(left.value and right.value, node.line)
+        elif node.op.token_type == TOK_OR:
+          return Bool(left.value or right.value, node.line)
+      return LogicalOp(node.op, left, right, node.line)
+
+    elif isinstance(node, Stmts):
+      return self.optimize_block(node)
+
+    elif isinstance(node, PrintStmt):
+      return PrintStmt(self.optimize(node.value), node.end, node.line)
+
+    elif isinstance(node, IfStmt):
+      test = self.optimize(node.test)
+      then_stmts = self.optimize(node.then_stmts)
+      else_stmts = self.optimize(node.else_stmts) if node.else_stmts else None
+      if isinstance(test, Bool) and not declares_function(else_stmts if test.value else then_stmts):
+        live_stmts = then_stmts if test.value else else_stmts
+        if live_stmts is None:
+          return None
+        if all(isinstance(stmt, SCOPE_NEUTRAL_STMTS) for stmt in live_stmts.stmts):
+          return live_stmts # <-- spliced into the enclosing block
+        return IfStmt(Bool(True, test.line), live_stmts, None, node.line)
+      return IfStmt(test, then_stmts, else_stmts, node.line)
+
+    elif isinstance(node, WhileStmt):
+      test = self.optimize(node.test)
+      body_stmts = self.optimize(node.body_stmts)
+      if isinstance(test, Bool) and not test.value and not declares_function(body_stmts):
+        return None
+      return WhileStmt(test, body_stmts, node.line)
+
+    elif isinstance(node, Assignment):
+      return Assignment(node.left, self.optimize(node.right), node.line)
+
+    elif isinstance(node, LocalAssignment):
+      return LocalAssignment(node.left, self.optimize(node.right), node.line)
+
+    elif isinstance(node, ForStmt):
+      start = self.optimize(node.start)
+      end = self.optimize(node.end)
+      step = self.optimize(node.step) if node.step is not None else None
+      return ForStmt(node.ident, start, end, step, self.optimize(node.body_stmts), node.line)
+
+    elif isinstance(node, FuncDecl):
+      return FuncDecl(node.name, node.params, self.optimize(node.body_stmts), node.line)
+
+    elif isinstance(node, FuncCall):
+      return FuncCall(node.name, [self.optimize(arg) for arg in node.args], node.line)
+
+    elif isinstance(node, FuncCallStmt):
+      return FuncCallStmt(self.optimize(node.expr))
+
+    elif isinstance(node, RetStmt):
+      return RetStmt(self.optimize(node.value), node.line)
+
+    return node
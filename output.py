@@ -0,0 +1,46 @@
+import sys
+
+# Number of characters kept in the buffer of an Output before they are written to its file
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+# Outputs that hold text not written yet. report_error() flushes them before it prints the message, so
+# the message still comes after everything the program printed before failing.
+pending_outputs = []
+
+class Output:
+  '''
+  The sink for the text printed by the print/println statements of a program. The text is buffered
+  and only written to the file when the buffer is full or when the output is flushed (when the
+  program halts or fails). Without a file, the text goes to the sys.stdout in use at flush time.
+  Any object with write() works as a file, e.g. an io.StringIO to keep the output in memory.
+  '''
+  def __init__(self, file=None, buffer_size=OUTPUT_BUFFER_SIZE):
+    self.file = file
+    self.buffer_size = buffer_size
+    self.chunks = []
+    self.size = 0
+
+  def write(self, text):
+    if not self.chunks:
+      pending_outputs.append(self)
+    self.chunks.append(text)
+    self.size += len(text)
+    if self.size >= self.buffer_size:
+      self.flush()
+
+  def flush(self):
+    if self.chunks:
+      pending_outputs.remove(self)
+      file = sys.stdout if self.file is None else self.file
+      file.write(''.join(self.chunks))
+      self.chunks = []
+      self.size = 0
+      if hasattr(file, 'flush'):
+        file.flush()
+
+def flush_outputs():
+  '''
+  Writes the buffered text of all outputs (called before an error message is printed)
+  '''
+  for output in list(pending_outputs):
+    output.flush()
@@ -4,40 +4,50 @@ from model import *
 
 class Parser:
   def __init__(self, tokens):
-    self.tokens = tokens
-    self.curr = 0
+    # The tokens are consumed through a one-token lookahead buffer, so the parser accepts a list of
+    # tokens as well as the lazy token stream of Lexer.generate() (then lexing and parsing run as a
+    # pipeline, and the tokens already parsed can be freed)
+    self.tokens = iter(tokens)
+    self.next_token = next(self.tokens, None) # <-- the lookahead buffer (None at the end of the tokens)
+    self.prev_token = None
+    self.curr = 0 # <-- number of tokens consumed so far
 
   def advance(self):
-    token = self.tokens[self.curr]
+    token = self.next_token
+    self.prev_token = token
+    self.next_token = next(self.tokens, None)
     self.curr = self.curr + 1
     return token
 
   def peek(self):
-    return self.tokens[self.curr]
+    return self.next_token
+
+  def is_at_end(self):
+    return self.next_token is None
 
   def is_next(self, expected_type):
-    if self.curr >= len(self.tokens):
+    if self.next_token is None:
       return False
-    return self.peek().token_type == expected_type
+    return self.next_token.token_type == expected_type
 
   def expect(self, expected_type):
-    if self.curr >= len(self.tokens):
+    if self.next_token is None:
       parse_error(f'Found {self.previous_token().lexeme!r} at the end of parsing', self.previous_token().line)
-    elif self.peek().token_type == expected_type:
+    elif self.next_token.token_type == expected_type:
       token = self.advance()
       return token
     else:
       parse_error(f'Expected {expected_type!r}, found {self.peek().lexeme!r}.', self.peek().line)
 
   def previous_token(self):
-    return self.tokens[self.curr - 1]
+    return self.prev_token
 
   def match(self, expected_type):
-    if self.curr >= len(self.tokens):
+    if self.next_token is None:
       return False
-    if self.peek().token_type != expected_type:
+    if self.next_token.token_type != expected_type:
       return False
-    self.curr = self.curr + 1 # If it is a match, we return True and also comsume that token
+    self.advance() # If it is a match, we return True and also comsume that token
     return True
 
   # <primary>  ::=  <integer>
@@ -56,7 +66,13 @@ class Parser:
     elif self.match(TOK_FALSE):
       return Bool(False, line=self.previous_token().line)
     elif self.match(TOK_STRING):
-      return String(str(self.previous_token().lexeme[1:-1]), line=self.previous_token().line) # Remove the quotes at the beginning and at the end of the lexeme
+      # Remove the quotes at the beginning and at the end of the lexeme, and process its escape sequences
+      # once here (so the back ends print strings as they are)
+      try:
+        text = escape_decode(self.previous_token().lexeme[1:-1])
+      except ValueError:
+        parse_error(f'Invalid escape sequence in string.', self.previous_token().line)
+      return String(text, line=self.previous_token().line)
     elif self.match(TOK_LPAREN):
       expr = self.expr()
       if (not self.match(TOK_RPAREN)):
@@ -187,7 +203,8 @@ class Parser:
   # <for_stmt>  ::=  "for" <identifier> ":=" <start> "," <end> ("," <step>)? "do" <body_stmts> "end"
   def for_stmt(self):
     self.expect(TOK_FOR)
-    identifier = self.primary()
+    name = self.expect(TOK_IDENTIFIER)
+    identifier = Identifier(name.lexeme, line=name.line)
     self.expect(TOK_ASSIGN)
     start = self.expr()
     self.expect(TOK_COMMA)
@@ -236,11 +253,16 @@ class Parser:
     self.expect(TOK_END)
     return FuncDecl(name.lexeme, params, body_stmts, line=self.previous_token().line)
 
+  def check_assign_target(self, left):
+    if not isinstance(left, Identifier):
+      parse_error(f'Only a variable can be assigned.', left.line)
+
   # <local_assign>  ::=  "local" <assign>
   def local_assign(self):
     self.expect(TOK_LOCAL)
     left = self.expr()
     self.expect(TOK_ASSIGN)
+    self.check_assign_target(left)
     right = self.expr()
     return LocalAssignment(left, right, line=self.previous_token().line)
 
@@ -282,19 +304,24 @@ class Parser:
       left = self.expr()
       if self.match(TOK_ASSIGN):
         # Handle assignment
+        self.check_assign_target(left)
         right = self.expr()
         return Assignment(left, right, line=self.previous_token().line)
-      else:
+      elif isinstance(left, FuncCall):
         # Handle function call statement (special type of statement that wraps a FuncCall expression)
         return FuncCallStmt(left)
+      else:
+        parse_error(f'Expected an assignment or a function call.', left.line)
 
   def stmts(self):
     stmts = []
     # Loop all statements of the current block (meaning until we find an "end", or "else", or EOF
-    while self.curr < len(self.tokens) and not self.is_next(TOK_ELSE) and not self.is_next(TOK_END):
+    while not self.is_at_end() and not self.is_next(TOK_ELSE) and not self.is_next(TOK_END):
       stmt = self.stmt()
       stmts.append(stmt)
-    return Stmts(stmts, line=self.previous_token().line)
+    # An empty (or comment-only) program has no tokens at all, and it is a valid program that does nothing
+    line = self.previous_token().line if self.previous_token() is not None else 1
+    return Stmts(stmts, line=line)
 
   # <program>  ::=  <stmt>*
   def program(self):
@@ -0,0 +1,114 @@
+# The peephole optimizer runs over the symbolic code that comes out of the compiler (before the
+# assembler resolves labels), and fuses frequent short sequences of instructions into a single
+# superinstruction so the VM executes fewer dispatches:
+#
+#      ('POP',) ('POP',) ('POP',)                          -->  ('POPN', 3)
+#      ('LOAD_LOCAL', a) ('LOAD_LOCAL', b)                 -->  ('LOAD_LOCAL2', (a, b))
+#      ('LOAD_GLOBAL', a) ('LOAD_GLOBAL', b)               -->  ('LOAD_GLOBAL2', (a, b))
+#      ('PUSH', (TYPE_NUMBER, c)) ('ADD_NUM',)             -->  ('ADD_NUM_CONST', c)
+#      ('PUSH', (TYPE_NUMBER, c)) ('SUB_NUM',)             -->  ('SUB_NUM_CONST', c)
+#      ('PUSH', (TYPE_NUMBER, c)) ('MUL_NUM',)             -->  ('MUL_NUM_CONST', c)
+#      ('PUSH', (TYPE_NUMBER, c)) ('DIV_NUM',)             -->  ('DIV_NUM_CONST', c)
+#      ('LT_NUM',) ('JMPZ', label)                         -->  ('JMPZ_LT_NUM', label)
+#      ('GT_NUM',) ('JMPZ', label)                         -->  ('JMPZ_GT_NUM', label)
+#      ('LE_NUM',) ('JMPZ', label)                         -->  ('JMPZ_LE_NUM', label)
+#      ('GE_NUM',) ('JMPZ', label)                         -->  ('JMPZ_GE_NUM', label)
+#      ('LOAD_LOCAL', s) ('ADD_NUM_CONST', c) ('STORE_LOCAL', s)    -->  ('INC_LOCAL', (s, c))
+#      ('LOAD_GLOBAL', s) ('ADD_NUM_CONST', c) ('STORE_GLOBAL', s)  -->  ('INC_GLOBAL', (s, c))
+#
+# The constant operand of the fused instructions is stored unboxed (as a Python float).
+#
+# A sequence is never fused across a LABEL (which may be the target of a jump), a SET_SLOT or a
+# LINE (which marks the start of a statement).
+# The set of superinstructions was chosen from the most frequent n-grams in the compiled scripts,
+# and can be re-tuned with the ngrams.py tool.
+
+from defs import *
+
+# Pseudo-instructions that break a sequence of instructions
+BARRIER_OPS = ('LABEL', 'SET_SLOT', 'LINE')
+
+# Binary numeric operations that can take their right operand as an inline constant
+CONST_OPS = {
+  'ADD_NUM': 'ADD_NUM_CONST',
+  'SUB_NUM': 'SUB_NUM_CONST',
+  'MUL_NUM': 'MUL_NUM_CONST',
+  'DIV_NUM': 'DIV_NUM_CONST',
+}
+
+# Numeric comparisons that can be fused with the conditional jump that follows them
+BRANCH_OPS = {
+  'LT_NUM': 'JMPZ_LT_NUM',
+  'GT_NUM': 'JMPZ_GT_NUM',
+  'LE_NUM': 'JMPZ_LE_NUM',
+  'GE_NUM': 'JMPZ_GE_NUM',
+}
+
+# Loads and stores that form an in-place increment
+INC_OPS = {
+  ('LOAD_LOCAL', 'STORE_LOCAL'): 'INC_LOCAL',
+  ('LOAD_GLOBAL', 'STORE_GLOBAL'): 'INC_GLOBAL',
+}
+
+class Peephole:
+  def fuse(self, window):
+    '''
+    Tries to fuse the instructions at the start of the window (a list of up to 3 instructions).
+    Returns a tuple (superinstruction, number of instructions it replaces), or None.
+    '''
+    first = window[0]
+    second = window[1] if len(window) > 1 else ('LABEL',)
+    third = window[2] if len(window) > 2 else ('LABEL',)
+
+    if first[0] == 'POP' and second[0] == 'POP':
+      return (('POPN', 2), 2)
+
+    if first[0] == 'POPN' and second[0] == 'POP':
+      return (('POPN', first[1] + 1), 2)
+
+    if first[0] == 'LOAD_LOCAL' and second[0] == 'LOAD_LOCAL':
+      return (('LOAD_LOCAL2', (first[1], second[1])), 2)
+
+    if first[0] == 'LOAD_GLOBAL' and second[0] == 'LOAD_GLOBAL':
+      return (('LOAD_GLOBAL2', (first[1], second[1])), 2)
+
+    if first[0] == 'PUSH' and first[1][0] == TYPE_NUMBER and second[0] in CONST_OPS:
+      return ((CONST_OPS[second[0]], float(first[1][1])), 2)
+
+    if first[0] in BRANCH_OPS and second[0] == 'JMPZ':
+      return ((BRANCH_OPS[first[0]], second[1]), 2)
+
+    if (first[0], third[0]) in INC_OPS and second[0] == 'ADD_NUM_CONST' and first[1] == third[1]:
+      return ((INC_OPS[(first[0], third[0])], (first[1], second[1])), 3)
+
+    return None
+
+  def optimize(self, code):
+    '''
+    Returns a new instruction list with all superinstructions fused (repeating until nothing changes)
+    '''
+    changed = True
+    while changed:
+      changed = False
+      optimized = []
+      i = 0
+      while i < len(code):
+        if code[i][0] in BARRIER_OPS:
+          optimized.append(code[i])
+          i += 1
+          continue
+        # Only consider windows that do not contain a barrier pseudo-instruction
+        window = 1
+        while window < 3 and i + window < len(code) and code[i + window][0] not in BARRIER_OPS:
+          window += 1
+        fused = self.fuse(code[i:i + window])
+        if fused is None:
+          optimized.append(code[i])
+          i += 1
+        else:
+          superinstruction, length = fused
+          optimized.append(superinstruction)
+          i += length
+          changed = True
+      code = optimized
+    return code
@@ -1,25 +1,101 @@
 import sys
+import os
+import argparse
 from utils import *
 from tokens import *
 from lexer import *
 from parser import *
+from optimizer import *
 from interpreter import *
 from compiler import *
+from peephole import *
+from assembler import *
+from bytecode import *
 from vm import *
+from regcompiler import *
+from regvm import *
+from vmprofile import *
+from interpprofile import *
 
 VERBOSE = True
 
+def compile_source(source):
+  '''
+  Runs the whole front end (lexer, parser, optimizer and compiler) and returns the assembled program
+  '''
+  tokens = Lexer(source).generate() # <-- tokens are scanned lazily, as the parser consumes them
+  ast = Parser(tokens).parse()
+  ast = Optimizer().optimize(ast)
+  code = Peephole().optimize(Compiler().generate_code(ast))
+  return Assembler().assemble(code)
+
 if __name__ == '__main__':
-  if len(sys.argv) != 2:
-    raise SystemExit('Usage: python3 pinky.py <filename>')
-  filename = sys.argv[1]
+  argparser = argparse.ArgumentParser(description='Run a Pinky program.')
+  argparser.add_argument('filename', help='Pinky source file')
+  argparser.add_argument('-q', '--quiet', action='store_true', help='only run the program on the VM (using the bytecode cache)')
+  argparser.add_argument('--no-cache', action='store_true', help='always compile the program (do not read or write the bytecode cache)')
+  argparser.add_argument('--register', action='store_true', help='with --quiet, run the program on the register VM instead (never cached)')
+  argparser.add_argument('--interpret', action='store_true', help='with --quiet, run the program on the tree-walking interpreter instead')
+  argparser.add_argument('--profile', action='store_true', help='with --quiet, profile the run on the VM (or the interpreter) and print the report to stderr')
+  argparser.add_argument('--collapsed', metavar='FILE', help='with --profile, save the collapsed stacks of the VM (for flame graphs) to a file')
+  argparser.add_argument('--sort', choices=SORT_KEYS, default='self', help='with --interpret --profile, sort the report by self time, total time or count')
+  argparser.add_argument('--profile-json', metavar='FILE', help='with --interpret --profile, save the profile as JSON')
+  argparser.add_argument('-o', '--output', metavar='FILE', help='write the output of the program to a file instead of the standard output')
+  args = argparser.parse_args()
+  filename = args.filename
+  if args.quiet:
+    VERBOSE = False
 
   with open(filename) as file:
     source = file.read()
-    tokens = Lexer(source).tokenize()
-    ast = Parser(tokens).parse()
 
-    if VERBOSE:
+  # The program prints through a buffered output, flushed when it halts or fails
+  output_file = open(args.output, 'w') if args.output else None
+  output = Output(output_file)
+
+  # Errors are raised as exceptions (see utils.py); the command line reports them and exits with 1
+  try:
+    if not VERBOSE and args.register:
+      tokens = Lexer(source).generate()
+      ast = Parser(tokens).parse()
+      ast = Optimizer().optimize(ast)
+      RegisterVM(output).run(RegisterCompiler().generate_code(ast))
+
+    elif not VERBOSE and args.interpret:
+      tokens = Lexer(source).generate()
+      ast = Parser(tokens).parse()
+      ast = Optimizer().optimize(ast)
+      if args.profile:
+        profiler = InterpreterProfiler(output, source)
+        profiler.interpret_ast(ast)
+        profiler.report(sort=args.sort, file=sys.stderr)
+        if args.profile_json:
+          profiler.save_json(args.profile_json, sort=args.sort)
+      else:
+        Interpreter(output).interpret_ast(ast)
+
+    elif not VERBOSE:
+      # Unchanged scripts are loaded from the bytecode cache and skip the front end entirely
+      cache = BytecodeCache(os.path.join(os.path.dirname(filename), '__pinkycache__'))
+      program = None if args.no_cache else cache.load(source)
+      if program is None:
+        program = compile_source(source)
+        if not args.no_cache:
+          cache.store(source, program)
+      if args.profile:
+        profiler = VMProfiler()
+        VM(output).run(program, profiler)
+        profiler.report(file=sys.stderr)
+        if args.collapsed:
+          profiler.save_collapsed(args.collapsed)
+      else:
+        VM(output).run(program)
+
+    else:
+      tokens = Lexer(source).tokenize()
+      ast = Parser(tokens).parse()
+      ast = Optimizer().optimize(ast)
+
       print(f'{Colors.MAGENTA}***************************************{Colors.WHITE}')
       print(f'{Colors.MAGENTA}SOURCE:{Colors.WHITE}')
       print(f'{Colors.MAGENTA}***************************************{Colors.WHITE}')
@@ -41,7 +117,7 @@ if __name__ == '__main__':
       print(f'{Colors.MAGENTA}INTERPRETER:{Colors.WHITE}')
       print(f'{Colors.MAGENTA}***************************************{Colors.WHITE}')
 
-      interpreter = Interpreter()
+      interpreter = Interpreter(output)
       interpreter.interpret_ast(ast)
 
       print()
@@ -53,5 +129,15 @@ if __name__ == '__main__':
       code = compiler.generate_code(ast)
       compiler.print_code()
 
-      vm = VM()
+      code = Peephole().optimize(code)
+
+      vm = VM(output)
       vm.run(code)
+
+  except PinkyError as error:
+    report_error(error)
+    sys.exit(1)
+
+  finally:
+    if output_file is not None:
+      output_file.close()
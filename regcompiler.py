@@ -0,0 +1,442 @@
+from defs import *
+from model import *
+from tokens import *
+from utils import *
+from inference import *
+from assembler import *
+from compiler import *
+
+###############################################################################
+# The register compiler generates three-address code for the register VM (see regvm.py) from the
+# same AST as the stack compiler, with the same (static) scoping rules: variables created at the
+# top level are globals, variables created inside blocks and functions are locals.
+#
+# Every function call gets its own array of registers, laid out at compile time:
+#
+#      [ params | locals and temporaries | constants ]
+#
+# Locals get a register when they are created and give it back at the end of their block, and
+# temporaries are allocated like a stack while an expression is compiled. The constants used by a
+# function live in the last registers of its frame and are copied there when the frame is created,
+# so every operand of an instruction is a register and no instruction ever loads a constant.
+# The globals are the registers of the top-level frame, which functions access with GETG/SETG.
+###############################################################################
+
+# Instructions whose last operand is a label (resolved to a PC by the assembler)
+REG_JUMP_OPS = ('JMP', 'JMPZ', 'JMPZ_LT_NUM', 'JMPZ_GT_NUM', 'JMPZ_LE_NUM', 'JMPZ_GE_NUM',
+                'FORPREP', 'FORPREP_STEP', 'FORLOOP', 'CALL')
+
+# Binary operators, as (generic, specialised for numbers) opcodes
+REG_BINARY_OPS = {
+  TOK_PLUS:  ('ADD', 'ADD_NUM'),
+  TOK_MINUS: ('SUB', 'SUB_NUM'),
+  TOK_STAR:  ('MUL', 'MUL_NUM'),
+  TOK_SLASH: ('DIV', 'DIV_NUM'),
+  TOK_CARET: ('EXP', 'EXP'),
+  TOK_MOD:   ('MOD', 'MOD_NUM'),
+  TOK_LT:    ('LT',  'LT_NUM'),
+  TOK_GT:    ('GT',  'GT_NUM'),
+  TOK_LE:    ('LE',  'LE_NUM'),
+  TOK_GE:    ('GE',  'GE_NUM'),
+  TOK_EQEQ:  ('EQ',  'EQ'),
+  TOK_NE:    ('NE',  'NE'),
+  TOK_AND:   ('AND', 'AND'),
+  TOK_OR:    ('OR',  'OR'),
+}
+
+# Numeric comparisons that are fused with the conditional jump of an if/while test
+REG_BRANCH_OPS = {
+  TOK_LT: 'JMPZ_LT_NUM',
+  TOK_GT: 'JMPZ_GT_NUM',
+  TOK_LE: 'JMPZ_LE_NUM',
+  TOK_GE: 'JMPZ_GE_NUM',
+}
+
+class RegisterSymbol:
+  def __init__(self, name, reg, depth=0):
+    self.name = name
+    self.reg = reg
+    self.depth = depth
+
+class RegisterFrame:
+  '''
+  The register layout of the top-level code or of a function, built while it is compiled
+  '''
+  def __init__(self, name, nparams=0):
+    self.name = name
+    self.nparams = nparams
+    self.code = []
+    self.locals = []
+    self.depth = 0
+    self.next_reg = 0
+    self.max_reg = 0
+    self.constants = []
+    self.constant_index = {}
+
+  def alloc(self, count=1):
+    reg = self.next_reg
+    self.next_reg += count
+    self.max_reg = max(self.max_reg, self.next_reg)
+    return reg
+
+  def constant(self, value):
+    '''
+    Returns the (provisional) register of a constant: constants are numbered -1, -2, ... until the
+    frame size is known, and then moved to the registers that follow the locals and temporaries
+    '''
+    key = (value[0], value[1])
+    if key not in self.constant_index:
+      self.constants.append(value)
+      self.constant_index[key] = -len(self.constants)
+    return self.constant_index[key]
+
+  def layout(self):
+    '''
+    The frame descriptor used by the VM to create the registers: (params, registers, constants)
+    '''
+    return (self.nparams, self.max_reg + len(self.constants), tuple(self.constants))
+
+  def finish(self):
+    # Move the constants after the locals and temporaries (the only negative operands are constants)
+    code = []
+    for instruction in self.code:
+      code.append(tuple(self.max_reg - 1 - arg if type(arg) is int and arg < 0 else arg for arg in instruction))
+    return code
+
+class RegisterCompiler:
+  def __init__(self):
+    self.globals = []
+    self.functions = []
+    self.layouts = {}
+    self.func_code = []
+    self.label_counter = 0
+    self.frame = None
+    self.main = None
+    self.types = TypeInference()
+
+  def make_label(self):
+    self.label_counter += 1
+    return f'LBL{self.label_counter}'
+
+  def emit(self, instruction):
+    self.frame.code.append(instruction)
+
+  def get_func_symbol(self, name):
+    for symbol in reversed(self.functions):
+      if symbol.name == name:
+        return symbol
+
+  def get_var_symbol(self, name):
+    '''
+    Returns the symbol of a variable and whether it is a global accessed from inside a function
+    '''
+    for symbol in reversed(self.frame.locals):
+      if symbol.name == name:
+        return (symbol, False)
+    for symbol in reversed(self.globals):
+      if symbol.name == name:
+        return (symbol, self.frame is not self.main)
+    return None
+
+  def new_var(self, name):
+    '''
+    Creates a variable in the current scope and returns its symbol (which is only made visible by
+    declare_var, so the value of the variable can be compiled first)
+    '''
+    return RegisterSymbol(name, self.frame.alloc(), self.frame.depth)
+
+  def declare_var(self, symbol, local=False):
+    if self.frame is self.main and symbol.depth == 0 and not local:
+      self.globals.append(symbol)
+    else:
+      self.frame.locals.append(symbol)
+
+  def begin_block(self):
+    self.frame.depth += 1
+
+  def end_block(self):
+    self.frame.depth -= 1
+    # Remove the locals that are deeper than the current scope and give their registers back
+    while len(self.frame.locals) > 0 and self.frame.locals[-1].depth > self.frame.depth:
+      self.frame.next_reg = self.frame.locals.pop().reg
+
+  def has_call(self, node):
+    if isinstance(node, FuncCall):
+      return True
+    if isinstance(node, (BinOp, LogicalOp)):
+      return self.has_call(node.left) or self.has_call(node.right)
+    if isinstance(node, UnOp):
+      return self.has_call(node.operand)
+    if isinstance(node, Grouping):
+      return self.has_call(node.value)
+    return False
+
+  def is_number(self, node):
+    return self.types.type_of(node) == TYPE_NUMBER
+
+  def compile_operands(self, node):
+    '''
+    Compiles both operands of a binary operation and returns their registers
+    '''
+    mark = self.frame.next_reg
+    left = self.compile_expr(node.left)
+    if 0 <= left < mark and self.has_call(node.right):
+      # The right operand calls a function that may change the variable, so read it now
+      temp = self.frame.alloc()
+      self.emit(('MOVE', temp, left))
+      left = temp
+    right = self.compile_expr(node.right)
+    self.frame.next_reg = mark
+    return left, right
+
+  def compile_expr(self, node, dst=None):
+    '''
+    Compiles an expression and returns the register that holds its value. When a destination
+    register is given, the value is always stored into it.
+    '''
+    if isinstance(node, (Integer, Float)):
+      reg = self.frame.constant((TYPE_NUMBER, float(node.value)))
+
+    elif isinstance(node, Bool):
+      reg = self.frame.constant((TYPE_BOOL, True if node.value == True or node.value == 'true' else False))
+
+    elif isinstance(node, String):
+      reg = self.frame.constant((TYPE_STRING, stringify(node.value)))
+
+    elif isinstance(node, Identifier):
+      symbol = self.get_var_symbol(node.name)
+      if not symbol:
+        compile_error(f'Variable {node.name} is not defined.', node.line)
+      sym, is_global = symbol
+      if not is_global:
+        reg = sym.reg
+      else:
+        reg = self.frame.alloc() if dst is None else dst
+        self.emit(('GETG', reg, sym.reg))
+
+    elif isinstance(node, Grouping):
+      return self.compile_expr(node.value, dst)
+
+    elif isinstance(node, (BinOp, LogicalOp)):
+      left, right = self.compile_operands(node)
+      generic, numeric = REG_BINARY_OPS[node.op.token_type]
+      opcode = numeric if self.is_number(node.left) and self.is_number(node.right) else generic
+      reg = self.frame.alloc() if dst is None else dst
+      self.emit((opcode, reg, left, right))
+
+    elif isinstance(node, UnOp):
+      mark = self.frame.next_reg
+      operand = self.compile_expr(node.operand)
+      self.frame.next_reg = mark
+      reg = self.frame.alloc() if dst is None else dst
+      if node.op.token_type == TOK_MINUS:
+        self.emit(('NEG', reg, operand))
+      elif node.op.token_type == TOK_NOT:
+        self.emit(('NOT', reg, operand))
+      else:
+        self.emit(('MOVE', reg, operand))
+
+    elif isinstance(node, FuncCall):
+      func = self.get_func_symbol(node.name)
+      if not func:
+        compile_error(f'Not found declaration for function {node.name}', node.line)
+      if func.arity != len(node.args):
+        compile_error(f'Function expected {func.arity} params but {len(node.args)} args were passed', node.line)
+      # The arguments are evaluated into consecutive registers, which become the params of the callee
+      mark = self.frame.next_reg
+      base = self.frame.alloc(max(len(node.args), 1))
+      for index, arg in enumerate(node.args):
+        self.compile_expr(arg, base + index)
+      self.emit(('CALL', base, node.name, node.name))
+      self.frame.next_reg = mark
+      reg = self.frame.alloc() if dst is None else dst
+      if reg != base:
+        self.emit(('MOVE', reg, base))
+
+    if dst is not None and reg != dst:
+      self.emit(('MOVE', dst, reg))
+      return dst
+    return reg
+
+  def compile_test(self, node, label):
+    '''
+    Compiles the test of an if/while and jumps to the label when it is false
+    '''
+    while isinstance(node, Grouping):
+      node = node.value
+    mark = self.frame.next_reg
+    if isinstance(node, BinOp) and node.op.token_type in REG_BRANCH_OPS and self.is_number(node.left) and self.is_number(node.right):
+      left, right = self.compile_operands(node)
+      self.emit((REG_BRANCH_OPS[node.op.token_type], left, right, label))
+    else:
+      self.emit(('JMPZ', self.compile_expr(node), label))
+    self.frame.next_reg = mark
+
+  def compile_block(self, node):
+    self.begin_block()
+    self.compile(node)
+    self.end_block()
+
+  def compile_assignment(self, name, node, local=False):
+    '''
+    Compiles the assignment of an expression to a variable (creating it if needed)
+    '''
+    symbol = None if local else self.get_var_symbol(name)
+    if not symbol:
+      new_symbol = self.new_var(name)
+      self.compile_expr(node, new_symbol.reg)
+      self.declare_var(new_symbol, local)
+    else:
+      sym, is_global = symbol
+      if is_global:
+        mark = self.frame.next_reg
+        self.emit(('SETG', sym.reg, self.compile_expr(node)))
+        self.frame.next_reg = mark
+      else:
+        self.compile_expr(node, sym.reg)
+
+  def compile_for(self, node):
+    # The loop variable is assigned in the scope of the for statement (like the interpreter does)
+    symbol = self.get_var_symbol(node.ident.name)
+    new_symbol = None
+    if not symbol:
+      new_symbol = self.new_var(node.ident.name)
+      symbol = (new_symbol, False)
+    sym, is_global = symbol
+
+    # Four consecutive registers hold the counter, the end value, the step and the direction
+    base = self.frame.alloc(4)
+    var = base if is_global else sym.reg
+    body_label = self.make_label()
+    exit_label = self.make_label()
+    self.compile_expr(node.start, base)
+    self.compile_expr(node.end, base + 1)
+    if node.step is None:
+      self.emit(('FORPREP', base, var, exit_label))
+    else:
+      self.compile_expr(node.step, base + 2)
+      self.emit(('FORPREP_STEP', base, var, exit_label))
+    if new_symbol:
+      self.declare_var(new_symbol)
+    self.emit(('LABEL', body_label))
+    if is_global:
+      self.emit(('SETG', sym.reg, base))
+    self.compile_block(node.body_stmts)
+    self.emit(('FORLOOP', base, var, body_label))
+    self.emit(('LABEL', exit_label))
+    self.frame.next_reg = base
+
+  def compile_func_decl(self, node):
+    var = self.get_var_symbol(node.name)
+    func = self.get_func_symbol(node.name)
+    if func:
+      compile_error(f'A function with the name {node.name} was already declared.', node.line)
+    if var:
+      compile_error(f'A variable with the name {node.name} was already defined in this scope.', node.line)
+    self.functions.append(Symbol(node.name, symtype=SYM_FUNC, arity=len(node.params)))
+
+    # The body is compiled into its own frame (and its code is placed after the top-level code)
+    outer = self.frame
+    self.frame = RegisterFrame(node.name, len(node.params))
+    self.begin_block()
+    for param in node.params:
+      self.frame.locals.append(RegisterSymbol(param.name, self.frame.alloc(), self.frame.depth))
+    self.emit(('LABEL', node.name))
+    self.compile(node.body_stmts)
+    self.emit(('RET', self.frame.constant((TYPE_NUMBER, 0.0))))
+    self.end_block()
+    self.layouts[node.name] = self.frame.layout()
+    self.func_code.extend(self.frame.finish())
+    self.frame = outer
+
+  def compile(self, node):
+    if isinstance(node, Stmts):
+      for stmt in node.stmts:
+        # Record the source line of each statement (the assembler collects these into a line table)
+        self.emit(('LINE', statement_line(stmt)))
+        self.compile(stmt)
+
+    elif isinstance(node, PrintStmt):
+      mark = self.frame.next_reg
+      self.emit(('PRINT' if node.end == '' else 'PRINTLN', self.compile_expr(node.value)))
+      self.frame.next_reg = mark
+
+    elif isinstance(node, IfStmt):
+      else_label = self.make_label()
+      exit_label = self.make_label()
+      self.compile_test(node.test, else_label)
+      self.compile_block(node.then_stmts)
+      if node.else_stmts:
+        self.emit(('JMP', exit_label))
+        self.emit(('LABEL', else_label))
+        self.compile_block(node.else_stmts)
+        self.emit(('LABEL', exit_label))
+      else:
+        self.emit(('LABEL', else_label))
+
+    elif isinstance(node, WhileStmt):
+      test_label = self.make_label()
+      exit_label = self.make_label()
+      self.emit(('LABEL', test_label))
+      self.compile_test(node.test, exit_label)
+      self.compile_block(node.body_stmts)
+      self.emit(('JMP', test_label))
+      self.emit(('LABEL', exit_label))
+
+    elif isinstance(node, ForStmt):
+      self.compile_for(node)
+
+    elif isinstance(node, Assignment):
+      self.compile_assignment(node.left.name, node.right)
+
+    elif isinstance(node, LocalAssignment):
+      self.compile_assignment(node.left.name, node.right, local=True)
+
+    elif isinstance(node, FuncDecl):
+      self.compile_func_decl(node)
+
+    elif isinstance(node, RetStmt):
+      mark = self.frame.next_reg
+      self.emit(('RET', self.compile_expr(node.value)))
+      self.frame.next_reg = mark
+
+    elif isinstance(node, FuncCallStmt):
+      mark = self.frame.next_reg
+      self.compile_expr(node.expr)
+      self.frame.next_reg = mark
+
+  def format_operand(self, arg):
+    if isinstance(arg, tuple):
+      params, size, constants = arg
+      return f'({params} params, {size} registers, constants: {", ".join(stringify(value) for _, value in constants)})'
+    return str(arg)
+
+  def print_code(self, code):
+    i = 0
+    for instruction in code:
+      if instruction[0] == 'LINE':
+        continue
+      if instruction[0] == 'LABEL':
+        print(f'{i:08} {instruction[1]}:')
+        continue
+      opcode, *args = instruction
+      print(f'{i:08}     {opcode} {" ".join(self.format_operand(arg) for arg in args)}'.rstrip())
+      i += 1
+
+  def generate_code(self, node):
+    self.types = TypeInference().infer(node)
+    self.frame = self.main = RegisterFrame('START')
+    self.emit(('LABEL', 'START'))
+    self.emit(('ENTER', 'START'))
+    self.compile(node)
+    self.emit(('HALT',))
+    self.layouts['START'] = self.main.layout()
+    # Replace the function names by the register layouts of the frames they create
+    code = []
+    for instruction in self.main.finish() + self.func_code:
+      if instruction[0] == 'ENTER':
+        instruction = ('ENTER', self.layouts[instruction[1]])
+      elif instruction[0] == 'CALL':
+        instruction = ('CALL', instruction[1], self.layouts[instruction[2]], instruction[3])
+      code.append(instruction)
+    return code
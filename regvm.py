@@ -0,0 +1,336 @@
+# The register VM executes three-address code: every instruction names the registers it reads and
+# the register it writes, so an expression like x := x + 1 is a single instruction instead of the
+# four instructions (LOAD, PUSH, ADD, STORE) of the stack VM.
+#
+# Every function call has its own frame, a Python list of registers laid out by the register
+# compiler (see regcompiler.py): the params first, then the locals and temporaries, and then the
+# constants of the function. The frame of the top-level code holds the global variables.
+#
+# Registers hold unboxed values (a Python float, str or bool), like the stack of the stack VM.
+#
+# Instructions to move values between registers (a, b and c are registers)
+#
+#      ('MOVE', a, b)                  # a = b
+#      ('GETG', a, g)                  # a = global variable g (a register of the top-level frame)
+#      ('SETG', g, b)                  # global variable g = b
+#
+# Arithmetic, comparison and logical instructions, with the same runtime type checks as the
+# instructions of the stack VM
+#
+#      ('ADD', a, b, c)                # a = b + c
+#      ('SUB', a, b, c)  ('MUL', a, b, c)  ('DIV', a, b, c)  ('EXP', a, b, c)  ('MOD', a, b, c)
+#      ('AND', a, b, c)  ('OR', a, b, c)
+#      ('LT', a, b, c)   ('GT', a, b, c)   ('LE', a, b, c)   ('GE', a, b, c)
+#      ('EQ', a, b, c)   ('NE', a, b, c)
+#      ('NEG', a, b)                   # a = -b
+#      ('NOT', a, b)                   # a = ~b
+#
+# Specialised versions emitted when both operands are statically known to be numbers
+#
+#      ('ADD_NUM', a, b, c)  ('SUB_NUM', a, b, c)  ('MUL_NUM', a, b, c)  ('DIV_NUM', a, b, c)
+#      ('MOD_NUM', a, b, c)  ('LT_NUM', a, b, c)   ('GT_NUM', a, b, c)   ('LE_NUM', a, b, c)
+#      ('GE_NUM', a, b, c)
+#
+# Control flow
+#
+#      ('JMP', pc)                     # Unconditionally jump to an absolute PC
+#      ('JMPZ', a, pc)                 # Jump if a is zero (or false)
+#      ('JMPZ_LT_NUM', a, b, pc)       # Jump if the comparison of the numbers a and b is false
+#      ('JMPZ_GT_NUM', a, b, pc)
+#      ('JMPZ_LE_NUM', a, b, pc)
+#      ('JMPZ_GE_NUM', a, b, pc)
+#      ('FORPREP', a, v, pc)           # Start a for loop (see below), or jump to pc if it runs zero times
+#      ('FORPREP_STEP', a, v, pc)
+#      ('FORLOOP', a, v, pc)           # Step the counter of a for loop and jump back to pc if it is in range
+#      ('CALL', a, layout, pc)         # Call the function at pc with the args in a, a+1, ... (the result goes to a)
+#      ('RET', a)                      # Return a from the function
+#      ('PRINT', a)  ('PRINTLN', a)
+#      ('ENTER', layout)               # Create the frame of the top-level code
+#      ('HALT',)
+#
+# A for loop keeps its counter, end value, step and direction in the registers a, a+1, a+2 and a+3,
+# and copies the counter into the register v of the loop variable on every iteration. The step is
+# evaluated by the compiler (FORPREP_STEP) or defaults to 1 or -1 depending on the direction of the
+# loop (FORPREP), as in the interpreter.
+#
+# The layout of a frame is (number of params, number of registers, constants).
+
+from defs import *
+from utils import *
+from assembler import *
+from vm import *
+from regcompiler import *
+
+###############################################################################
+# Opcode names of the register VM, indexed by their integer opcode
+###############################################################################
+REG_OPCODE_NAMES = [
+  'MOVE', 'GETG', 'SETG', 'ADD', 'SUB', 'MUL', 'DIV', 'EXP', 'MOD', 'AND', 'OR', 'LT', 'GT', 'LE',
+  'GE', 'EQ', 'NE', 'NEG', 'NOT', 'ADD_NUM', 'SUB_NUM', 'MUL_NUM', 'DIV_NUM', 'MOD_NUM', 'LT_NUM',
+  'GT_NUM', 'LE_NUM', 'GE_NUM', 'JMP', 'JMPZ', 'JMPZ_LT_NUM', 'JMPZ_GT_NUM', 'JMPZ_LE_NUM',
+  'JMPZ_GE_NUM', 'FORPREP', 'FORPREP_STEP', 'FORLOOP', 'CALL', 'RET', 'PRINT', 'PRINTLN', 'ENTER',
+  'HALT',
+]
+
+###############################################################################
+# Dictionary mapping register VM opcode names to their integer opcodes
+###############################################################################
+reg_opcodes = {name: op for op, name in enumerate(REG_OPCODE_NAMES)}
+
+ROP_MOVE         = reg_opcodes['MOVE']
+ROP_GETG         = reg_opcodes['GETG']
+ROP_SETG         = reg_opcodes['SETG']
+ROP_NEG          = reg_opcodes['NEG']
+ROP_NOT          = reg_opcodes['NOT']
+ROP_ADD_NUM      = reg_opcodes['ADD_NUM']
+ROP_SUB_NUM      = reg_opcodes['SUB_NUM']
+ROP_MUL_NUM      = reg_opcodes['MUL_NUM']
+ROP_DIV_NUM      = reg_opcodes['DIV_NUM']
+ROP_MOD_NUM      = reg_opcodes['MOD_NUM']
+ROP_LT_NUM       = reg_opcodes['LT_NUM']
+ROP_GT_NUM       = reg_opcodes['GT_NUM']
+ROP_LE_NUM       = reg_opcodes['LE_NUM']
+ROP_GE_NUM       = reg_opcodes['GE_NUM']
+ROP_JMP          = reg_opcodes['JMP']
+ROP_JMPZ         = reg_opcodes['JMPZ']
+ROP_JMPZ_LT_NUM  = reg_opcodes['JMPZ_LT_NUM']
+ROP_JMPZ_GT_NUM  = reg_opcodes['JMPZ_GT_NUM']
+ROP_JMPZ_LE_NUM  = reg_opcodes['JMPZ_LE_NUM']
+ROP_JMPZ_GE_NUM  = reg_opcodes['JMPZ_GE_NUM']
+ROP_FORPREP      = reg_opcodes['FORPREP']
+ROP_FORPREP_STEP = reg_opcodes['FORPREP_STEP']
+ROP_FORLOOP      = reg_opcodes['FORLOOP']
+ROP_CALL         = reg_opcodes['CALL']
+ROP_RET          = reg_opcodes['RET']
+ROP_PRINT        = reg_opcodes['PRINT']
+ROP_PRINTLN      = reg_opcodes['PRINTLN']
+ROP_ENTER        = reg_opcodes['ENTER']
+ROP_HALT         = reg_opcodes['HALT']
+
+def make_registers(layout):
+  '''
+  Returns the registers of a new frame (without its params): the unset registers and the constants
+  '''
+  params, size, constants = layout
+  return [None] * (size - params - len(constants)) + [unbox(value) for value in constants]
+
+class RegisterVM:
+  def __init__(self, output=None):
+    self.frames = []
+    self.program = None
+    self.output = Output() if output is None else output # <-- the sink of PRINT/PRINTLN
+
+  def prepare(self, instructions):
+    '''
+    Translate the instruction list into (opcode, a, b, c) tuples, where the opcode is an integer
+    and the frame layouts are replaced by (params, registers) pairs ready to create the frames
+    '''
+    prepared = []
+    for instruction in instructions:
+      opcode, *args = instruction
+      if opcode not in reg_opcodes:
+        self.error(f'Unknown opcode {opcode!r}.', len(prepared))
+      if opcode == 'ENTER':
+        args = [make_registers(args[0])]
+      elif opcode == 'CALL':
+        args[1] = (args[1][0], make_registers(args[1]))
+      args += [None] * (3 - len(args))
+      prepared.append((reg_opcodes[opcode], *args))
+    return prepared
+
+  def error(self, message, pc):
+    vm_error(message, pc, self.program.label_for(pc), self.program.line_for(pc))
+
+  def assemble(self, instructions):
+    return Assembler(REG_JUMP_OPS).assemble(instructions)
+
+  def run(self, instructions):
+    # Accept either an assembled program or the symbolic code that comes out of the register compiler
+    if isinstance(instructions, Program):
+      self.program = instructions
+    else:
+      self.program = self.assemble(instructions)
+    try:
+      self.execute(self.prepare(self.program.code))
+    except ArithmeticError as exception:
+      self.error(arithmetic_error_message(exception), loop_pc(exception, self.execute))
+    finally:
+      self.output.flush()
+
+  def execute(self, code):
+    '''
+    The dispatch loop. Frequent instructions are handled inline, and the generic (type checked)
+    binary operations call the handler methods below, which return the result.
+    '''
+    handlers = [getattr(self, name, None) for name in REG_OPCODE_NAMES]
+    frames = self.frames
+    write = self.output.write
+    regs = global_regs = []
+    pc = 0
+
+    while True:
+      op, a, b, c = code[pc]
+      pc += 1
+      if op == ROP_MOVE:
+        regs[a] = regs[b]
+      elif op == ROP_ADD_NUM:
+        regs[a] = regs[b] + regs[c]
+      elif op == ROP_MUL_NUM:
+        regs[a] = regs[b] * regs[c]
+      elif op == ROP_SUB_NUM:
+        regs[a] = regs[b] - regs[c]
+      elif op == ROP_DIV_NUM:
+        regs[a] = regs[b] / regs[c]
+      elif op == ROP_JMPZ_LT_NUM:
+        if not regs[a] < regs[b]:
+          pc = c
+      elif op == ROP_JMPZ_GT_NUM:
+        if not regs[a] > regs[b]:
+          pc = c
+      elif op == ROP_JMPZ_LE_NUM:
+        if not regs[a] <= regs[b]:
+          pc = c
+      elif op == ROP_JMPZ_GE_NUM:
+        if not regs[a] >= regs[b]:
+          pc = c
+      elif op == ROP_JMP:
+        pc = a
+      elif op == ROP_FORLOOP:
+        i = regs[a] + regs[a + 2]
+        regs[a] = i
+        if i <= regs[a + 1] if regs[a + 3] else i >= regs[a + 1]:
+          regs[b] = i
+          pc = c
+      elif op == ROP_GETG:
+        regs[a] = global_regs[b]
+      elif op == ROP_SETG:
+        global_regs[a] = regs[b]
+      elif op == ROP_CALL:
+        frames.append((pc, regs, a))
+        regs = regs[a:a + b[0]] + b[1]
+        pc = c
+      elif op == ROP_RET:
+        if not frames:
+          break
+        result = regs[a]
+        pc, regs, a = frames.pop()
+        regs[a] = result
+      elif op == ROP_JMPZ:
+        val = regs[a]
+        if val == 0 or val == False:
+          pc = b
+      elif op == ROP_MOD_NUM:
+        regs[a] = regs[b] % regs[c]
+      elif op == ROP_LT_NUM:
+        regs[a] = regs[b] < regs[c]
+      elif op == ROP_GT_NUM:
+        regs[a] = regs[b] > regs[c]
+      elif op == ROP_LE_NUM:
+        regs[a] = regs[b] <= regs[c]
+      elif op == ROP_GE_NUM:
+        regs[a] = regs[b] >= regs[c]
+      elif op == ROP_PRINT:
+        write(stringify(regs[a]))
+      elif op == ROP_PRINTLN:
+        write(stringify(regs[a]) + '\n')
+      elif op == ROP_NEG:
+        operand = regs[b]
+        if type(operand) is not float:
+          self.error(f'Error on NEG between {type_of(operand)}', pc - 1)
+        regs[a] = -operand
+      elif op == ROP_NOT:
+        operand = regs[b]
+        if type(operand) is not bool:
+          self.error(f'Error on XOR between {type_of(operand)} and {TYPE_BOOL}', pc - 1)
+        regs[a] = not operand
+      elif op == ROP_FORPREP or op == ROP_FORPREP_STEP:
+        start = regs[a]
+        if type(start) is not float or type(regs[a + 1]) is not float or (op == ROP_FORPREP_STEP and type(regs[a + 2]) is not float):
+          self.error(f'For loop start, end and step must be numbers.', pc - 1)
+        up = start < regs[a + 1]
+        if op == ROP_FORPREP:
+          regs[a + 2] = 1.0 if up else -1.0
+        regs[a + 3] = up
+        if start <= regs[a + 1] if up else start >= regs[a + 1]:
+          regs[b] = start
+        else:
+          pc = c
+      elif op == ROP_ENTER:
+        regs = global_regs = list(a)
+      elif op == ROP_HALT:
+        self.output.flush()
+        break
+      else:
+        regs[a] = handlers[op](regs[b], regs[c], pc - 1)
+
+  def ADD(self, left, right, pc):
+    if type(left) is float and type(right) is float:
+      return left + right
+    if type(left) is str or type(right) is str:
+      return stringify(left) + stringify(right)
+    self.error(f'Error on ADD between {type_of(left)} and {type_of(right)}.', pc)
+
+  def SUB(self, left, right, pc):
+    if type(left) is float and type(right) is float:
+      return left - right
+    self.error(f'Error on SUB between {type_of(left)} and {type_of(right)}.', pc)
+
+  def MUL(self, left, right, pc):
+    if type(left) is float and type(right) is float:
+      return left * right
+    self.error(f'Error on MUL between {type_of(left)} and {type_of(right)}.', pc)
+
+  def DIV(self, left, right, pc):
+    if type(left) is float and type(right) is float:
+      return left / right
+    self.error(f'Error on DIV between {type_of(left)} and {type_of(right)}.', pc)
+
+  def EXP(self, left, right, pc):
+    if type(left) is float and type(right) is float:
+      return left ** right
+    self.error(f'Error on EXP between {type_of(left)} and {type_of(right)}', pc)
+
+  def MOD(self, left, right, pc):
+    if type(left) is float and type(right) is float:
+      return left % right
+    self.error(f'Error on MOD between {type_of(left)} and {type_of(right)}', pc)
+
+  def AND(self, left, right, pc):
+    if type(left) is bool and type(right) is bool: # <-- the bitwise operators of Python are not defined on floats
+      return left & right
+    self.error(f'Error on AND between {type_of(left)} and {type_of(right)}', pc)
+
+  def OR(self, left, right, pc):
+    if type(left) is bool and type(right) is bool: # <-- the bitwise operators of Python are not defined on floats
+      return left | right
+    self.error(f'Error on OR between {type_of(left)} and {type_of(right)}', pc)
+
+  def LT(self, left, right, pc):
+    if type(left) is type(right) and type(left) is not bool:
+      return left < right
+    self.error(f'Error on LT between {type_of(left)} and {type_of(right)}', pc)
+
+  def GT(self, left, right, pc):
+    if type(left) is type(right) and type(left) is not bool:
+      return left > right
+    self.error(f'Error on GT between {type_of(left)} and {type_of(right)}', pc)
+
+  def LE(self, left, right, pc):
+    if type(left) is type(right) and type(left) is not bool:
+      return left <= right
+    self.error(f'Error on LE between {type_of(left)} and {type_of(right)}', pc)
+
+  def GE(self, left, right, pc):
+    if type(left) is type(right) and type(left) is not bool:
+      return left >= right
+    self.error(f'Error on GE between {type_of(left)} and {type_of(right)}', pc)
+
+  def EQ(self, left, right, pc):
+    if type(left) is type(right):
+      return left == right
+    self.error(f'Error on EQ between {type_of(left)} and {type_of(right)}', pc)
+
+  def NE(self, left, right, pc):
+    if type(left) is type(right):
+      return left != right
+    self.error(f'Error on NE between {type_of(left)} and {type_of(right)}', pc)
@@ -0,0 +1,210 @@
+from model import *
+
+class Scope:
+  '''
+  The slot layout of one runtime scope (the global scope, the body of a function, or the block of
+  an if, else, while or for). At runtime a scope is a frame: a Python list whose slot 0 holds the
+  parent frame, and the other slots hold the variables and functions (or None while unset).
+  A scope without slots does not need a frame, and its blocks run in the frame of the parent.
+  '''
+  def __init__(self, parent=None):
+    self.parent = parent
+    self.vars = {}   # Variable name -> slot index
+    self.funcs = {}  # Function name -> slot index
+    self.size = 1    # Slot 0 is the parent frame
+
+  def declare(self, table, name):
+    table = getattr(self, table)
+    if name not in table:
+      table[name] = self.size
+      self.size += 1
+    return table[name]
+
+  def has_frame(self):
+    return self.size > 1
+
+def load_slot(frame, candidates):
+  '''
+  Returns the value of the first set slot among the (depth, index) candidates of a frame (or None)
+  '''
+  current = 0
+  for depth, index in candidates:
+    while current < depth:
+      frame = frame[0]
+      current += 1
+    value = frame[index]
+    if value is not None:
+      return value
+  return None
+
+def store_slot(frame, candidates, value):
+  '''
+  Writes a value to the first set slot among the candidates of a frame (or to the first candidate,
+  which is in the current scope, when none of them is set)
+  '''
+  first = frame
+  current = 0
+  for depth, index in candidates:
+    while current < depth:
+      frame = frame[0]
+      current += 1
+    if frame[index] is not None:
+      frame[index] = value
+      return
+  for _ in range(candidates[0][0]):
+    first = first[0]
+  first[candidates[0][1]] = value
+
+class Resolver:
+  '''
+  A pass over the AST that assigns a frame slot to every name that can be created in each scope,
+  and resolves every use of a name to its candidate slots.
+
+  Pinky creates variables dynamically: an assignment updates the innermost scope where the name
+  already has a value, and creates it in the current scope otherwise. So a name is resolved to a
+  tuple of (depth, index) candidates, innermost first, with one entry for each enclosing scope that
+  may hold that name. At runtime the first candidate whose slot is set is the variable (the same
+  search as a chain of name -> value dicts, one per scope, without hashing the names).
+
+  An assignment does not get a slot in its own scope when the name is already known to be set in
+  an enclosing scope (it was assigned by an earlier statement of an enclosing block), because the
+  assignment will always update that variable. This keeps most names down to a single candidate.
+
+  The slots are used by the Interpreter (through load_slot/store_slot), the closure interpreter and
+  the transpiler. The input variables of an embedded program are globals that are set before the
+  program runs, so they get the first global slots and are known to be set.
+  '''
+  def __init__(self):
+    self.scopes = {}       # id(Stmts node of a scope) -> Scope
+    self.slots = {}        # id(node) -> tuple of (depth, index) candidates
+    self.known = set()     # id(Identifier) of the reads of a variable that is known to be set
+    self.scope = None
+    self.defined = set()   # Names of the variables that are known to be set at the current point
+    self.inputs = []       # Identifier of every input variable (its slot is in the global frame)
+
+  def candidates(self, table, name):
+    result = []
+    depth = 0
+    scope = self.scope
+    while scope is not None:
+      if scope.has_frame():
+        index = getattr(scope, table).get(name)
+        if index is not None:
+          result.append((depth, index))
+        depth += 1
+      scope = scope.parent
+    return tuple(result)
+
+  def declare_block(self, node):
+    # Declares the names that the statements directly inside the block can create in its scope
+    defined = set(self.defined)
+    for stmt in node.stmts:
+      if isinstance(stmt, Assignment):
+        if stmt.left.name not in defined:
+          self.scope.declare('vars', stmt.left.name)
+        defined.add(stmt.left.name)
+      elif isinstance(stmt, LocalAssignment):
+        self.scope.declare('vars', stmt.left.name)
+        defined.add(stmt.left.name)
+      elif isinstance(stmt, ForStmt):
+        if stmt.ident.name not in defined:
+          self.scope.declare('vars', stmt.ident.name)
+      elif isinstance(stmt, FuncDecl):
+        self.scope.declare('funcs', stmt.name)
+
+  def resolve_scope(self, node, params=()):
+    '''
+    Resolves a block of statements that runs in a new scope (with the given parameters)
+    '''
+    outer_defined = self.defined
+    self.defined = set(outer_defined)
+    self.scope = Scope(self.scope)
+    for param in params:
+      self.scope.declare('vars', param.name)
+      self.defined.add(param.name)
+    self.declare_block(node)
+    for param in params:
+      self.slots[id(param)] = self.candidates('vars', param.name)[:1]
+    self.resolve(node)
+    self.scopes[id(node)] = self.scope
+    self.scope = self.scope.parent
+    self.defined = outer_defined
+
+  def resolve(self, node):
+    if isinstance(node, Identifier):
+      self.slots[id(node)] = self.candidates('vars', node.name)
+      if node.name in self.defined:
+        self.known.add(id(node))
+
+    elif isinstance(node, Grouping):
+      self.resolve(node.value)
+
+    elif isinstance(node, (BinOp, LogicalOp)):
+      self.resolve(node.left)
+      self.resolve(node.right)
+
+    elif isinstance(node, UnOp):
+      self.resolve(node.operand)
+
+    elif isinstance(node, (Assignment, LocalAssignment)):
+      self.resolve(node.right)
+      self.slots[id(node)] = self.candidates('vars', node.left.name)
+      if isinstance(node, LocalAssignment):
+        self.slots[id(node)] = self.slots[id(node)][:1] # <-- always the slot in the current scope
+      self.defined.add(node.left.name)
+
+    elif isinstance(node, Stmts):
+      for stmt in node.stmts:
+        self.resolve(stmt)
+
+    elif isinstance(node, PrintStmt):
+      self.resolve(node.value)
+
+    elif isinstance(node, IfStmt):
+      self.resolve(node.test)
+      self.resolve_scope(node.then_stmts)
+      if node.else_stmts:
+        self.resolve_scope(node.else_stmts)
+
+    elif isinstance(node, WhileStmt):
+      self.resolve(node.test)
+      self.resolve_scope(node.body_stmts)
+
+    elif isinstance(node, ForStmt):
+      self.resolve(node.start)
+      self.resolve(node.end)
+      if node.step is not None:
+        self.resolve(node.step)
+      self.slots[id(node)] = self.candidates('vars', node.ident.name)
+      # The loop variable is always set when the body runs (but not after a loop with no iterations)
+      outer_defined = self.defined
+      self.defined = outer_defined | {node.ident.name}
+      self.resolve_scope(node.body_stmts)
+      self.defined = outer_defined
+
+    elif isinstance(node, FuncDecl):
+      self.slots[id(node)] = self.candidates('funcs', node.name)[:1]
+      self.resolve_scope(node.body_stmts, node.params)
+
+    elif isinstance(node, FuncCall):
+      for arg in node.args:
+        self.resolve(arg)
+      self.slots[id(node)] = self.candidates('funcs', node.name)
+
+    elif isinstance(node, FuncCallStmt):
+      self.resolve(node.expr)
+
+    elif isinstance(node, RetStmt):
+      self.resolve(node.value)
+
+  def resolve_program(self, node, inputs=()):
+    # The input variables are resolved like the params of the global scope
+    self.inputs = [Identifier(name, 0) for name in inputs]
+    self.resolve_scope(node, self.inputs)
+    return self
+
+  def input_slots(self):
+    '''
+    Returns the name and the global slot index of every input variable
+    '''
+    return [(param.name, self.slots[id(param)][0][1]) for param in self.inputs]
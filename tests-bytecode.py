@@ -0,0 +1,89 @@
+import unittest
+import io
+import os
+import tempfile
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from compiler import *
+from peephole import *
+from assembler import *
+from bytecode import *
+from vm import *
+
+SOURCE = '''
+func f(a, b)
+  local i := 0
+  while i < 3 do
+    i := i + 1
+  end
+  ret a * b / 2 + i
+end
+x := 1
+println "x = " + f(x, 4) + " " + (x >= 1)
+'''
+
+def compile_program(source):
+  tokens = Lexer(source).tokenize()
+  ast = Parser(tokens).parse()
+  code = Peephole().optimize(Compiler().generate_code(ast))
+  return Assembler().assemble(code)
+
+def run_program(program):
+  buffer = io.StringIO()
+  VM(Output(buffer)).run(program)
+  return buffer.getvalue()
+
+class TestBytecode(unittest.TestCase):
+  def test_round_trip(self):
+    program = compile_program(SOURCE)
+    loaded = BytecodeReader(BytecodeWriter().write(program, SOURCE)).read()
+    self.assertEqual(loaded.code, program.code)
+    self.assertEqual(loaded.labels, program.labels)
+    self.assertEqual(loaded.lines, program.lines)
+    self.assertEqual(loaded.source_hash, source_hash(SOURCE))
+    self.assertEqual(run_program(loaded), 'x = 5 true\n')
+
+  def test_loop_operands(self):
+    source = 'for i := 3, 1 do print i end\nfunc f()\n for j := 1, 5, 2 do print j end\n ret 0\nend\nf()'
+    program = compile_program(source)
+    loaded = BytecodeReader(BytecodeWriter().write(program, source)).read()
+    self.assertEqual(loaded.code, program.code)
+    self.assertEqual(run_program(loaded), '321135')
+
+  def test_line_table(self):
+    program = compile_program(SOURCE)
+    self.assertEqual(program.line_for(program.code.index(('INC_LOCAL', (2, 1.0)))), 5)
+    self.assertEqual(program.line_for(program.code.index(('PRINTLN',))), 10)
+
+  def test_write_and_load(self):
+    tokens = Lexer(SOURCE).tokenize()
+    ast = Parser(tokens).parse()
+    compiler = Compiler()
+    code = Peephole().optimize(compiler.generate_code(ast))
+    with tempfile.TemporaryDirectory() as directory:
+      filename = os.path.join(directory, 'program.pkc')
+      compiler.write_bytecode(filename, SOURCE, code)
+      self.assertEqual(run_program(VM().load(filename)), 'x = 5 true\n')
+
+  def test_invalid_data(self):
+    data = bytearray(BytecodeWriter().write(compile_program(SOURCE), SOURCE))
+    data[4] += 1 # <-- another version of the format
+    self.assertIsNone(BytecodeReader(bytes(data)).read())
+    self.assertIsNone(BytecodeReader(b'garbage').read())
+
+  def test_cache(self):
+    with tempfile.TemporaryDirectory() as directory:
+      cache = BytecodeCache(directory)
+      self.assertIsNone(cache.load(SOURCE))
+      cache.store(SOURCE, compile_program(SOURCE))
+      self.assertEqual(run_program(cache.load(SOURCE)), 'x = 5 true\n')
+      self.assertIsNone(cache.load(SOURCE + '\n'))
+      # A corrupted cache file is a cache miss
+      with open(cache.path(SOURCE), 'r+b') as file:
+        file.truncate(60)
+      self.assertIsNone(cache.load(SOURCE))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,193 @@
+import unittest
+import io
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from closures import *
+from resolver import *
+
+def run(interpreter_class, source):
+  tokens = Lexer(source).tokenize()
+  ast = Parser(tokens).parse()
+  buffer = io.StringIO()
+  try:
+    interpreter_class(Output(buffer)).interpret_ast(ast)
+  except PinkyError as error:
+    buffer.write(f'{Colors.RED}{error} {Colors.WHITE}\n')
+  return buffer.getvalue()
+
+class TestClosureInterpreter(unittest.TestCase):
+  def assertSameOutput(self, source, expected_output):
+    self.assertEqual(run(ClosureInterpreter, source), expected_output)
+    self.assertEqual(run(Interpreter, source), expected_output)
+
+  def test_expressions(self):
+    source = '''
+    println 2 * (9 + 13) / 2 - -1
+    println "x = " + 3 + " " + (1 < 2)
+    println (3 >= 2) == ("abc" < "abd")
+    println 7 % 4 ^ 2
+    println 0 or "s"
+    println ~(true and false)
+    '''
+    self.assertSameOutput(source, '23\nx = 3 true\ntrue\n7\ns\ntrue\n')
+
+  def test_scopes(self):
+    source = '''
+    x := 1
+    if true then
+      x := 2
+      local x := 3
+      y := x
+      println y
+    end
+    println x
+    '''
+    self.assertSameOutput(source, '3\n2\n')
+
+  def test_loops(self):
+    source = '''
+    i := 0
+    while i < 3 do
+      print i
+      i := i + 1
+    end
+    for j := 5, 1, -2 do
+      print j
+    end
+    for j := 1, 3 do
+      print j
+    end
+    println ""
+    '''
+    self.assertSameOutput(source, '012531123\n')
+
+  def test_functions(self):
+    source = '''
+    func fib(n)
+      if n < 2 then
+        ret n
+      end
+      ret fib(n - 1) + fib(n - 2)
+    end
+    func nothing()
+      i := 0
+      while true do
+        if i == 3 then
+          ret "early"
+        end
+        i := i + 1
+      end
+    end
+    func implicit()
+    end
+    println fib(15)
+    println nothing()
+    println implicit() + 1
+    '''
+    self.assertSameOutput(source, '610\nearly\n1\n')
+
+  def test_escapes(self):
+    source = '''
+    x := "a\\tb"
+    println x
+    println "c\\td"
+    '''
+    self.assertSameOutput(source, 'a\tb\nc\td\n')
+
+  def test_output(self):
+    source = 'for i := 1, 3 do print i end println "" println 1 + true'
+    buffer = io.StringIO()
+    output = Output(buffer, buffer_size=2)
+    with self.assertRaises(PinkyRuntimeError):
+      ClosureInterpreter(output).interpret_ast(Parser(Lexer(source).tokenize()).parse())
+    # The text printed before the error was all written, and nothing is left in the buffer
+    self.assertEqual(buffer.getvalue(), '123\n')
+    self.assertEqual(output.chunks, [])
+
+  def test_dynamic_scopes(self):
+    source = '''
+    func f(n)
+      if n > 0 then
+        y := n
+      end
+      i := 0
+      c := 0
+      while i < 2 do
+        if i == 0 then
+          c := 100
+        end
+        c := c + 1
+        println c
+        i := i + 1
+      end
+      ret 0
+    end
+    f(1)
+    func counter()
+      local n := 0
+      func inc()
+        n := n + 1
+        ret n
+      end
+      inc()
+      ret inc()
+    end
+    println counter()
+    for j := 1, 0 do
+    end
+    println j
+    '''
+    self.assertSameOutput(source, "101\n102\n2\n0\n")
+
+  def test_functions_with_the_same_name(self):
+    # The call reaches the first f, so its parameter gets the type of the argument even though the
+    # nested f (never declared at runtime) has the same name
+    source = '''
+    a := 5
+    func f(a) ret a + 1 end
+    println f("s")
+    if false then func f(b) ret b end end
+    '''
+    self.assertSameOutput(source, 's1\n')
+
+  def test_runtime_errors(self):
+    self.assertSameOutput('println 1 + true', f"{Colors.RED}[Line 1]: Unsupported operator '+' between TYPE_NUMBER and TYPE_BOOL. {Colors.WHITE}\n")
+    self.assertSameOutput('x := 0 println 1 / x', f'{Colors.RED}[Line 1]: Division by zero. {Colors.WHITE}\n')
+    self.assertSameOutput('x := 0 println 1 % x', f'{Colors.RED}[Line 1]: Division by zero. {Colors.WHITE}\n')
+    self.assertSameOutput('func f(n) ret 7 % n end println f(0)', f'{Colors.RED}[Line 1]: Division by zero. {Colors.WHITE}\n')
+    self.assertSameOutput('println ~1', f"{Colors.RED}[Line 1]: Unsupported operator '~' with TYPE_NUMBER. {Colors.WHITE}\n")
+    self.assertSameOutput('if 1 then println 1 end', f'{Colors.RED}[Line 1]: Condition test is not a boolean expression. {Colors.WHITE}\n')
+    self.assertSameOutput('println y', f"{Colors.RED}[Line 1]: Undeclared identifier 'y' {Colors.WHITE}\n")
+
+class TestResolver(unittest.TestCase):
+  def test_slots(self):
+    source = '''
+    x := 0
+    while x < 10 do
+      x := x + 1
+      local y := x
+    end
+    func f(a)
+      b := a + x
+    end
+    '''
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens).parse()
+    resolver = Resolver().resolve_program(ast)
+    assign_x, while_stmt, func_decl = ast.stmts
+    self.assertEqual(resolver.scopes[id(ast)].size, 3)
+    self.assertEqual(resolver.slots[id(assign_x)], ((0, 1),))
+    # x is already set when the loop runs, so the loop block only has a slot for the local y
+    self.assertEqual(resolver.scopes[id(while_stmt.body_stmts)].size, 2)
+    self.assertEqual(resolver.slots[id(while_stmt.body_stmts.stmts[0])], ((1, 1),))
+    self.assertEqual(resolver.slots[id(while_stmt.body_stmts.stmts[1])], ((0, 1),))
+    # b may be created in the function scope (and a global b could be created by another function)
+    self.assertEqual(resolver.slots[id(func_decl)], ((0, 2),))
+    self.assertEqual(resolver.slots[id(func_decl.body_stmts.stmts[0])], ((0, 2),))
+    self.assertEqual(resolver.slots[id(func_decl.body_stmts.stmts[0].right.right)], ((1, 1),))
+
+if __name__ == "__main__":
+  unittest.main()
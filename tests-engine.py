@@ -0,0 +1,138 @@
+import unittest
+import io
+from utils import *
+from engine import *
+from closures import *
+from transpiler import *
+from regcompiler import *
+from regvm import *
+
+SOURCE = '''
+func fib(n)
+  if n < 2 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+total := 0
+for i := 1, n do
+  total := total + fib(i)
+end
+println name + ": " + total
+'''
+
+class TestEngine(unittest.TestCase):
+  def test_run_with_inputs(self):
+    for backend in BACKENDS:
+      engine = Engine(backend)
+      script = engine.compile(SOURCE, inputs=['n', 'name'])
+      result = engine.run(script, {'n': 10, 'name': 'fib'})
+      self.assertEqual(result.output, 'fib: 143\n')
+      self.assertEqual(result.globals, {'n': 10.0, 'name': 'fib', 'total': 143.0, 'i': 10.0})
+      # Every run starts with fresh globals, and reuses the compiled script
+      result = engine.run(script, {'n': 3, 'name': True})
+      self.assertEqual(result.output, 'true: 4\n')
+      self.assertEqual(result.globals['total'], 4.0)
+      self.assertIs(engine.compile(SOURCE, inputs=['n', 'name']), script)
+      self.assertEqual(engine.run(SOURCE, {'n': 1, 'name': 'x'}).output, 'x: 1\n')
+
+  def test_reuse_after_errors(self):
+    for backend in BACKENDS:
+      engine = Engine(backend)
+      script = engine.compile('println 1 - x', inputs=['x'])
+      with self.assertRaises(PinkyRuntimeError) as context:
+        engine.run(script, {'x': 'a'})
+      self.assertEqual(context.exception.line, 1)
+      self.assertEqual(engine.run(script, {'x': 0.5}).output, '0.5\n')
+      script = engine.compile('println 1 % x', inputs=['x'])
+      with self.assertRaises(PinkyRuntimeError):
+        engine.run(script, {'x': 0})
+      self.assertEqual(engine.run(script, {'x': 3}).output, '1\n')
+      with self.assertRaises(ParseError):
+        engine.compile('x := (1')
+      with self.assertRaises(ValueError):
+        engine.run(script, {})
+      with self.assertRaises(ValueError):
+        engine.run(script, {'x': 1, 'y': 2})
+      with self.assertRaises(TypeError):
+        engine.run(script, {'x': [1]})
+
+  def test_empty_program(self):
+    for backend in BACKENDS:
+      engine = Engine(backend)
+      for source in ['', '-- comment\n', '\n\n']:
+        result = engine.run(engine.compile(source))
+        self.assertEqual(result.output, '')
+        self.assertEqual(result.globals, {})
+
+  def test_output(self):
+    buffer = io.StringIO()
+    result = Engine('vm').run('print "a" println "b"', output=buffer)
+    self.assertIsNone(result.output)
+    self.assertEqual(buffer.getvalue(), 'ab\n')
+
+def run_backends(source):
+  '''
+  Runs a program on every backend, and returns the output of each (which ends with the error raised)
+  '''
+  outputs = {}
+  for backend in ['interpreter', 'closures', 'transpiler', 'vm', 'regvm']:
+    buffer = io.StringIO()
+    output = Output(buffer)
+    try:
+      ast = Parser(Lexer(source).tokenize()).parse()
+      if backend == 'interpreter':
+        Interpreter(output).interpret_ast(ast)
+      elif backend == 'closures':
+        ClosureInterpreter(output).interpret_ast(ast)
+      elif backend == 'transpiler':
+        Transpiler(output).run(ast)
+      elif backend == 'vm':
+        VM(output).run(Peephole().optimize(Compiler().generate_code(ast)))
+      else:
+        RegisterVM(output).run(RegisterCompiler().generate_code(ast))
+    except PinkyError as error: # <-- any other exception fails the test
+      buffer.write(f'{type(error).__name__}: {error.message}')
+    outputs[backend] = buffer.getvalue()
+  return outputs
+
+class TestErrors(unittest.TestCase):
+  def assertAllOutputs(self, source, expected_output):
+    for backend, output in run_backends(source).items():
+      self.assertEqual(output, expected_output, backend)
+
+  def test_parse_errors(self):
+    self.assertAllOutputs('println 1e3', 'ParseError: Expected an assignment or a function call.')
+    self.assertAllOutputs('x + 1 := 2', 'ParseError: Only a variable can be assigned.')
+    self.assertAllOutputs('for 1 := 1, 2 do end', "ParseError: Expected 'TOK_IDENTIFIER', found '1'.")
+
+  def test_for_loop_values(self):
+    for source in ['for i := 1, "z" do end', 'for i := "a", 3 do end', 'x := true for i := 3, 1, x do end']:
+      for backend, output in run_backends(source).items():
+        self.assertTrue(output.endswith('For loop start, end and step must be numbers.'), (backend, output))
+
+  def test_arithmetic_errors(self):
+    # Python's ArithmeticError is reported like the division by zero, and the output before it is kept
+    for source, message in [('x := 10 println 1 println x ^ 400', 'Numeric overflow.'), ('x := 0 println 1 println x ^ -1', 'Division by zero.')]:
+      for backend, output in run_backends(source).items():
+        self.assertTrue(output.startswith('1\n') and output.endswith(message), (backend, output))
+    for backend in BACKENDS:
+      with self.assertRaises(PinkyRuntimeError) as context:
+        Engine(backend).run('x := 10 println x ^ 400')
+      self.assertEqual(context.exception.message, 'Numeric overflow.')
+      self.assertEqual(context.exception.line, 1)
+
+  def test_return_outside_functions(self):
+    self.assertAllOutputs('println 1 if true then ret 5 end println 2', '1\n')
+
+  def test_only_pinky_errors(self):
+    sources = [
+      'x := 1 println x and 2',
+      'x := 0 println 1 % x',
+      'func f(n) if n == 0 then ret 0 end ret 1 + f(n - 1) end println f(100000)',
+    ]
+    for source in sources:
+      run_backends(source)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from model import *
+from incremental import *
+
+SOURCE = '''x := 1
+func double(n)
+  ret n * 2
+end
+func triple(n)
+  ret n * 3
+end
+println double(x) + triple(x)
+'''
+
+def dump(node):
+  '''
+  The whole tree of a node as nested tuples, including every line number (repr() leaves them out)
+  '''
+  if isinstance(node, list):
+    return [dump(item) for item in node]
+  if isinstance(node, Token):
+    return (node.token_type, node.lexeme, node.line)
+  if isinstance(node, Node):
+    fields = [type(node).__name__]
+    for cls in type(node).__mro__:
+      fields += [(name, dump(getattr(node, name))) for name in cls.__dict__.get('__slots__', ())]
+    return tuple(fields)
+  return node
+
+def full_parse(source):
+  try:
+    return dump(Parser(Lexer(source).tokenize()).parse())
+  except PinkyError as error:
+    return str(error)
+
+def edit(parser, start, end, text):
+  try:
+    return dump(parser.edit(start, end, text))
+  except PinkyError as error:
+    return str(error)
+
+class TestIncrementalParser(unittest.TestCase):
+  def assertEdit(self, parser, old, new):
+    start = parser.source.index(old)
+    expected = full_parse(parser.source.replace(old, new, 1))
+    self.assertEqual(edit(parser, start, start + len(old), new), expected)
+    return parser
+
+  def test_reuse_untouched_statements(self):
+    parser = IncrementalParser(SOURCE)
+    double, triple = parser.ast.stmts[1], parser.ast.stmts[2]
+    self.assertEdit(parser, 'n * 3', 'n * 3 + 0')
+    self.assertEqual(parser.reparsed, 1)
+    self.assertIs(parser.ast.stmts[1], double)
+    self.assertIsNot(parser.ast.stmts[2], triple)
+
+  def test_shift_lines(self):
+    parser = IncrementalParser(SOURCE)
+    triple = parser.ast.stmts[2]
+    self.assertEdit(parser, '  ret n * 2\n', '  local m := n\n  ret m * 2\n')
+    self.assertIs(parser.ast.stmts[2], triple)
+    self.assertEqual(triple.line, 8)
+    self.assertEdit(parser, 'x := 1\n', '')
+    self.assertEqual(triple.line, 7)
+
+  def test_statement_boundaries(self):
+    parser = IncrementalParser(SOURCE)
+    # The new line continues the expression of the statement before it
+    self.assertEdit(parser, 'x := 1\n', 'x := 1\n+ 2\n')
+    self.assertEdit(parser, 'println double(x)', 'println double(x) println 3')
+    self.assertEdit(parser, 'end\nfunc triple', 'end\n-- comment\nfunc triple')
+    self.assertEdit(parser, 'triple(x)\n', 'triple(x)\nx := x')
+
+  def test_errors_and_full_parse(self):
+    parser = IncrementalParser(SOURCE)
+    self.assertEdit(parser, 'n * 2\nend', 'n * 2\n')
+    self.assertEdit(parser, 'println', 'println "a\n')
+    parser = IncrementalParser(SOURCE)
+    self.assertEdit(parser, 'x := 1', 'x := "a\nb"')
+    self.assertEdit(parser, 'n * 3', 'n * 4')
+
+  def test_edit_after_failed_edit(self):
+    # A failed parse keeps the edited source, and the next edit parses it again in full
+    parser = IncrementalParser('x := 1\ny := 2\nz := 3\n')
+    self.assertEdit(parser, 'y := 2', 'y := (')
+    self.assertEqual(parser.source, 'x := 1\ny := (\nz := 3\n')
+    self.assertEdit(parser, 'x := 1', 'x := 5')
+    self.assertEdit(parser, 'y := (', 'y := (2)')
+    # Once the source parses again, the edits are incremental again (the statement before the
+    # region ends with an expression, so it is parsed again too)
+    self.assertEdit(parser, 'z := 3', 'z := 4')
+    self.assertEqual(parser.reparsed, 2)
+
+  def test_empty_program(self):
+    for source in ['', '-- comment\n']:
+      parser = IncrementalParser(source)
+      self.assertEqual(dump(parser.ast), ('Stmts', ('stmts', []), ('line', 1)))
+    # Deleting every statement leaves an empty program, and statements can be added to it again
+    parser = IncrementalParser(SOURCE)
+    self.assertEdit(parser, SOURCE, '-- nothing\n')
+    self.assertEqual(parser.ast.stmts, [])
+    self.assertEdit(parser, '-- nothing\n', 'x := 1\n')
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+import io
+import sys
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from interpprofile import *
+
+def run(source):
+  tokens = Lexer(source).tokenize()
+  ast = Parser(tokens).parse()
+  buffer = io.StringIO()
+  try:
+    Interpreter(Output(buffer)).interpret_ast(ast)
+  except PinkyError as error:
+    buffer.write(f'{Colors.RED}{error} {Colors.WHITE}\n')
+  return buffer.getvalue()
+
+class TestTailCalls(unittest.TestCase):
+  def test_deep_tail_recursion(self):
+    source = '''
+    func count(n, total)
+      if n == 0 then
+        ret total
+      end
+      ret (count(n - 1, total + n))
+    end
+    println count(N, 0)
+    '''
+    # Without the trampoline, every level of recursion nests several Python calls
+    depth = sys.getrecursionlimit() * 2
+    self.assertEqual(run(source.replace('N', str(depth))), f'{depth * (depth + 1) // 2}\n')
+
+  def test_tail_call_semantics(self):
+    source = '''
+    func add(a, b)
+      ret a + b
+    end
+    func pick(n)
+      local x := n * 10
+      while true do
+        if x > 0 then
+          ret add(x, 1)
+        end
+        ret 0
+      end
+    end
+    func nothing()
+    end
+    func relay()
+      ret nothing()
+    end
+    println pick(2) + " " + pick(-1) + " " + relay()
+    '''
+    self.assertEqual(run(source), '21 0 0\n')
+
+  def test_tail_call_errors(self):
+    source = 'func f(a)\n  ret g(a)\nend\nf(1)'
+    self.assertEqual(run(source), f"{Colors.RED}[Line 2]: Function 'g' not declared. {Colors.WHITE}\n")
+
+  def test_top_level_tail_call(self):
+    # Outside of a function there is no trampoline to make the call, so it is made right away
+    source = '''
+    func f()
+      println "hi"
+      ret 1
+    end
+    ret f()
+    println "unreachable"
+    '''
+    self.assertEqual(run(source), 'hi\n')
+
+class TestReturns(unittest.TestCase):
+  def test_return_unwinds_blocks(self):
+    source = '''
+    func first_multiple(n, limit)
+      i := 1
+      while true do
+        for j := 1, limit do
+          if (i * j) % n == 0 then
+            ret i * j
+          end
+        end
+        i := i + 1
+      end
+      println "unreachable"
+    end
+    func nothing(x)
+      if x then
+        local y := 1
+      end
+    end
+    func early(x)
+      if x > 0 then ret "positive" else ret "other" end
+      ret "unreachable"
+    end
+    println first_multiple(7, 3) + " " + first_multiple(6, 4) + " " + nothing(true)
+    println early(1) + " " + early(-1) + " " + (early(0) + first_multiple(5, 5))
+    '''
+    self.assertEqual(run(source), '7 6 0\npositive other other5\n')
+
+  def test_return_value_of_nested_calls(self):
+    source = '''
+    func double(n)
+      ret n * 2
+    end
+    func fib(n)
+      if n < 2 then
+        ret n
+      end
+      ret fib(n - 1) + double(fib(n - 2)) / 2
+    end
+    println fib(15)
+    '''
+    self.assertEqual(run(source), '610\n')
+
+  def test_modulo_by_zero(self):
+    ast = Parser(Lexer('x := 0\nprintln 7 % 2\nprintln 1 % x').tokenize()).parse()
+    output = io.StringIO()
+    with self.assertRaises(PinkyRuntimeError) as context:
+      Interpreter(Output(output)).interpret_ast(ast)
+    self.assertEqual(output.getvalue(), '1\n')
+    self.assertEqual(context.exception.message, 'Division by zero.')
+    self.assertEqual(context.exception.line, 3)
+
+class TestFrames(unittest.TestCase):
+  def test_globals_and_inputs(self):
+    source = '''
+    total := 0
+    for i := 1, n do
+      local twice := i * 2
+      total := total + twice
+    end
+    if total > 10 then
+      big := true
+    end
+    '''
+    ast = Parser(Lexer(source).tokenize()).parse()
+    interpreter = Interpreter()
+    global_vars = interpreter.interpret_ast(ast, {'n': (TYPE_NUMBER, 4.0)})
+    self.assertEqual(global_vars, {'n': (TYPE_NUMBER, 4.0), 'total': (TYPE_NUMBER, 20.0), 'i': (TYPE_NUMBER, 4.0)})
+    # The slots resolved for the program are reused by the next run, which starts with fresh globals
+    resolver = interpreter.resolver
+    global_vars = interpreter.interpret_ast(ast, {'n': (TYPE_NUMBER, 1.0)})
+    self.assertIs(interpreter.resolver, resolver)
+    self.assertEqual(global_vars, {'n': (TYPE_NUMBER, 1.0), 'total': (TYPE_NUMBER, 2.0), 'i': (TYPE_NUMBER, 1.0)})
+
+class TestProfiler(unittest.TestCase):
+  def test_profile(self):
+    source = '''func fib(n)
+  if n < 2 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+func main()
+  for i := 1, 3 do
+    println fib(i + 5)
+  end
+end
+main()
+'''
+    buffer = io.StringIO()
+    profiler = InterpreterProfiler(Output(buffer), source)
+    profiler.interpret_ast(Parser(Lexer(source).tokenize()).parse())
+    self.assertEqual(buffer.getvalue(), run(source))
+    functions = dict((name, (calls, self_time, total_time)) for name, calls, self_time, total_time in profiler.functions())
+    self.assertEqual(functions['fib'][0], 25 + 41 + 67)
+    self.assertEqual(functions['main'][0], 1)
+    self.assertEqual(functions[MAIN_FUNCTION][0], 1)
+    # Recursive calls count once in the total time, and the self times add up to the whole run
+    self.assertLessEqual(functions['fib'][2], functions['main'][2])
+    self.assertLessEqual(functions['main'][2], profiler.total_time())
+    self.assertAlmostEqual(sum(self_time for _, self_time, _ in functions.values()), profiler.total_time(), places=6)
+    lines = dict((line, (function, count)) for line, function, count, _, _ in profiler.lines(sort='count'))
+    self.assertEqual(lines[2], ('fib', 25 + 41 + 67)) # <-- the line of the "if", not of its "end"
+    self.assertEqual(lines[3], ('fib', 13 + 21 + 34))
+    self.assertEqual(lines[5], ('fib', 12 + 20 + 33))
+    self.assertEqual(lines[8], ('main', 1))
+    self.assertEqual(lines[9], ('main', 3))
+    self.assertEqual(lines[12], (MAIN_FUNCTION, 1))
+    self.assertEqual(profiler.to_json()['lines'][0]['source'], profiler.source_line(profiler.lines()[0][0]))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import glob
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+
+def tokenize(lexer_class, source):
+  try:
+    return [(t.token_type, t.lexeme, t.line) for t in lexer_class(source).tokenize()]
+  except LexingError as error:
+    return str(error)
+
+class TestLexer(unittest.TestCase):
+  def assertSameTokens(self, source):
+    tokens = tokenize(Lexer, source)
+    self.assertEqual(tokens, tokenize(CharLexer, source))
+    return tokens
+
+  def test_scripts(self):
+    for filename in glob.glob('scripts/*.pinky'):
+      with open(filename) as file:
+        self.assertSameTokens(file.read())
+
+  def test_tokens(self):
+    source = 'x := 3.14 + 2.x -- comment\n\r\n  if a~=b and c<=d then println "a\nb" .. \'q\' end \t'
+    self.assertEqual(self.assertSameTokens(source), [
+      (TOK_IDENTIFIER, 'x', 1), (TOK_ASSIGN, ':=', 1), (TOK_FLOAT, '3.14', 1), (TOK_PLUS, '+', 1),
+      (TOK_INTEGER, '2', 1), (TOK_DOT, '.', 1), (TOK_IDENTIFIER, 'x', 1),
+      (TOK_IF, 'if', 3), (TOK_IDENTIFIER, 'a', 3), (TOK_NE, '~=', 3), (TOK_IDENTIFIER, 'b', 3),
+      (TOK_AND, 'and', 3), (TOK_IDENTIFIER, 'c', 3), (TOK_LE, '<=', 3), (TOK_IDENTIFIER, 'd', 3),
+      (TOK_THEN, 'then', 3), (TOK_PRINTLN, 'println', 3), (TOK_STRING, '"a\nb"', 3),
+      (TOK_DOT, '.', 3), (TOK_DOT, '.', 3), (TOK_STRING, "'q'", 3), (TOK_END, 'end', 3),
+    ])
+
+  def test_unicode(self):
+    # Words are classified by the str methods, as in the original scanner
+    self.assertEqual(self.assertSameTokens('café := x²y - ٣٤.٥ _é'), [
+      (TOK_IDENTIFIER, 'café', 1), (TOK_ASSIGN, ':=', 1), (TOK_IDENTIFIER, 'x²y', 1), (TOK_MINUS, '-', 1),
+      (TOK_FLOAT, '٣٤.٥', 1), (TOK_IDENTIFIER, '_é', 1),
+    ])
+    # A number can only be made of decimal digits
+    error = "[Line 1]: Error at '²': Unexpected character."
+    self.assertEqual(self.assertSameTokens('x := 2² + ½'), error)
+    self.assertEqual(self.assertSameTokens('n := 1.²'), error)
+    self.assertEqual(self.assertSameTokens('²x'), error)
+    self.assertEqual(self.assertSameTokens('².'), error)
+    self.assertEqual(self.assertSameTokens('n := 1.'), [(TOK_IDENTIFIER, 'n', 1), (TOK_ASSIGN, ':=', 1), (TOK_INTEGER, '1', 1), (TOK_DOT, '.', 1)])
+
+  def test_errors(self):
+    self.assertEqual(self.assertSameTokens('x := 1\ny := "abc\n'), '[Line 2]: Unterminated string.')
+    self.assertEqual(self.assertSameTokens('x := 1\n\ny := 2 $ 3'), "[Line 3]: Error at '$': Unexpected character.")
+    self.assertSameTokens('x := Ⅻ')
+
+class TestCompactTokens(unittest.TestCase):
+  def test_token_types(self):
+    self.assertIsInstance(TOK_PLUS, int)
+    self.assertEqual(f'{TOK_PLUS} {TOK_PLUS!r}', "TOK_PLUS 'TOK_PLUS'")
+    self.assertEqual(repr(Token(TOK_IF, 'if', 2)), "(TOK_IF, 'if', 2)")
+
+  def test_slots_and_interned_names(self):
+    ast = Parser(Lexer('total := 1\nprintln total + total').tokenize()).parse()
+    assignment, print_stmt = ast.stmts
+    self.assertFalse(hasattr(print_stmt.value, '__dict__'))
+    self.assertFalse(hasattr(print_stmt.value.op, '__dict__'))
+    self.assertIs(assignment.left.name, print_stmt.value.left.name)
+    self.assertIs(print_stmt.value.left.name, print_stmt.value.right.name)
+
+class TestTokenStream(unittest.TestCase):
+  def test_lazy_tokens(self):
+    # Nothing is scanned until tokens are requested, so the error comes after the first tokens
+    tokens = Lexer('x := 1\ny := $').generate()
+    self.assertEqual(repr(next(tokens)), "(TOK_IDENTIFIER, 'x', 1)")
+    self.assertEqual(repr(next(tokens)), "(TOK_ASSIGN, ':=', 1)")
+    with self.assertRaises(LexingError) as context:
+      list(tokens)
+    self.assertEqual(context.exception.line, 2)
+    self.assertEqual(str(context.exception), tokenize(Lexer, 'x := 1\ny := $'))
+
+  def test_parse_stream(self):
+    for filename in glob.glob('scripts/*.pinky'):
+      with open(filename) as file:
+        source = file.read()
+      ast = Parser(Lexer(source).tokenize()).parse()
+      self.assertEqual(repr(Parser(Lexer(source).generate()).parse()), repr(ast))
+
+  def test_lookahead(self):
+    parser = Parser(Lexer('a := 1').generate())
+    self.assertEqual(parser.peek().lexeme, 'a')
+    self.assertTrue(parser.match(TOK_IDENTIFIER))
+    self.assertFalse(parser.match(TOK_IDENTIFIER))
+    self.assertEqual(parser.previous_token().lexeme, 'a')
+    parser.expect(TOK_ASSIGN)
+    parser.advance()
+    self.assertTrue(parser.is_at_end())
+    self.assertEqual(parser.curr, 3)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import io
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from optimizer import *
+from interpreter import *
+from compiler import *
+from vm import *
+
+def optimize(source):
+  tokens = Lexer(source).tokenize()
+  ast = Parser(tokens).parse()
+  return Optimizer().optimize(ast)
+
+def run_interpreter(ast):
+  buffer = io.StringIO()
+  Interpreter(Output(buffer)).interpret_ast(ast)
+  return buffer.getvalue()
+
+class TestOptimizer(unittest.TestCase):
+  def test_fold_arithmetic(self):
+    ast = optimize('''x := 2 * (9 + 13) / 2 - -1''')
+    self.assertEqual(str(ast), 'Stmts([Assignment(Identifier[x], Float[23.0])])')
+
+  def test_fold_string_concat(self):
+    ast = optimize('''x := "a" + 1 + true''')
+    self.assertEqual(str(ast), 'Stmts([Assignment(Identifier[x], String[a1true])])')
+
+  def test_fold_logical(self):
+    ast = optimize('''x := ~(1 < 2) or true and (3 == 3)''')
+    self.assertEqual(str(ast), 'Stmts([Assignment(Identifier[x], Bool[True])])')
+
+  def test_keep_variables(self):
+    ast = optimize('''y := (x * x) / (100 + 100)''')
+    self.assertEqual(str(ast), "Stmts([Assignment(Identifier[y], BinOp('/', BinOp('*', Identifier[x], Identifier[x]), Float[200.0]))])")
+
+  def test_keep_runtime_errors(self):
+    ast = optimize('''x := 1 / 0''')
+    self.assertEqual(str(ast), "Stmts([Assignment(Identifier[x], BinOp('/', Integer[1], Integer[0]))])")
+    ast = optimize('''x := 1 + true''')
+    self.assertEqual(str(ast), "Stmts([Assignment(Identifier[x], BinOp('+', Integer[1], Bool[True]))])")
+
+  def test_dead_branches(self):
+    ast = optimize('''
+    if 2 > 3 then println "dead" end
+    while false do println "dead" end
+    if true then println "live" else println "dead" end
+    ''')
+    self.assertEqual(str(ast), "Stmts([PrintStmt(String[live], end='\\n')])")
+
+  def test_branch_keeps_scope(self):
+    source = '''
+    if true then
+      x := 1
+      println x
+    end
+    '''
+    ast = optimize(source)
+    self.assertEqual(str(ast), "Stmts([IfStmt(Bool[True], then:Stmts([Assignment(Identifier[x], Integer[1]), PrintStmt(Identifier[x], end='\\n')]), else:None)])")
+    self.assertEqual(run_interpreter(ast), '1\n')
+
+  def test_dead_branches_keep_functions(self):
+    # The compiler declares the functions of branches that never run, so calls to them compile
+    source = '''
+    if false then
+      func f()
+        ret 1
+      end
+    end
+    while false do
+      if true then func g() ret 2 end end
+    end
+    if 1 > 2 then println f() + g() end
+    println "ok"
+    '''
+    ast = optimize(source)
+    self.assertEqual(sum(isinstance(stmt, (IfStmt, WhileStmt)) for stmt in ast.stmts), 2)
+    buffer = io.StringIO()
+    VM(Output(buffer)).run(Compiler().generate_code(ast))
+    self.assertEqual(buffer.getvalue(), 'ok\n')
+    self.assertEqual(run_interpreter(ast), 'ok\n')
+
+  def test_same_output(self):
+    source = '''
+    func f(n)
+      if 1 + 1 == 2 then
+        ret n * (2 + 3)
+      end
+      ret 0
+    end
+    i := 0
+    while i < 3 and ~false do
+      println "f(" + i + ") = " + f(i) + " " + (10 / 4)
+      i := i + 1
+    end
+    '''
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens).parse()
+    self.assertEqual(run_interpreter(Optimizer().optimize(ast)), run_interpreter(ast))
+
+if __name__ == "__main__":
+  unittest.main()
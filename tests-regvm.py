@@ -0,0 +1,113 @@
+import unittest
+import io
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from compiler import *
+from peephole import *
+from assembler import *
+from vm import *
+from regcompiler import *
+from regvm import *
+
+def parse(source):
+  tokens = Lexer(source).tokenize()
+  return Parser(tokens).parse()
+
+def run(source, register=True):
+  ast = parse(source)
+  buffer = io.StringIO()
+  try:
+    if register:
+      RegisterVM(Output(buffer)).run(RegisterCompiler().generate_code(ast))
+    else:
+      Interpreter(Output(buffer)).interpret_ast(ast)
+  except PinkyError as error:
+    buffer.write(f'{Colors.RED}{error} {Colors.WHITE}\n')
+  return buffer.getvalue()
+
+def real_instructions(code):
+  return [instruction for instruction in code if instruction[0] not in PSEUDO_OPS]
+
+class TestRegisterVM(unittest.TestCase):
+  def assertSameOutput(self, source, expected_output):
+    self.assertEqual(run(source), expected_output)
+    self.assertEqual(run(source, register=False), expected_output)
+
+  def test_expressions(self):
+    source = '''
+    println 2 * (9 + 13) / 2 - -1
+    println "x = " + 3 + " " + (1 < 2)
+    println (3 >= 2) == ("abc" < "abd")
+    println 2 ^ 10 % 7
+    println ~(1 > 2)
+    x := "a\\tb"
+    println x
+    '''
+    self.assertSameOutput(source, '23\nx = 3 true\ntrue\n2\ntrue\na\tb\n')
+
+  def test_loops(self):
+    source = '''
+    i := 0
+    while i < 3 do
+      local w := i * 2
+      if w == 2 then print "two " else print w + " " end
+      i := i + 1
+    end
+    for j := 10, 1, -3 do print j end
+    for k := 3, 1 do print k end
+    for n := 1, 3 do print n end
+    println " " + j + " " + k + " " + n
+    '''
+    self.assertSameOutput(source, '0 two 4 10741321123 1 1 3\n')
+
+  def test_functions(self):
+    source = '''
+    x := 1
+    func bump()
+      x := x + 10
+      ret x
+    end
+    func fib(n)
+      if n < 2 then
+        ret n
+      end
+      ret fib(n - 1) + fib(n - 2)
+    end
+    func digits(a, b, c)
+      ret a * 100 + b * 10 + c
+    end
+    func implicit()
+    end
+    println x + bump()
+    println x
+    println fib(15)
+    println digits(1, digits(0, 0, 2), 3)
+    println implicit()
+    '''
+    self.assertSameOutput(source, '12\n11\n610\n123\n0\n')
+
+  def test_three_address_code(self):
+    source = '''
+    x := 0
+    while x < 10 do
+      x := x + 1
+    end
+    '''
+    code = RegisterCompiler().generate_code(parse(source))
+    # The increment is a single instruction on registers (the constant 1 lives in a register too)
+    self.assertIn(('ADD_NUM', 0, 0, 3), code)
+    self.assertIn(('JMPZ_LT_NUM', 0, 2, 'LBL2'), code)
+    stack_code = Peephole().optimize(Compiler().generate_code(parse(source)))
+    self.assertLess(len(real_instructions(code)), len(real_instructions(stack_code)))
+
+  def test_errors(self):
+    self.assertEqual(run('println 1 + true'), f'{Colors.RED}[Line 1, PC: 1 (START+1)]: Error on ADD between TYPE_NUMBER and TYPE_BOOL. {Colors.WHITE}\n')
+    self.assertEqual(run('x := "a"\nprintln -x'), f'{Colors.RED}[Line 2, PC: 2 (START+2)]: Error on NEG between TYPE_STRING {Colors.WHITE}\n')
+    self.assertEqual(run('x := 1\nwhile x < "a" do\n  x := x + 1\nend'), f'{Colors.RED}[Line 2, PC: 2 (LBL1)]: Error on LT between TYPE_NUMBER and TYPE_STRING {Colors.WHITE}\n')
+    self.assertEqual(run('println y'), f'{Colors.RED}[Line 1]: Variable y is not defined. {Colors.WHITE}\n')
+
+if __name__ == "__main__":
+  unittest.main()
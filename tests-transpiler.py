@@ -0,0 +1,140 @@
+import unittest
+import io
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from transpiler import *
+
+def parse(source):
+  tokens = Lexer(source).tokenize()
+  return Parser(tokens).parse()
+
+def run(source, transpile=True):
+  ast = parse(source)
+  buffer = io.StringIO()
+  output = Output(buffer)
+  try:
+    if transpile:
+      Transpiler(output).run(ast)
+    else:
+      Interpreter(output).interpret_ast(ast)
+  except PinkyError as error:
+    buffer.write(f'{Colors.RED}{error} {Colors.WHITE}\n')
+  return buffer.getvalue()
+
+class TestTranspiler(unittest.TestCase):
+  def assertSameOutput(self, source, expected_output):
+    self.assertEqual(run(source), expected_output)
+    self.assertEqual(run(source, transpile=False), expected_output)
+
+  def test_expressions(self):
+    source = '''
+    println 2 * (9 + 13) / 2 - -1
+    println "x = " + 3 + " " + (1 < 2)
+    println (3 >= 2) == ("abc" < "abd")
+    println 0 or "s"
+    x := "a\\tb"
+    println x
+    '''
+    self.assertSameOutput(source, '23\nx = 3 true\ntrue\ns\na\tb\n')
+
+  def test_scopes_and_loops(self):
+    source = '''
+    x := 0
+    for i := 1, 3 do
+      x := x + i
+      local y := i
+    end
+    while x > 1 do
+      x := x / 2
+      if x < 2 then
+        z := x
+        println z
+      end
+    end
+    println x + " " + i
+    '''
+    self.assertSameOutput(source, '1.5\n0.75\n0.75 3\n')
+
+  def test_functions(self):
+    source = '''
+    func fib(n)
+      if n < 2 then
+        ret n
+      end
+      ret fib(n - 1) + fib(n - 2)
+    end
+    func counter()
+      local n := 0
+      func inc()
+        n := n + 1
+        ret n
+      end
+      inc()
+      ret inc()
+    end
+    func implicit()
+    end
+    println fib(15)
+    println counter()
+    println implicit()
+    '''
+    self.assertSameOutput(source, '610\n2\n0\n')
+
+  def test_functions_with_the_same_name(self):
+    source = '''
+    a := 5
+    func f(a) ret a + 1 end
+    println f("s")
+    if false then func f(b) ret b end end
+    '''
+    self.assertSameOutput(source, 's1\n')
+
+  def test_native_code(self):
+    source = '''
+    x := 0
+    while x < 10 do
+      x := x + 1
+    end
+    '''
+    code = Transpiler().generate_code(parse(source))
+    self.assertIn('while (v_x_1 < 10.0):', code)
+    self.assertIn('v_x_1 = (v_x_1 + 1.0)', code)
+    self.assertNotIn('rt_', code)
+    # Divisions and modulos are only native with a constant divisor that is not zero
+    code = Transpiler().generate_code(parse('x := 7 y := x % 3 z := x % y w := x / 2'))
+    self.assertIn('(v_x_1 % 3.0)', code)
+    self.assertIn('rt_mod(v_x_1, v_y_1, 1, 1)', code)
+    self.assertIn('(v_x_1 / 2.0)', code)
+
+  def test_output(self):
+    source = 'for i := 1, 3 do print i end println "" println 1 + true'
+    buffer = io.StringIO()
+    output = Output(buffer, buffer_size=2)
+    with self.assertRaises(PinkyRuntimeError):
+      Transpiler(output).run(parse(source))
+    self.assertEqual(buffer.getvalue(), '123\n')
+    self.assertEqual(output.chunks, [])
+
+  def test_runtime_errors(self):
+    self.assertSameOutput('println 1 + true', f"{Colors.RED}[Line 1]: Unsupported operator '+' between TYPE_NUMBER and TYPE_BOOL. {Colors.WHITE}\n")
+    self.assertSameOutput('x := 0\nprintln 1 / x', f'{Colors.RED}[Line 2]: Division by zero. {Colors.WHITE}\n')
+    self.assertSameOutput('while 1 do\nend', f'{Colors.RED}[Line 2]: While test is not a boolean expression. {Colors.WHITE}\n')
+    self.assertSameOutput('func f(a)\nend\nf(1, 2)', f"{Colors.RED}[Line 3]: Function 'f' expected 1 params but 2 args were passed. {Colors.WHITE}\n")
+    self.assertSameOutput('x := 0\nprintln 1 % x', f'{Colors.RED}[Line 2]: Division by zero. {Colors.WHITE}\n')
+    self.assertEqual(run('x := 1\n\ny := x % 0'), f'{Colors.RED}[Line 3]: Division by zero. {Colors.WHITE}\n')
+    source = 'func f(n)\n  if n == 0 then ret 0 end\n  ret 1 + f(n - 1)\nend\nprintln f(100000)'
+    self.assertSameOutput(source, f'{Colors.RED}[Line 3]: Maximum recursion depth exceeded. {Colors.WHITE}\n')
+
+  def test_deeply_nested_blocks(self):
+    # Python cannot compile more than 20 nested blocks, so the program runs on the closure interpreter
+    depth = 25
+    source = 'x := 0\n' + 'for i := 1, 2 do\nwhile x < 1 do\n' * depth + 'println "deep " + i\nx := 1\n' + 'end\nend\n' * depth
+    with self.assertRaises(SyntaxError):
+      compile(Transpiler().generate_code(parse(source)), '<pinky>', 'exec')
+    self.assertSameOutput(source, 'deep 1\n')
+
+if __name__ == "__main__":
+  unittest.main()
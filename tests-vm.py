@@ -0,0 +1,385 @@
+import unittest
+import io
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from compiler import *
+from peephole import *
+from assembler import *
+from vm import *
+from vmprofile import *
+
+def run_vm(source, optimize=False):
+  tokens = Lexer(source).tokenize()
+  ast = Parser(tokens).parse()
+  code = Compiler().generate_code(ast)
+  if optimize:
+    code = Peephole().optimize(code)
+  buffer = io.StringIO()
+  VM(Output(buffer)).run(code)
+  return buffer.getvalue()
+
+class TestVM(unittest.TestCase):
+  def test_arithmetic(self):
+    source = '''println 2 * (9 + 13) / 2 - 1'''
+    self.assertEqual(run_vm(source), '21\n')
+
+  def test_string_concat(self):
+    source = '''println "x = " + 3 + " " + true'''
+    self.assertEqual(run_vm(source), 'x = 3 true\n')
+
+  def test_comparison(self):
+    source = '''println (3 >= 2) == ("abc" < "abd")'''
+    self.assertEqual(run_vm(source), 'true\n')
+
+  def test_while(self):
+    source = '''
+    i := 0
+    while i < 5 do
+      print i
+      i := i + 1
+    end
+    '''
+    self.assertEqual(run_vm(source), '01234')
+
+  def test_if_else(self):
+    source = '''
+    x := 7
+    if x % 2 == 0 then println "even" else println "odd" end
+    '''
+    self.assertEqual(run_vm(source), 'odd\n')
+
+  def test_function_call(self):
+    source = '''
+    func fact(n)
+      if n <= 1 then
+        ret 1
+      end
+      ret n * fact(n - 1)
+    end
+    println fact(10)
+    '''
+    self.assertEqual(run_vm(source), '3628800\n')
+
+  def test_locals(self):
+    source = '''
+    func add(a, b)
+      local result := a + b
+      ret result
+    end
+    println add(2, 3) + add(4, 5)
+    '''
+    self.assertEqual(run_vm(source), '14\n')
+
+  def test_for_loops(self):
+    source = '''
+    for i := 1, 3 do print i end
+    for i := 10, 1, -3 do print i end
+    for j := 3, 1 do print j end
+    println " " + i + " " + j
+    func sum(n)
+      total := 0
+      for k := 1, n do
+        local twice := k * 2
+        total := total + twice
+      end
+      ret total + k
+    end
+    println sum(4)
+    '''
+    self.assertEqual(run_vm(source), '12310741321 1 1\n24\n')
+    self.assertEqual(run_vm(source, optimize=True), '12310741321 1 1\n24\n')
+
+  def test_function_in_block(self):
+    # The locals of the enclosing blocks (like the hidden slots of a for loop) do not shift the params
+    source = '''
+    for i := 1, 2 do
+      func g(x)
+        ret x
+      end
+      print g(5) + " "
+    end
+    while true do
+      local y := 7
+      func h(a, b)
+        local c := a - b
+        ret c
+      end
+      println h(y, 2)
+      ret 0
+    end
+    '''
+    self.assertEqual(run_vm(source), '5 5 5\n')
+    self.assertEqual(run_vm(source, optimize=True), '5 5 5\n')
+
+  def test_calling_convention(self):
+    source = '''
+    func add(a, b)
+      local c := a + b
+      ret c
+    end
+    func twice(n)
+      local result := add(n, n)
+      ret result
+    end
+    println twice(add(1, 2))
+    '''
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens).parse()
+    code = Compiler().generate_code(ast)
+    self.assertIn(('JSR', 2, 'add'), code)
+    self.assertIn(('JSR', 1, 'twice'), code)
+    buffer = io.StringIO()
+    vm = VM(Output(buffer))
+    vm.run(code)
+    self.assertEqual(buffer.getvalue(), '6\n')
+    # Every frame was removed from the stack, and the frame records are reused across calls
+    self.assertEqual(vm.stack, [])
+    self.assertEqual(vm.frames, [])
+    self.assertEqual(len(vm.frame_pool), 2)
+
+  def test_tail_calls(self):
+    source = '''
+    func count(n, total)
+      if n == 0 then
+        ret total
+      end
+      local half := n / 2
+      ret (count(n - 1, total + half))
+    end
+    func find(n)
+      for i := 1, 10 do
+        if i == 3 then
+          ret count(n, i)
+        end
+      end
+      ret 0
+    end
+    println count(20000, 0)
+    '''
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens).parse()
+    code = Compiler().generate_code(ast)
+    self.assertIn(('TAIL_JSR', 2, 'count'), code)
+    self.assertIn(('JSR', 2, 'count'), code)
+    buffer = io.StringIO()
+    vm = VM(Output(buffer))
+    vm.run(code)
+    self.assertEqual(buffer.getvalue(), '100005000\n')
+    # The recursion ran in a single frame
+    self.assertEqual(len(vm.frame_pool), 1)
+    # A tail call from inside nested blocks drops their slots from the stack
+    self.assertEqual(run_vm(source.replace('println count(20000, 0)', 'println find(4)\nprintln find(2)'), optimize=True), '8\n4.5\n')
+
+  def test_prepare(self):
+    vm = VM()
+    code = vm.prepare([('PUSH', (TYPE_NUMBER, 1)), ('PUSH', (TYPE_STRING, 'a')), ('PUSH', (TYPE_BOOL, True)), ('HALT',)])
+    self.assertEqual(code, [(OP_PUSH, 1.0), (OP_PUSH, 'a'), (OP_PUSH, True), (OP_HALT, None)])
+    self.assertIs(type(code[0][1]), float)
+
+  def test_type_of(self):
+    self.assertEqual(type_of(1.0), TYPE_NUMBER)
+    self.assertEqual(type_of('1.0'), TYPE_STRING)
+    self.assertEqual(type_of(False), TYPE_BOOL)
+
+class TestTypeInference(unittest.TestCase):
+  def test_specialised_opcodes(self):
+    source = '''
+    func twice(n)
+      ret n * 2
+    end
+    x := 1
+    s := "a"
+    x := twice(x) + 1
+    s := s + x
+    '''
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens).parse()
+    code = Compiler().generate_code(ast)
+    opcodes = [instruction[0] for instruction in code]
+    self.assertIn('MUL_NUM', opcodes)
+    self.assertIn('ADD_NUM', opcodes)
+    self.assertIn('ADD', opcodes)
+
+  def test_unknown_types(self):
+    source = '''
+    func id(v)
+      ret v
+    end
+    a := id(1) + id(2)
+    b := id("x")
+    '''
+    tokens = Lexer(source).tokenize()
+    ast = Parser(tokens).parse()
+    types = TypeInference().infer(ast)
+    self.assertEqual(types.var_types['a'], TYPE_ANY)
+    self.assertEqual(types.var_types['b'], TYPE_ANY)
+    self.assertEqual(run_vm(source + 'println a'), '3\n')
+
+class TestPeephole(unittest.TestCase):
+  def test_fusion(self):
+    code = [
+      ('LOAD_LOCAL', 0),
+      ('LOAD_LOCAL', 1),
+      ('MUL_NUM',),
+      ('PUSH', (TYPE_NUMBER, 200)),
+      ('DIV_NUM',),
+      ('LOAD_GLOBAL', 3),
+      ('LT_NUM',),
+      ('JMPZ', 'LBL1'),
+      ('LOAD_GLOBAL', 2),
+      ('PUSH', (TYPE_NUMBER, 1)),
+      ('ADD_NUM',),
+      ('STORE_GLOBAL', 2),
+      ('POP',),
+      ('POP',),
+      ('POP',),
+      ('LABEL', 'LBL1'),
+      ('POP',),
+      ('HALT',),
+    ]
+    self.assertEqual(Peephole().optimize(code), [
+      ('LOAD_LOCAL2', (0, 1)),
+      ('MUL_NUM',),
+      ('DIV_NUM_CONST', 200.0),
+      ('LOAD_GLOBAL', 3),
+      ('JMPZ_LT_NUM', 'LBL1'),
+      ('INC_GLOBAL', (2, 1.0)),
+      ('POPN', 3),
+      ('LABEL', 'LBL1'),
+      ('POP',),
+      ('HALT',),
+    ])
+
+  def test_same_output(self):
+    source = '''
+    func f(a, b)
+      local i := 0
+      local total := 0
+      while i < 10 do
+        total := total + a * b / 2 - i
+        i := i + 1
+      end
+      ret total
+    end
+    n := 0
+    while n <= 3 do
+      println f(n, 4) + " " + (n >= 2)
+      n := n + 1
+    end
+    '''
+    self.assertEqual(run_vm(source, optimize=True), run_vm(source))
+
+class TestAssembler(unittest.TestCase):
+  def test_resolve_labels(self):
+    code = [
+      ('LABEL', 'START'),
+      ('LABEL', 'LBL1'),
+      ('PUSH', (TYPE_BOOL, True)),
+      ('JMPZ', 'LBL2'),
+      ('PUSH', (TYPE_NUMBER, 1.0)),
+      ('SET_SLOT', '0 (x)'),
+      ('JMP', 'LBL1'),
+      ('LABEL', 'LBL2'),
+      ('HALT',),
+    ]
+    program = Assembler().assemble(code)
+    self.assertEqual(program.code, [
+      ('PUSH', (TYPE_BOOL, True)),
+      ('JMPZ', 4),
+      ('PUSH', (TYPE_NUMBER, 1.0)),
+      ('JMP', 0),
+      ('HALT',),
+    ])
+    self.assertEqual(program.names_at(0), ['START', 'LBL1'])
+    self.assertEqual(program.label_for(3), 'START+3')
+    self.assertEqual(program.label_for(4), 'LBL2')
+
+class TestProfiler(unittest.TestCase):
+  def test_profile(self):
+    source = '''
+    func square(n)
+      ret n * n
+    end
+    func sum(n)
+      total := 0
+      for i := 1, n do
+        total := total + square(i)
+      end
+      ret total
+    end
+    println sum(10)
+    '''
+    program = Assembler().assemble(Peephole().optimize(Compiler().generate_code(Parser(Lexer(source).tokenize()).parse())))
+    profiler = VMProfiler()
+    output = io.StringIO()
+    VM(Output(output)).run(program, profiler)
+    self.assertEqual(output.getvalue(), run_vm(source, optimize=True))
+    counts = dict((name, count) for name, count, _ in profiler.opcodes())
+    self.assertEqual(counts['JSR'], 11)
+    self.assertEqual(counts['RTS'], 11)
+    self.assertEqual(counts['FOR_LOOP'], 10)
+    self.assertEqual(profiler.total_count(), sum(profiler.pc_counts))
+    functions = [name for name, _, _ in profiler.functions()]
+    self.assertEqual(sorted(functions), ['START', 'square', 'sum'])
+    lines = dict(((name, line), count) for name, line, count, _ in profiler.lines())
+    self.assertEqual(lines[('square', 3)], 30) # <-- LOAD_LOCAL2, MUL_NUM and RTS, 10 times
+    collapsed = dict(line.rsplit(' ', 1) for line in profiler.collapsed())
+    self.assertEqual(set(collapsed), {'START', 'START;sum', 'START;sum;square'})
+    self.assertEqual(sum(int(count) for count in collapsed.values()), profiler.total_count())
+
+class TestOutput(unittest.TestCase):
+  def test_buffered_output(self):
+    source = '''
+    for i := 1, 5 do
+      print i + "\\t"
+    end
+    println "\\\\n"
+    '''
+    buffer = io.StringIO()
+    output = Output(buffer, buffer_size=4)
+    VM(output).run(Compiler().generate_code(Parser(Lexer(source).tokenize()).parse()))
+    # Escapes are processed once, when the literal is parsed
+    self.assertEqual(buffer.getvalue(), '1\t2\t3\t4\t5\t\\n\n')
+    self.assertEqual(output.chunks, [])
+
+  def test_flush_before_error(self):
+    source = '''
+    print "before "
+    println 1 + true
+    '''
+    buffer = io.StringIO()
+    output = Output(buffer)
+    with self.assertRaises(VMError) as context:
+      VM(output).run(Compiler().generate_code(Parser(Lexer(source).tokenize()).parse()))
+    self.assertEqual(buffer.getvalue(), 'before ')
+    # The error carries the source line of the failing instruction (from the line table)
+    self.assertEqual(context.exception.line, 3)
+    self.assertTrue(str(context.exception).startswith('[Line 3, PC: '))
+
+  def test_division_by_zero(self):
+    source = '''
+    x := 0
+    println 1 / x
+    '''
+    for optimize in [False, True]:
+      code = Compiler().generate_code(Parser(Lexer(source).tokenize()).parse())
+      if optimize:
+        code = Peephole().optimize(code)
+      program = Assembler().assemble(code)
+      with self.assertRaises(VMError) as context:
+        VM(Output(io.StringIO())).run(program)
+      self.assertEqual(context.exception.message, 'Division by zero.')
+      self.assertEqual(context.exception.line, 3)
+      self.assertIn(program.code[context.exception.pc][0], ('DIV', 'DIV_NUM'))
+
+  def test_error_lines(self):
+    # The errors in the test of an if or a while are on its first line, not on the line of its "end"
+    for source in ['x := 1\nif x < "a" then\n  println x\nend', 'x := 1\nwhile x < "a" do\n  x := x + 1\n\nend']:
+      with self.assertRaises(VMError) as context:
+        VM(Output(io.StringIO())).run(Compiler().generate_code(Parser(Lexer(source).tokenize()).parse()))
+      self.assertEqual(context.exception.line, 2)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,59 +1,75 @@
+from enum import IntEnum, auto
+
 ###############################################################################
 # Constants for different token types
+#
+# Token types are small integers (an IntEnum), exported as TOK_* constants. They print with their
+# name, so messages and token dumps read the same as when the types were strings.
 ###############################################################################
-# Single-char tokens
-TOK_LPAREN     = 'TOK_LPAREN'     #  (
-TOK_RPAREN     = 'TOK_RPAREN'     #  )
-TOK_LCURLY     = 'TOK_LCURLY'     #  {
-TOK_RCURLY     = 'TOK_RCURLY'     #  }
-TOK_LSQUAR     = 'TOK_LSQUAR'     #  [
-TOK_RSQUAR     = 'TOK_RSQUAR'     #  ]
-TOK_COMMA      = 'TOK_COMMA'      #  ,
-TOK_DOT        = 'TOK_DOT'        #  .
-TOK_PLUS       = 'TOK_PLUS'       #  +
-TOK_MINUS      = 'TOK_MINUS'      #  -
-TOK_STAR       = 'TOK_STAR'       #  *
-TOK_SLASH      = 'TOK_SLASH'      #  /
-TOK_CARET      = 'TOK_CARET'      #  ^
-TOK_MOD        = 'TOK_MOD'        #  %
-TOK_COLON      = 'TOK_COLON'      #  :
-TOK_SEMICOLON  = 'TOK_SEMICOLON'  #  ;
-TOK_QUESTION   = 'TOK_QUESTION'   #  ?
-TOK_NOT        = 'TOK_NOT'        #  ~
-TOK_GT         = 'TOK_GT'         #  >
-TOK_LT         = 'TOK_LT'         #  <
-TOK_EQ         = 'TOK_EQ'         #  =
-# Two-char tokens
-TOK_GE         = 'TOK_GE'         #  >=
-TOK_LE         = 'TOK_LE'         #  <=
-TOK_NE         = 'TOK_NE'         #  ~=
-TOK_EQEQ       = 'TOK_EQEQ'       #  ==
-TOK_ASSIGN     = 'TOK_ASSIGN'     #  :=
-TOK_GTGT       = 'TOK_GTGT'       #  >>
-TOK_LTLT       = 'TOK_LTLT'       #  <<
-# Literals
-TOK_IDENTIFIER = 'TOK_IDENTIFIER'
-TOK_STRING     = 'TOK_STRING'
-TOK_INTEGER    = 'TOK_INTEGER'
-TOK_FLOAT      = 'TOK_FLOAT'
-# Keywords
-TOK_IF         = 'TOK_IF'
-TOK_THEN       = 'TOK_THEN'
-TOK_ELSE       = 'TOK_ELSE'
-TOK_TRUE       = 'TOK_TRUE'
-TOK_FALSE      = 'TOK_FALSE'
-TOK_AND        = 'TOK_AND'
-TOK_OR         = 'TOK_OR'
-TOK_LOCAL      = 'TOK_LOCAL'
-TOK_WHILE      = 'TOK_WHILE'
-TOK_DO         = 'TOK_DO'
-TOK_FOR        = 'TOK_FOR'
-TOK_FUNC       = 'TOK_FUNC'
-TOK_NULL       = 'TOK_NULL'
-TOK_END        = 'TOK_END'
-TOK_PRINT      = 'TOK_PRINT'
-TOK_PRINTLN    = 'TOK_PRINTLN'
-TOK_RET        = 'TOK_RET'
+class TokenType(IntEnum):
+  # Single-char tokens
+  TOK_LPAREN     = auto()  #  (
+  TOK_RPAREN     = auto()  #  )
+  TOK_LCURLY     = auto()  #  {
+  TOK_RCURLY     = auto()  #  }
+  TOK_LSQUAR     = auto()  #  [
+  TOK_RSQUAR     = auto()  #  ]
+  TOK_COMMA      = auto()  #  ,
+  TOK_DOT        = auto()  #  .
+  TOK_PLUS       = auto()  #  +
+  TOK_MINUS      = auto()  #  -
+  TOK_STAR       = auto()  #  *
+  TOK_SLASH      = auto()  #  /
+  TOK_CARET      = auto()  #  ^
+  TOK_MOD        = auto()  #  %
+  TOK_COLON      = auto()  #  :
+  TOK_SEMICOLON  = auto()  #  ;
+  TOK_QUESTION   = auto()  #  ?
+  TOK_NOT        = auto()  #  ~
+  TOK_GT         = auto()  #  >
+  TOK_LT         = auto()  #  <
+  TOK_EQ         = auto()  #  =
+  # Two-char tokens
+  TOK_GE         = auto()  #  >=
+  TOK_LE         = auto()  #  <=
+  TOK_NE         = auto()  #  ~=
+  TOK_EQEQ       = auto()  #  ==
+  TOK_ASSIGN     = auto()  #  :=
+  TOK_GTGT       = auto()  #  >>
+  TOK_LTLT       = auto()  #  <<
+  # Literals
+  TOK_IDENTIFIER = auto()
+  TOK_STRING     = auto()
+  TOK_INTEGER    = auto()
+  TOK_FLOAT      = auto()
+  # Keywords
+  TOK_IF         = auto()
+  TOK_THEN       = auto()
+  TOK_ELSE       = auto()
+  TOK_TRUE       = auto()
+  TOK_FALSE      = auto()
+  TOK_AND        = auto()
+  TOK_OR         = auto()
+  TOK_LOCAL      = auto()
+  TOK_WHILE      = auto()
+  TOK_DO         = auto()
+  TOK_FOR        = auto()
+  TOK_FUNC       = auto()
+  TOK_NULL       = auto()
+  TOK_END        = auto()
+  TOK_PRINT      = auto()
+  TOK_PRINTLN    = auto()
+  TOK_RET        = auto()
+
+  def __repr__(self):
+    return repr(self.name)
+
+  def __str__(self):
+    return self.name
+
+  __format__ = object.__format__
+
+globals().update(TokenType.__members__)
 
 ###############################################################################
 # Dictionary mapping keywords and their token types
@@ -82,6 +98,8 @@ keywords = {
 # Token class definition
 ###############################################################################
 class Token:
+  __slots__ = ('token_type', 'lexeme', 'line')
+
   def __init__(self, token_type, lexeme, line):
     self.token_type = token_type
     self.lexeme = lexeme
@@ -0,0 +1,499 @@
+from defs import *
+from utils import *
+from model import *
+from tokens import *
+from inference import *
+from resolver import *
+from closures import *
+import traceback
+
+###############################################################################
+# The transpiler translates the AST into Python source code, and runs it with Python's built-in
+# compile() and exec(), so Pinky control flow and arithmetic run as native Python code.
+#
+# The whole program becomes a Python function (pinky_main), and every Pinky function becomes a
+# nested Python function. Every slot of the frames laid out by the resolver (see resolver.py) is
+# a Python local variable named after the Pinky name and its scope, for example:
+#
+#      x := 0                           def pinky_main():
+#      func f(n)                          v_x_1 = f_f_1 = None
+#        x := x + n                       v_x_1 = 0.0
+#      end                                def f_f_1(v_n_2):
+#      f(2)                                 nonlocal v_x_1
+#                                           v_x_1 = (v_x_1 + v_n_2)
+#                                           return 0.0
+#                                         f_f_1(2.0)
+#
+# An unset slot holds None, and reads and calls go through the same (depth, index) candidates that
+# the closure interpreter uses. Operations whose operand types are known statically (see
+# inference.py) are emitted as native Python operators, and everything else calls one of the rt_*
+# helpers below, which perform the same checks (and report the same errors) as the Interpreter.
+#
+# The print statements call write() in the generated code, the write method of the Output of the
+# transpiler, so the program output is buffered like the output of the other back ends.
+###############################################################################
+
+def rt_unsupported(lexeme, leftval, rightval, line):
+  runtime_error(f'Unsupported operator {lexeme!r} between {type_of(leftval)} and {type_of(rightval)}.', line)
+
+def rt_add(leftval, rightval, line):
+  if type(leftval) is float and type(rightval) is float:
+    return leftval + rightval
+  if type(leftval) is str or type(rightval) is str:
+    return stringify(leftval) + stringify(rightval)
+  rt_unsupported('+', leftval, rightval, line)
+
+def rt_sub(leftval, rightval, line):
+  if type(leftval) is float and type(rightval) is float:
+    return leftval - rightval
+  rt_unsupported('-', leftval, rightval, line)
+
+def rt_mul(leftval, rightval, line):
+  if type(leftval) is float and type(rightval) is float:
+    return leftval * rightval
+  rt_unsupported('*', leftval, rightval, line)
+
+def rt_div(leftval, rightval, line, op_line):
+  if rightval == 0:
+    runtime_error(f'Division by zero.', line)
+  if type(leftval) is float and type(rightval) is float:
+    return leftval / rightval
+  rt_unsupported('/', leftval, rightval, op_line)
+
+def rt_mod(leftval, rightval, line, op_line):
+  if rightval == 0:
+    runtime_error(f'Division by zero.', line)
+  if type(leftval) is float and type(rightval) is float:
+    return leftval % rightval
+  rt_unsupported('%', leftval, rightval, op_line)
+
+def rt_pow(leftval, rightval, line):
+  if type(leftval) is float and type(rightval) is float:
+    return leftval ** rightval
+  rt_unsupported('^', leftval, rightval, line)
+
+def rt_compare(lexeme, leftval, rightval, line):
+  # Checks the operands of an ordering comparison (numbers or strings)
+  if type(leftval) is not type(rightval) or type(leftval) is bool:
+    rt_unsupported(lexeme, leftval, rightval, line)
+
+def rt_lt(leftval, rightval, line):
+  rt_compare('<', leftval, rightval, line)
+  return leftval < rightval
+
+def rt_gt(leftval, rightval, line):
+  rt_compare('>', leftval, rightval, line)
+  return leftval > rightval
+
+def rt_le(leftval, rightval, line):
+  rt_compare('<=', leftval, rightval, line)
+  return leftval <= rightval
+
+def rt_ge(leftval, rightval, line):
+  rt_compare('>=', leftval, rightval, line)
+  return leftval >= rightval
+
+def rt_eq(leftval, rightval, line):
+  if type(leftval) is not type(rightval):
+    rt_unsupported('==', leftval, rightval, line)
+  return leftval == rightval
+
+def rt_ne(leftval, rightval, line):
+  if type(leftval) is not type(rightval):
+    rt_unsupported('~=', leftval, rightval, line)
+  return leftval != rightval
+
+def rt_unop(lexeme, value, line):
+  runtime_error(f'Unsupported operator {lexeme!r} with {type_of(value)}.', line)
+
+def rt_neg(value, line):
+  if type(value) is not float:
+    rt_unop('-', value, line)
+  return -value
+
+def rt_pos(value, line):
+  if type(value) is not float:
+    rt_unop('+', value, line)
+  return value
+
+def rt_not(value, line):
+  if type(value) is not bool:
+    rt_unop('~', value, line)
+  return not value
+
+def rt_test(value, message, line):
+  if type(value) is not bool:
+    runtime_error(message, line)
+  return value
+
+def rt_for(start, end, step, line):
+  if type(start) is not float or type(end) is not float or type(step) is not float:
+    runtime_error(f'For loop start, end and step must be numbers.', line)
+
+def rt_undeclared(name, line):
+  runtime_error(f'Undeclared identifier {name!r}', line)
+
+def rt_undeclared_func(name, line):
+  runtime_error(f'Function {name!r} not declared.', line)
+
+def rt_arity(func, name, nargs, line):
+  if func.__code__.co_argcount != nargs:
+    runtime_error(f'Function {name!r} expected {func.__code__.co_argcount} params but {nargs} args were passed.', line)
+  return func
+
+RUNTIME = {name: value for name, value in list(globals().items()) if name.startswith('rt_')}
+
+# Operators emitted as native Python code when the types of both operands are known
+NATIVE_OPS = {
+  TOK_PLUS: '+', TOK_MINUS: '-', TOK_STAR: '*', TOK_SLASH: '/', TOK_MOD: '%', TOK_CARET: '**',
+  TOK_LT: '<', TOK_GT: '>', TOK_LE: '<=', TOK_GE: '>=', TOK_EQEQ: '==', TOK_NE: '!=',
+}
+
+# Helpers for the operators whose operand types are only known at runtime
+RUNTIME_OPS = {
+  TOK_PLUS: 'rt_add', TOK_MINUS: 'rt_sub', TOK_STAR: 'rt_mul', TOK_SLASH: 'rt_div', TOK_MOD: 'rt_mod', TOK_CARET: 'rt_pow',
+  TOK_LT: 'rt_lt', TOK_GT: 'rt_gt', TOK_LE: 'rt_le', TOK_GE: 'rt_ge', TOK_EQEQ: 'rt_eq', TOK_NE: 'rt_ne',
+}
+
+class FrameNames:
+  '''
+  The Python names of the slots of a frame (as laid out by the resolver)
+  '''
+  def __init__(self, scope, node, number, func):
+    self.func = func # The Python function that owns the local variables of the frame
+    self.names = {}
+    for name, index in scope.vars.items():
+      self.names[index] = f'v_{name}_{number}'
+    for name, index in scope.funcs.items():
+      self.names[index] = f'f_{name}_{number}'
+    self.slots = sorted(self.names.values())
+    # The arities of the functions declared in the block
+    self.arities = {}
+    for stmt in node.stmts:
+      if isinstance(stmt, FuncDecl):
+        self.arities.setdefault(stmt.name, set()).add(len(stmt.params))
+
+class Transpiler:
+  def __init__(self, output=None):
+    self.output = Output() if output is None else output # <-- the sink of print/println (write() in the generated code)
+    self.lines = []       # Lines of the generated Python code
+    self.line_map = []    # Pinky line number of each generated line
+    self.indent = 0
+    self.frames = []      # Stack of frames of the enclosing scopes
+    self.funcs = []       # Stack of (list of local names, set of nonlocal names) of the Python functions
+    self.scope_counter = 0
+    self.temp_counter = 0
+    self.types = TypeInference()
+    self.resolver = Resolver()
+
+  def emit(self, code, line):
+    self.lines.append('  ' * self.indent + code)
+    self.line_map.append(line)
+
+  def insert(self, index, code, line):
+    self.lines.insert(index, '  ' * self.indent + code)
+    self.line_map.insert(index, line)
+
+  def make_temp(self):
+    self.temp_counter += 1
+    return f't{self.temp_counter}'
+
+  def make_frame(self, node):
+    '''
+    Names the slots of the frame of a block as local variables of the current Python function
+    (returns None if the block does not have a frame)
+    '''
+    scope = self.resolver.scopes[id(node)]
+    if not scope.has_frame():
+      return None
+    self.scope_counter += 1
+    frame = FrameNames(scope, node, self.scope_counter, len(self.funcs) - 1)
+    self.funcs[-1][0].extend(frame.slots)
+    return frame
+
+  def begin_scope(self, frame):
+    if frame is not None:
+      self.frames.append(frame)
+
+  def end_scope(self, frame):
+    if frame is not None:
+      self.frames.pop()
+
+  def slot_name(self, depth, index, assign=False):
+    frame = self.frames[-1 - depth]
+    name = frame.names[index]
+    if assign and frame.func != len(self.funcs) - 1:
+      self.funcs[-1][1].add(name)
+    return name
+
+  def reset(self, frame, line):
+    # A block gets a brand new frame every time it runs
+    if frame is not None:
+      self.emit(' = '.join(frame.slots) + ' = None', line)
+
+  def is_type(self, node, valtype):
+    return self.types.type_of(node) == valtype
+
+  def load(self, candidates, known, undeclared):
+    '''
+    Returns a Python expression that reads the first set slot among the candidates
+    '''
+    names = [self.slot_name(depth, index) for depth, index in candidates]
+    if known:
+      expr = names.pop()
+    else:
+      expr = undeclared
+    for name in reversed(names):
+      expr = f'({name} if {name} is not None else {expr})'
+    return expr
+
+  def store(self, candidates, value, line):
+    '''
+    Emits the statements that write a value to the first set slot among the candidates
+    '''
+    names = [self.slot_name(depth, index, assign=True) for depth, index in candidates]
+    if len(names) == 1:
+      self.emit(f'{names[0]} = {value}', line)
+      return
+    temp = self.make_temp()
+    self.emit(f'{temp} = {value}', line)
+    for i, name in enumerate(names):
+      self.emit(f'{"if" if i == 0 else "elif"} {name} is not None:', line)
+      self.emit(f'  {name} = {temp}', line)
+    self.emit(f'else:', line)
+    self.emit(f'  {names[0]} = {temp}', line)
+
+  def transpile_binop(self, node):
+    op = node.op.token_type
+    left = self.transpile(node.left)
+    right = self.transpile(node.right)
+    numeric = self.is_type(node.left, TYPE_NUMBER) and self.is_type(node.right, TYPE_NUMBER)
+    if op in (TOK_SLASH, TOK_MOD):
+      # Only a constant non-zero divisor can skip the check for a division by zero
+      if numeric and isinstance(node.right, (Integer, Float)) and float(node.right.value) != 0:
+        return f'({left} {NATIVE_OPS[op]} {right})'
+      return f'{RUNTIME_OPS[op]}({left}, {right}, {node.line}, {node.op.line})'
+    same_type = any(self.is_type(node.left, valtype) and self.is_type(node.right, valtype) for valtype in (TYPE_NUMBER, TYPE_STRING, TYPE_BOOL))
+    if numeric or (same_type and op in (TOK_EQEQ, TOK_NE)):
+      return f'({left} {NATIVE_OPS[op]} {right})'
+    if op == TOK_PLUS and (self.is_type(node.left, TYPE_STRING) or self.is_type(node.right, TYPE_STRING)):
+      if not self.is_type(node.left, TYPE_STRING):
+        left = f'stringify({left})'
+      if not self.is_type(node.right, TYPE_STRING):
+        right = f'stringify({right})'
+      return f'({left} + {right})'
+    if same_type and self.is_type(node.left, TYPE_STRING) and op in (TOK_LT, TOK_GT, TOK_LE, TOK_GE):
+      return f'({left} {NATIVE_OPS[op]} {right})'
+    return f'{RUNTIME_OPS[op]}({left}, {right}, {node.op.line})'
+
+  def transpile_unop(self, node):
+    op = node.op.token_type
+    operand = self.transpile(node.operand)
+    if op == TOK_MINUS:
+      return f'(-{operand})' if self.is_type(node.operand, TYPE_NUMBER) else f'rt_neg({operand}, {node.op.line})'
+    if op == TOK_PLUS:
+      return operand if self.is_type(node.operand, TYPE_NUMBER) else f'rt_pos({operand}, {node.op.line})'
+    return f'(not {operand})' if self.is_type(node.operand, TYPE_BOOL) else f'rt_not({operand}, {node.op.line})'
+
+  def transpile_func_call(self, node):
+    candidates = self.resolver.slots[id(node)]
+    func = self.load(candidates, False, f'rt_undeclared_func({node.name!r}, {node.line})')
+    # The arity is only checked at runtime if any declaration in scope has a different number of params
+    arities = set()
+    for depth, index in candidates:
+      arities |= self.frames[-1 - depth].arities.get(node.name, set())
+    if arities != {len(node.args)}:
+      func = f'rt_arity({func}, {node.name!r}, {len(node.args)}, {node.line})'
+    args = ', '.join(self.transpile(arg) for arg in node.args)
+    return f'{func}({args})'
+
+  def transpile_test(self, node, message):
+    test = self.transpile(node.test)
+    if self.is_type(node.test, TYPE_BOOL):
+      return test
+    return f'rt_test({test}, {message!r}, {node.line})'
+
+  def transpile_block(self, node, frame=None):
+    self.begin_scope(frame)
+    if not node.stmts:
+      self.emit('pass', node.line)
+    for stmt in node.stmts:
+      self.transpile(stmt)
+    self.end_scope(frame)
+
+  def transpile_if(self, node):
+    self.emit(f'if {self.transpile_test(node, "Condition test is not a boolean expression.")}:', node.line)
+    self.indent += 1
+    frame = self.make_frame(node.then_stmts)
+    self.reset(frame, node.line)
+    self.transpile_block(node.then_stmts, frame)
+    self.indent -= 1
+    if node.else_stmts:
+      self.emit('else:', node.line)
+      self.indent += 1
+      frame = self.make_frame(node.else_stmts)
+      self.reset(frame, node.line)
+      self.transpile_block(node.else_stmts, frame)
+      self.indent -= 1
+
+  def transpile_while(self, node):
+    test = self.transpile_test(node, 'While test is not a boolean expression.')
+    frame = self.make_frame(node.body_stmts)
+    self.reset(frame, node.line)
+    self.emit(f'while {test}:', node.line)
+    self.indent += 1
+    self.transpile_block(node.body_stmts, frame)
+    self.indent -= 1
+
+  def transpile_for(self, node):
+    # Same loop as the Interpreter: the direction is chosen by comparing the start and end values
+    i, end, step, up = self.make_temp(), self.make_temp(), self.make_temp(), self.make_temp()
+    self.emit(f'{i} = {self.transpile(node.start)}', node.line)
+    self.emit(f'{end} = {self.transpile(node.end)}', node.line)
+    if node.step is not None:
+      self.emit(f'{step} = {self.transpile(node.step)}', node.line)
+    bounds = [node.start, node.end] + ([node.step] if node.step is not None else [])
+    if not all(self.is_type(value, TYPE_NUMBER) for value in bounds):
+      self.emit(f'rt_for({i}, {end}, {step if node.step is not None else "0.0"}, {node.ident.line})', node.line)
+    frame = self.make_frame(node.body_stmts)
+    self.reset(frame, node.line)
+    self.emit(f'{up} = {i} < {end}', node.line)
+    if node.step is None:
+      self.emit(f'{step} = 1 if {up} else -1', node.line)
+    self.emit(f'while ({i} <= {end}) if {up} else ({i} >= {end}):', node.line)
+    self.indent += 1
+    self.store(self.resolver.slots[id(node)], i, node.line)
+    self.transpile_block(node.body_stmts, frame)
+    self.emit(f'{i} = {i} + {step}', node.line)
+    self.indent -= 1
+
+  def transpile_func_decl(self, node):
+    [(_, index)] = self.resolver.slots[id(node)]
+    func_name = self.slot_name(0, index)
+    self.funcs.append(([], set()))
+    frame = self.make_frame(node.body_stmts)
+    self.begin_scope(frame)
+    params = [self.slot_name(0, self.resolver.slots[id(param)][0][1]) for param in node.params]
+    self.end_scope(frame)
+    # With repeated parameter names, the last argument is the one that is bound
+    params = [param if param not in params[i + 1:] else f'_{i}' for i, param in enumerate(params)]
+    self.emit(f'def {func_name}({", ".join(params)}):', node.line)
+    self.indent += 1
+    header = len(self.lines)
+    self.transpile_block(node.body_stmts, frame)
+    self.emit('return 0.0', node.line)
+    local_names, nonlocal_names = self.funcs.pop()
+    # The declarations at the top of the function are only known after its body is generated
+    unset = [name for name in local_names if name not in params]
+    if unset:
+      self.insert(header, ' = '.join(unset) + ' = None', node.line)
+    if nonlocal_names:
+      self.insert(header, 'nonlocal ' + ', '.join(sorted(nonlocal_names)), node.line)
+    self.indent -= 1
+
+  def transpile(self, node):
+    '''
+    Emits the Python code of a statement, or returns the Python expression of an expression
+    '''
+    if isinstance(node, (Integer, Float)):
+      return repr(float(node.value))
+
+    elif isinstance(node, (String, Bool)):
+      return repr(node.value)
+
+    elif isinstance(node, Grouping):
+      return self.transpile(node.value)
+
+    elif isinstance(node, Identifier):
+      known = id(node) in self.resolver.known
+      return self.load(self.resolver.slots[id(node)], known, f'rt_undeclared({node.name!r}, {node.line})')
+
+    elif isinstance(node, BinOp):
+      return self.transpile_binop(node)
+
+    elif isinstance(node, UnOp):
+      return self.transpile_unop(node)
+
+    elif isinstance(node, LogicalOp):
+      op = 'or' if node.op.token_type == TOK_OR else 'and'
+      return f'({self.transpile(node.left)} {op} {self.transpile(node.right)})'
+
+    elif isinstance(node, FuncCall):
+      return self.transpile_func_call(node)
+
+    elif isinstance(node, (Assignment, LocalAssignment)):
+      self.store(self.resolver.slots[id(node)], self.transpile(node.right), node.line)
+
+    elif isinstance(node, Stmts):
+      self.transpile_block(node)
+
+    elif isinstance(node, PrintStmt):
+      if isinstance(node.value, String):
+        self.emit(f'write({node.value.value + node.end!r})', node.line)
+      else:
+        self.emit(f'write(stringify({self.transpile(node.value)}) + {node.end!r})', node.line)
+
+    elif isinstance(node, IfStmt):
+      self.transpile_if(node)
+
+    elif isinstance(node, WhileStmt):
+      self.transpile_while(node)
+
+    elif isinstance(node, ForStmt):
+      self.transpile_for(node)
+
+    elif isinstance(node, FuncDecl):
+      self.transpile_func_decl(node)
+
+    elif isinstance(node, FuncCallStmt):
+      self.emit(self.transpile(node.expr), node.expr.line)
+
+    elif isinstance(node, RetStmt):
+      self.emit(f'return {self.transpile(node.value)}', node.line)
+
+  def generate_code(self, node):
+    '''
+    Returns the Python source code of a whole program
+    '''
+    self.types.infer(node)
+    self.resolver.resolve_program(node)
+    self.funcs.append(([], set()))
+    self.emit('def pinky_main():', node.line)
+    self.indent += 1
+    frame = self.make_frame(node)
+    header = len(self.lines)
+    self.transpile_block(node, frame)
+    local_names, _ = self.funcs.pop()
+    if local_names:
+      self.insert(header, ' = '.join(local_names) + ' = None', node.line)
+    self.indent -= 1
+    return '\n'.join(self.lines) + '\n'
+
+  def run(self, node):
+    '''
+    Transpiles and runs a program, reporting any Python exception at the Pinky line that caused it
+    '''
+    source = self.generate_code(node)
+    try:
+      code = compile(source, '<pinky>', 'exec')
+    except (SyntaxError, RecursionError):
+      # Python limits how deep blocks can nest (about 20 loops or ifs) and how deep an expression can
+      # be, so such a program runs on the closure interpreter instead (it has the same semantics)
+      ClosureInterpreter(self.output).interpret_ast(node)
+      return
+    namespace = dict(RUNTIME, stringify=stringify, runtime_error=runtime_error, write=self.output.write)
+    exec(code, namespace)
+    try:
+      namespace['pinky_main']()
+    except PinkyError:
+      raise # <-- already reported at its Pinky line by the runtime helpers
+    except Exception as e:
+      frames = [frame for frame in traceback.extract_tb(e.__traceback__) if frame.filename == '<pinky>']
+      line = self.line_map[frames[-1].lineno - 1] if frames else node.line
+      if isinstance(e, ArithmeticError):
+        runtime_error(arithmetic_error_message(e), line) # <-- e.g. 10 ^ 400 overflows
+      if isinstance(e, RecursionError):
+        runtime_error(f'Maximum recursion depth exceeded.', line) # <-- at the line of the innermost call, like the interpreters
+      runtime_error(f'{type(e).__name__}: {e}', line)
+    finally:
+      self.output.flush()
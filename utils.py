@@ -1,3 +1,6 @@
+import codecs
+from output import *
+
 def print_pretty_ast(ast_text):
   i = 0
   newline = False
@@ -35,30 +38,81 @@ def stringify(val):
     return str(int(val))
   return str(val)
 
+def escape_decode(text):
+  '''
+  Processes the escape sequences (\\n, \\t, ...) of the text of a string literal
+  '''
+  if '\\' not in text:
+    return text
+  return codecs.escape_decode(bytes(text, "utf-8"))[0].decode("utf-8")
+
+###############################################################################
+# Errors are raised as exceptions, so a host that runs many programs in one process (or embeds
+# Pinky) can catch them and go on. They all derive from PinkyError and carry the source line of the
+# error (and the PC for the errors of the VMs). pinky.py reports them with report_error() and exits.
+###############################################################################
+
+class PinkyError(Exception):
+  def __init__(self, message, line=None):
+    super().__init__(message)
+    self.message = message
+    self.line = line
+
+  def where(self):
+    return f'Line {self.line}'
+
+  def __str__(self):
+    return f'[{self.where()}]: {self.message}'
+
+class LexingError(PinkyError):
+  pass
+
+class ParseError(PinkyError):
+  pass
+
+class CompileError(PinkyError):
+  pass
+
+class PinkyRuntimeError(PinkyError): # <-- not RuntimeError, which would shadow the builtin in "from utils import *"
+  pass
+
+class VMError(PinkyRuntimeError):
+  def __init__(self, message, pc, label=None, line=None):
+    super().__init__(message, line)
+    self.pc = pc
+    self.label = label
+
+  def where(self):
+    where = f'PC: {self.pc}' if self.label is None else f'PC: {self.pc} ({self.label})'
+    return where if self.line is None else f'Line {self.line}, {where}'
+
 def lexing_error(message, lineno):
-  print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
-  import sys
-  sys.exit(1)
+  raise LexingError(message, lineno)
 
 def parse_error(message, lineno):
-  print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
-  import sys
-  sys.exit(1)
+  raise ParseError(message, lineno)
 
 def runtime_error(message, lineno):
-  print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
-  import sys
-  sys.exit(1)
+  raise PinkyRuntimeError(message, lineno)
 
 def compile_error(message, lineno):
-  print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
-  import sys
-  sys.exit(1)
-
-def vm_error(message, pc):
-  print(f'{Colors.RED}[PC: {pc}]: {message} {Colors.WHITE}')
-  import sys
-  sys.exit(1)
+  raise CompileError(message, lineno)
+
+def vm_error(message, pc, label=None, line=None):
+  raise VMError(message, pc, label, line)
+
+def arithmetic_error_message(exception):
+  '''
+  The message of the runtime error for a Python ArithmeticError (e.g. 10 ^ 400 overflows a float)
+  '''
+  return 'Division by zero.' if isinstance(exception, ZeroDivisionError) else 'Numeric overflow.'
+
+def report_error(error):
+  '''
+  Prints an error the way the command line reports it
+  '''
+  flush_outputs() # <-- the output printed before the error comes first
+  print(f'{Colors.RED}{error} {Colors.WHITE}')
 
 class Colors:
   WHITE     = '\033[0m'
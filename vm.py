@@ -5,7 +5,7 @@
 #      ('PUSH', value)       # Push a value to the stack
 #      ('POP',)              # Pop a value from the stack
 #
-# Stack values are tagged with their type using a tuple:
+# The compiler tags constant values with their type using a tuple:
 #
 #      (TYPE_NUMBER, 4.0)
 #      (TYPE_NUMBER, 15.6)
@@ -13,6 +13,13 @@
 #      (TYPE_STRING, 'This is a string')
 #      (TYPE_BOOL, true)
 #
+# Values on the VM stack and in the globals are stored unboxed, as plain Python objects, and
+# their type tag is recovered from the Python type only when it is needed (e.g. for errors):
+#
+#      4.0                 --> TYPE_NUMBER (always a Python float)
+#      'This is a string'  --> TYPE_STRING
+#      True                --> TYPE_BOOL
+#
 # Instructions to add, subtract, multiply, divide, and compare values from the top of the stack
 #
 #      ('ADD',)              # Addition
@@ -32,6 +39,37 @@
 #      ('LT',)               # Compare <
 #      ('LE',)               # Compare <=
 #
+# Specialised versions of the arithmetic and comparison instructions, emitted by the compiler
+# when both operands are statically known to be numbers (they skip the runtime type checks)
+#
+#      ('ADD_NUM',)  ('SUB_NUM',)  ('MUL_NUM',)  ('DIV_NUM',)  ('MOD_NUM',)
+#      ('LT_NUM',)   ('GT_NUM',)   ('LE_NUM',)   ('GE_NUM',)
+#
+# Superinstructions, fused by the peephole optimizer from frequent sequences of instructions
+#
+#      ('POPN', n)                 # Pop n values from the stack
+#      ('LOAD_LOCAL2', (a, b))     # Push the local variables a and b
+#      ('LOAD_GLOBAL2', (a, b))    # Push the global variables a and b
+#      ('ADD_NUM_CONST', c)        # Add/subtract/multiply/divide the top of the stack by a constant number
+#      ('SUB_NUM_CONST', c)
+#      ('MUL_NUM_CONST', c)
+#      ('DIV_NUM_CONST', c)
+#      ('JMPZ_LT_NUM', pc)         # Compare the two numbers on top of the stack and jump if the result is false
+#      ('JMPZ_GT_NUM', pc)
+#      ('JMPZ_LE_NUM', pc)
+#      ('JMPZ_GE_NUM', pc)
+#      ('INC_LOCAL', (slot, c))    # Add a constant number to a local variable
+#      ('INC_GLOBAL', (slot, c))   # Add a constant number to a global variable
+#
+# Counted loops (the for statement) keep their counter, end value, step and direction in four
+# consecutive local slots starting at base, and assign the counter to the loop variable (a local
+# or a global slot) on every iteration
+#
+#      ('FOR_PREP', (base, var, is_global, has_step), pc)  # Set the default step and the direction of the
+#                                                         # loop (jump to pc if it runs zero times)
+#      ('FOR_LOOP', (base, var, is_global), pc)           # Add the step to the counter and jump back to pc
+#                                                         # while it has not passed the end value
+#
 # An example of the instruction stream for computing 7 + 2 * 3
 #
 #      ('PUSH', (TYPE_NUMBER, 7))
@@ -49,55 +87,494 @@
 #
 # Instructions to manage control-flow (if-else, while, etc.)
 #
-#      ('LABEL', name)       # Declares a label
-#      ('JMP', name)         # Unconditionally jump to label name
-#      ('JMPZ', name)        # Jump to label name if top of stack is zero (or false)
-#      ('JSR', name)         # Jump to subroutine/function and keep track of the returning PC
+#      ('JMP', pc)           # Unconditionally jump to an absolute PC
+#      ('JMPZ', pc)          # Jump to an absolute PC if top of stack is zero (or false)
+#      ('JSR', n, pc)        # Call the function at pc with the n args on top of the stack
+#      ('TAIL_JSR', n, pc)   # Call in tail position ("ret f(...)"): reuse the frame of the current function
 #      ('RTS',)              # Return from subroutine/function
 #      ('HALT',)             # Halt/stops the execution
+#
+# The calling convention: the caller pushes the args and executes JSR, whose operands are the
+# number of args (known at compile time) and the PC of the function. JSR pushes a call frame with
+# the return PC, the frame pointer of the callee (the stack index of its first arg) and the frame
+# pointer of the caller. RTS moves the result (the top of the stack) to the first slot of the
+# frame, truncates the stack above it in one operation and restores the PC and the frame pointer
+# of the caller from the frame. TAIL_JSR moves the args to the first slots of the current frame,
+# removes everything above them and jumps to the function, keeping the return PC of the frame, so
+# tail-recursive functions run in constant stack space.
+#
+# The compiler emits jumps to named labels; the assembler resolves those names to absolute PCs
+# and removes the LABEL and SET_SLOT pseudo-instructions before the code reaches the VM.
+#
+# Before running, the VM prepares the instruction stream once, replacing each opcode name by
+# an integer opcode and keeping its single (unboxed) operand alongside it:
+#
+#      ('PUSH', (TYPE_NUMBER, 7))  -->  (OP_PUSH, 7.0)
+#      ('ADD',)                    -->  (OP_ADD, None)
+#
+# The dispatch loop then compares small integers instead of looking up a method by name.
+#
+# When a profiler is passed to run(), the program runs in a separate instrumented loop instead
+# (execute_profiled), so the normal dispatch loop carries no profiling code at all.
+#
+# Runtime errors raise a VMError with the PC, the label and the source line of the instruction
+# (from the line table of the program). A division by zero or an overflow is not checked in the
+# loop: the Python ArithmeticError is turned into a VMError by run(), which finds the PC in the
+# traceback.
 
 from defs import *
 from utils import *
-import codecs
+from assembler import *
+from bytecode import *
+import time
+
+###############################################################################
+# Integer opcodes used by the prepared instruction stream
+###############################################################################
+OP_PUSH          = 0
+OP_POP           = 1
+OP_ADD           = 2
+OP_SUB           = 3
+OP_MUL           = 4
+OP_DIV           = 5
+OP_EXP           = 6
+OP_MOD           = 7
+OP_AND           = 8
+OP_OR            = 9
+OP_XOR           = 10
+OP_NEG           = 11
+OP_LT            = 12
+OP_GT            = 13
+OP_LE            = 14
+OP_GE            = 15
+OP_EQ            = 16
+OP_NE            = 17
+OP_PRINT         = 18
+OP_PRINTLN       = 19
+OP_JMP           = 20
+OP_JMPZ          = 21
+OP_JSR           = 22
+OP_RTS           = 23
+OP_LOAD_GLOBAL   = 24
+OP_STORE_GLOBAL  = 25
+OP_LOAD_LOCAL    = 26
+OP_STORE_LOCAL   = 27
+OP_HALT          = 28
+OP_ADD_NUM       = 29
+OP_SUB_NUM       = 30
+OP_MUL_NUM       = 31
+OP_DIV_NUM       = 32
+OP_MOD_NUM       = 33
+OP_LT_NUM        = 34
+OP_GT_NUM        = 35
+OP_LE_NUM        = 36
+OP_GE_NUM        = 37
+OP_POPN          = 38
+OP_LOAD_LOCAL2   = 39
+OP_LOAD_GLOBAL2  = 40
+OP_ADD_NUM_CONST = 41
+OP_SUB_NUM_CONST = 42
+OP_MUL_NUM_CONST = 43
+OP_DIV_NUM_CONST = 44
+OP_JMPZ_LT_NUM   = 45
+OP_JMPZ_GT_NUM   = 46
+OP_JMPZ_LE_NUM   = 47
+OP_JMPZ_GE_NUM   = 48
+OP_INC_LOCAL     = 49
+OP_INC_GLOBAL    = 50
+OP_FOR_PREP      = 51
+OP_FOR_LOOP      = 52
+OP_TAIL_JSR      = 53
+
+###############################################################################
+# Opcode names indexed by their integer opcode (used to build the handler table)
+###############################################################################
+OPCODE_NAMES = [
+  'PUSH', 'POP', 'ADD', 'SUB', 'MUL', 'DIV', 'EXP', 'MOD', 'AND', 'OR', 'XOR', 'NEG',
+  'LT', 'GT', 'LE', 'GE', 'EQ', 'NE', 'PRINT', 'PRINTLN', 'JMP', 'JMPZ', 'JSR', 'RTS',
+  'LOAD_GLOBAL', 'STORE_GLOBAL', 'LOAD_LOCAL', 'STORE_LOCAL', 'HALT', 'ADD_NUM', 'SUB_NUM',
+  'MUL_NUM', 'DIV_NUM', 'MOD_NUM', 'LT_NUM', 'GT_NUM', 'LE_NUM', 'GE_NUM', 'POPN', 'LOAD_LOCAL2',
+  'LOAD_GLOBAL2', 'ADD_NUM_CONST', 'SUB_NUM_CONST', 'MUL_NUM_CONST', 'DIV_NUM_CONST', 'JMPZ_LT_NUM',
+  'JMPZ_GT_NUM', 'JMPZ_LE_NUM', 'JMPZ_GE_NUM', 'INC_LOCAL', 'INC_GLOBAL', 'FOR_PREP', 'FOR_LOOP',
+  'TAIL_JSR',
+]
+
+###############################################################################
+# Dictionary mapping opcode names to their integer opcodes
+###############################################################################
+opcodes = {name: op for op, name in enumerate(OPCODE_NAMES)}
+
+def unbox(value):
+  '''
+  Converts a tagged (type, value) constant into its unboxed runtime representation
+  '''
+  valtype, val = value
+  if valtype == TYPE_NUMBER:
+    return float(val)
+  return val
+
+def loop_pc(exception, loop):
+  '''
+  Returns the PC of the instruction that was running in a dispatch loop when an exception was raised
+  (the loop keeps the PC of the next instruction in its local pc), or None if the loop is not in the traceback
+  '''
+  pc = None
+  tb = exception.__traceback__
+  while tb is not None:
+    if tb.tb_frame.f_code is loop.__code__:
+      pc = tb.tb_frame.f_locals['pc'] - 1
+    tb = tb.tb_next
+  return pc
 
 class Frame:
-  def __init__(self, name, ret_pc, fp):
-    self.name = name
-    self.ret_pc = ret_pc
-    self.fp = fp
+  __slots__ = ('target', 'ret_pc', 'fp', 'ret_fp')
+
+  def __init__(self, target, ret_pc, fp, ret_fp):
+    self.target = target  # PC of the called function (the name of the function is program.names[target])
+    self.ret_pc = ret_pc  # PC to return to
+    self.fp = fp          # Stack index of the first slot of the frame (its first arg)
+    self.ret_fp = ret_fp  # Frame pointer of the caller, restored on return
 
 class VM:
-  def __init__(self):
+  def __init__(self, output=None):
+    self.output = Output() if output is None else output # <-- the sink of PRINT/PRINTLN
     self.stack = []
     self.frames = []
-    self.labels = {}
+    self.frame_pool = []
+    self.program = None
+    self.prepared = None # <-- (program, prepared code) of the last program run, reused by the next run of the same program
     self.globals = {}
     self.pc = 0
     self.sp = 0
     self.is_running = False
 
-  def create_label_table(self, instructions):
-    self.labels = {}
-    pc = 0
+  def prepare(self, instructions):
+    '''
+    Translate the instruction list into its prepared form: a list of (opcode, arg) pairs where
+    the opcode is an integer and arg is the single operand of the instruction (or None)
+    '''
+    prepared = []
     for instruction in instructions:
       opcode, *args = instruction
-      if opcode == 'LABEL':
-        self.labels.update({args[0]: pc})
-#        print("GENERATED LABEL:", args[0], pc)
-      pc += 1
-
-  def run(self, instructions):
+      if opcode not in opcodes:
+        self.error(f'Unknown opcode {opcode!r}.', len(prepared))
+      if opcode == 'PUSH':
+        args = [unbox(args[0])]
+      elif len(args) > 1:
+        # Instructions with several operands (JSR, and the loop instructions that have a tuple of
+        # operands and a jump target) are prepared with a single flat tuple of operands
+        args = [sum((arg if isinstance(arg, tuple) else (arg,) for arg in args), ())]
+      prepared.append((opcodes[opcode], args[0] if args else None))
+    return prepared
+
+  def load(self, filename):
+    '''
+    Loads an assembled program from a bytecode file (see bytecode.py)
+    '''
+    program = read_bytecode(filename)
+    if program is None:
+      vm_error(f'Invalid bytecode file {filename!r}.', 0)
+    return program
+
+  def error(self, message, pc):
+    vm_error(message, pc, self.program.label_for(pc), self.program.line_for(pc))
+
+  def run(self, instructions, profiler=None):
+    # Accept either an assembled program or the symbolic code that comes out of the compiler
+    if isinstance(instructions, Program):
+      self.program = instructions
+    else:
+      self.program = Assembler().assemble(instructions)
+    if self.prepared is None or self.prepared[0] is not self.program:
+      self.prepared = (self.program, self.prepare(self.program.code))
+    code = self.prepared[1]
+    # A VM can run programs again: a run that failed leaves its stack and frames behind
+    self.stack.clear()
+    self.frames.clear()
     self.pc = 0
     self.sp = 0
     self.is_running = True
+    try:
+      if profiler is None:
+        self.execute(code)
+      else:
+        self.execute_profiled(code, profiler)
+    except ArithmeticError as exception:
+      pc = loop_pc(exception, self.execute)
+      self.error(arithmetic_error_message(exception), self.pc - 1 if pc is None else pc)
+    finally:
+      self.output.flush()
+
+  def execute(self, code):
+    '''
+    The dispatch loop over prepared code. The most frequent opcodes are handled inline on local
+    aliases of the VM state, and the remaining ones fall back to the handler methods below (which
+    are the reference implementation of every instruction).
+    '''
+    handlers = [getattr(self, name) for name in OPCODE_NAMES]
+    stack = self.stack
+    push = stack.append
+    pop = stack.pop
+    frames = self.frames
+    frame_pool = self.frame_pool
+    global_vars = self.globals
+    write = self.output.write
+    fp = frames[-1].fp if frames else 0
+    pc = self.pc
+
+    while True:
+      op, arg = code[pc]
+      pc += 1
+      if op == OP_FOR_LOOP:
+        base, var, is_global, target = arg
+        base += fp
+        i = stack[base] + stack[base + 2]
+        stack[base] = i
+        if i <= stack[base + 1] if stack[base + 3] else i >= stack[base + 1]:
+          if is_global:
+            global_vars[var] = i
+          else:
+            stack[fp + var] = i
+          pc = target
+      elif op == OP_LOAD_LOCAL2:
+        push(stack[fp + arg[0]])
+        push(stack[fp + arg[1]])
+      elif op == OP_LOAD_LOCAL:
+        push(stack[fp + arg])
+      elif op == OP_ADD_NUM:
+        right = pop()
+        stack[-1] += right
+      elif op == OP_MUL_NUM:
+        right = pop()
+        stack[-1] *= right
+      elif op == OP_DIV_NUM_CONST:
+        stack[-1] /= arg
+      elif op == OP_LOAD_GLOBAL:
+        push(global_vars[arg])
+      elif op == OP_STORE_LOCAL:
+        stack[fp + arg] = pop()
+      elif op == OP_PUSH:
+        push(arg)
+      elif op == OP_POPN:
+        del stack[-arg:]
+      elif op == OP_JMP:
+        pc = arg
+      elif op == OP_JMPZ_LT_NUM:
+        right = pop()
+        if not pop() < right:
+          pc = arg
+      elif op == OP_JMPZ_GT_NUM:
+        right = pop()
+        if not pop() > right:
+          pc = arg
+      elif op == OP_SUB_NUM:
+        right = pop()
+        stack[-1] -= right
+      elif op == OP_INC_LOCAL:
+        stack[fp + arg[0]] += arg[1]
+      elif op == OP_JMPZ:
+        val = pop()
+        if val == 0 or val == False:
+          pc = arg
+      elif op == OP_EQ:
+        right = pop()
+        left = stack[-1]
+        if type(left) is type(right):
+          stack[-1] = left == right
+        else:
+          self.error(f'Error on EQ between {type_of(left)} and {type_of(right)}', pc - 1)
+      elif op == OP_JSR:
+        numargs, target = arg
+        callee_fp = len(stack) - numargs
+        depth = len(frames)
+        if depth < len(frame_pool):
+          # Reuse the frame record of a previous call at the same depth
+          frame = frame_pool[depth]
+          frame.target = target
+          frame.ret_pc = pc
+          frame.fp = callee_fp
+          frame.ret_fp = fp
+        else:
+          frame = Frame(target, pc, callee_fp, fp)
+          frame_pool.append(frame)
+        frames.append(frame)
+        fp = callee_fp
+        pc = target # <-- jump to the subroutine
+      elif op == OP_TAIL_JSR:
+        numargs, target = arg
+        del stack[fp:len(stack) - numargs] # <-- the args become the first slots of the current frame
+        frames[-1].target = target
+        pc = target
+      elif op == OP_RTS:
+        frame = frames.pop()
+        stack[fp] = stack[-1] # move the result of the function to the first slot of the frame
+        del stack[fp + 1:]    # and remove all the other values of the frame from the stack
+        pc = frame.ret_pc
+        fp = frame.ret_fp
+      elif op == OP_STORE_GLOBAL:
+        global_vars[arg] = pop()
+      elif op == OP_DIV_NUM:
+        right = pop()
+        stack[-1] /= right
+      elif op == OP_POP:
+        pop()
+      elif op == OP_ADD_NUM_CONST:
+        stack[-1] += arg
+      elif op == OP_SUB_NUM_CONST:
+        stack[-1] -= arg
+      elif op == OP_MUL_NUM_CONST:
+        stack[-1] *= arg
+      elif op == OP_LOAD_GLOBAL2:
+        push(global_vars[arg[0]])
+        push(global_vars[arg[1]])
+      elif op == OP_INC_GLOBAL:
+        global_vars[arg[0]] += arg[1]
+      elif op == OP_JMPZ_LE_NUM:
+        right = pop()
+        if not pop() <= right:
+          pc = arg
+      elif op == OP_JMPZ_GE_NUM:
+        right = pop()
+        if not pop() >= right:
+          pc = arg
+      elif op == OP_LT_NUM:
+        right = pop()
+        stack[-1] = stack[-1] < right
+      elif op == OP_GT_NUM:
+        right = pop()
+        stack[-1] = stack[-1] > right
+      elif op == OP_LE_NUM:
+        right = pop()
+        stack[-1] = stack[-1] <= right
+      elif op == OP_GE_NUM:
+        right = pop()
+        stack[-1] = stack[-1] >= right
+      elif op == OP_MOD_NUM:
+        right = pop()
+        stack[-1] %= right
+      elif op == OP_ADD:
+        right = pop()
+        left = stack[-1]
+        if type(left) is float and type(right) is float:
+          stack[-1] = left + right
+        elif type(left) is str or type(right) is str:
+          stack[-1] = stringify(left) + stringify(right)
+        else:
+          self.error(f'Error on ADD between {type_of(left)} and {type_of(right)}.', pc - 1)
+      elif op == OP_SUB:
+        right = pop()
+        left = stack[-1]
+        if type(left) is float and type(right) is float:
+          stack[-1] = left - right
+        else:
+          self.error(f'Error on SUB between {type_of(left)} and {type_of(right)}.', pc - 1)
+      elif op == OP_MUL:
+        right = pop()
+        left = stack[-1]
+        if type(left) is float and type(right) is float:
+          stack[-1] = left * right
+        else:
+          self.error(f'Error on MUL between {type_of(left)} and {type_of(right)}.', pc - 1)
+      elif op == OP_DIV:
+        right = pop()
+        left = stack[-1]
+        if type(left) is float and type(right) is float:
+          stack[-1] = left / right
+        else:
+          self.error(f'Error on DIV between {type_of(left)} and {type_of(right)}.', pc - 1)
+      elif op == OP_LT:
+        right = pop()
+        left = stack[-1]
+        if type(left) is type(right) and type(left) is not bool:
+          stack[-1] = left < right
+        else:
+          self.error(f'Error on LT between {type_of(left)} and {type_of(right)}', pc - 1)
+      elif op == OP_GT:
+        right = pop()
+        left = stack[-1]
+        if type(left) is type(right) and type(left) is not bool:
+          stack[-1] = left > right
+        else:
+          self.error(f'Error on GT between {type_of(left)} and {type_of(right)}', pc - 1)
+      elif op == OP_LE:
+        right = pop()
+        left = stack[-1]
+        if type(left) is type(right) and type(left) is not bool:
+          stack[-1] = left <= right
+        else:
+          self.error(f'Error on LE between {type_of(left)} and {type_of(right)}', pc - 1)
+      elif op == OP_GE:
+        right = pop()
+        left = stack[-1]
+        if type(left) is type(right) and type(left) is not bool:
+          stack[-1] = left >= right
+        else:
+          self.error(f'Error on GE between {type_of(left)} and {type_of(right)}', pc - 1)
+      elif op == OP_NE:
+        right = pop()
+        left = stack[-1]
+        if type(left) is type(right):
+          stack[-1] = left != right
+        else:
+          self.error(f'Error on NE between {type_of(left)} and {type_of(right)}', pc - 1)
+      elif op == OP_PRINT:
+        write(stringify(pop()))
+      elif op == OP_PRINTLN:
+        write(stringify(pop()) + '\n')
+      elif op == OP_HALT:
+        self.output.flush()
+        break
+      else:
+        # Slow path: synchronize the VM state and invoke the reference handler method
+        self.pc = pc
+        self.sp = len(stack)
+        if arg is None:
+          handlers[op]()
+        else:
+          handlers[op](arg)
+        pc = self.pc
+
+    self.pc = pc
+    self.sp = len(stack)
+    self.is_running = False
 
-    # Generate a dict with label names and their corresponding PC positions/addresses in the code
-    self.create_label_table(instructions)
+  def execute_profiled(self, code, profiler):
+    '''
+    The instrumented dispatch loop: every instruction runs through its reference handler method,
+    and the profiler records its opcode, PC, time and the stack of functions that executed it
+    '''
+    handlers = [getattr(self, name) for name in OPCODE_NAMES]
+    profiler.start(self.program, code)
+    op_counts, op_times = profiler.op_counts, profiler.op_times
+    pc_counts, pc_times, pc_stacks = profiler.pc_counts, profiler.pc_times, profiler.pc_stacks
+    stack_counts = profiler.stack_counts
+    frames = self.frames
+    clock = time.perf_counter
+    depth = len(frames)
+    top = frames[-1].target if frames else None
+    stack = tuple(frame.target for frame in frames) # <-- PCs of the functions being executed
 
     while self.is_running:
-      opcode, *args = instructions[self.pc]
-      self.pc = self.pc + 1
-      getattr(self, opcode)(*args) #--> invoke the method that matches the opcode name
+      pc = self.pc
+      op, arg = code[pc]
+      self.pc = pc + 1
+      self.sp = len(self.stack)
+      start = clock()
+      if arg is None:
+        handlers[op]()
+      else:
+        handlers[op](arg)
+      elapsed = clock() - start
+      op_counts[op] += 1
+      op_times[op] += elapsed
+      pc_counts[pc] += 1
+      pc_times[pc] += elapsed
+      pc_stacks[pc] = stack
+      stack_counts[stack] = stack_counts.get(stack, 0) + 1
+      if len(frames) != depth or (frames and frames[-1].target != top):
+        depth = len(frames)
+        top = frames[-1].target if frames else None
+        stack = tuple(frame.target for frame in frames)
 
   def PUSH(self, value):
     self.stack.append(value)
@@ -108,189 +585,305 @@ class VM:
     return self.stack.pop()
 
   def ADD(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval + rightval))
-    elif lefttype == TYPE_STRING or righttype == TYPE_STRING:
-      self.PUSH((TYPE_STRING, stringify(leftval) + stringify(rightval)))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left + right)
+    elif type(left) is str or type(right) is str:
+      self.PUSH(stringify(left) + stringify(right))
     else:
-      vm_error(f'Error on ADD between {lefttype} and {righttype}.', self.pc - 1)
+      self.error(f'Error on ADD between {type_of(left)} and {type_of(right)}.', self.pc - 1)
 
   def SUB(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval - rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left - right)
     else:
-      vm_error(f'Error on SUB between {lefttype} and {righttype}.', self.pc - 1)
+      self.error(f'Error on SUB between {type_of(left)} and {type_of(right)}.', self.pc - 1)
 
   def MUL(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval * rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left * right)
     else:
-      vm_error(f'Error on MUL between {lefttype} and {righttype}.', self.pc - 1)
+      self.error(f'Error on MUL between {type_of(left)} and {type_of(right)}.', self.pc - 1)
 
   def DIV(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval / rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left / right)
     else:
-      vm_error(f'Error on DIV between {lefttype} and {righttype}.', self.pc - 1)
+      self.error(f'Error on DIV between {type_of(left)} and {type_of(right)}.', self.pc - 1)
 
   def EXP(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval ** rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left ** right)
     else:
-      vm_error(f'Error on EXP between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on EXP between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def MOD(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval % rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left % right)
     else:
-      vm_error(f'Error on MOD between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on MOD between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def AND(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval & rightval))
-    elif lefttype == TYPE_BOOL and righttype == TYPE_BOOL:
-      self.PUSH((TYPE_BOOL, leftval & rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is bool and type(right) is bool: # <-- the bitwise operators of Python are not defined on floats
+      self.PUSH(left & right)
     else:
-      vm_error(f'Error on AND between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on AND between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def OR(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval | rightval))
-    elif lefttype == TYPE_BOOL and righttype == TYPE_BOOL:
-      self.PUSH((TYPE_BOOL, leftval | rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is bool and type(right) is bool: # <-- the bitwise operators of Python are not defined on floats
+      self.PUSH(left | right)
     else:
-      vm_error(f'Error on OR between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on OR between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def XOR(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, leftval ^ rightval))
-    elif lefttype == TYPE_BOOL and righttype == TYPE_BOOL:
-      self.PUSH((TYPE_BOOL, leftval ^ rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is bool and type(right) is bool: # <-- the bitwise operators of Python are not defined on floats
+      self.PUSH(left ^ right)
     else:
-      vm_error(f'Error on XOR between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on XOR between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def NEG(self):
-    operandtype, operand = self.POP()
-    if operandtype == TYPE_NUMBER:
-      self.PUSH((TYPE_NUMBER, -operand))
+    operand = self.POP()
+    if type(operand) is float:
+      self.PUSH(-operand)
     else:
-      vm_error(f'Error on NEG between {operandtype}', self.pc - 1)
+      self.error(f'Error on NEG between {type_of(operand)}', self.pc - 1)
 
   def LT(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_BOOL, leftval < rightval))
-    elif lefttype == TYPE_STRING and righttype == TYPE_STRING:
-      self.PUSH((TYPE_BOOL, leftval < rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left < right)
+    elif type(left) is str and type(right) is str:
+      self.PUSH(left < right)
     else:
-      vm_error(f'Error on LT between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on LT between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def GT(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_BOOL, leftval > rightval))
-    elif lefttype == TYPE_STRING and righttype == TYPE_STRING:
-      self.PUSH((TYPE_BOOL, leftval > rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left > right)
+    elif type(left) is str and type(right) is str:
+      self.PUSH(left > right)
     else:
-      vm_error(f'Error on GT between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on GT between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def LE(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_BOOL, leftval <= rightval))
-    elif lefttype == TYPE_STRING and righttype == TYPE_STRING:
-      self.PUSH((TYPE_BOOL, leftval <= rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left <= right)
+    elif type(left) is str and type(right) is str:
+      self.PUSH(left <= right)
     else:
-      vm_error(f'Error on LE between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on LE between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def GE(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_BOOL, leftval >= rightval))
-    elif lefttype == TYPE_STRING and righttype == TYPE_STRING:
-      self.PUSH((TYPE_BOOL, leftval >= rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is float and type(right) is float:
+      self.PUSH(left >= right)
+    elif type(left) is str and type(right) is str:
+      self.PUSH(left >= right)
     else:
-      vm_error(f'Error on GE between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on GE between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def EQ(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_BOOL, leftval == rightval))
-    elif lefttype == TYPE_BOOL and righttype == TYPE_BOOL:
-      self.PUSH((TYPE_BOOL, leftval == rightval))
-    elif lefttype == TYPE_STRING and righttype == TYPE_STRING:
-      self.PUSH((TYPE_BOOL, leftval == rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is type(right):
+      self.PUSH(left == right)
     else:
-      vm_error(f'Error on EQ between {lefttype} and {righttype}', self.pc - 1)
+      self.error(f'Error on EQ between {type_of(left)} and {type_of(right)}', self.pc - 1)
 
   def NE(self):
-    righttype, rightval = self.POP()
-    lefttype, leftval = self.POP()
-    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-      self.PUSH((TYPE_BOOL, leftval != rightval))
-    elif lefttype == TYPE_BOOL and righttype == TYPE_BOOL:
-      self.PUSH((TYPE_BOOL, leftval != rightval))
-    elif lefttype == TYPE_STRING and righttype == TYPE_STRING:
-      self.PUSH((TYPE_BOOL, leftval != rightval))
+    right = self.POP()
+    left = self.POP()
+    if type(left) is type(right):
+      self.PUSH(left != right)
+    else:
+      self.error(f'Error on NE between {type_of(left)} and {type_of(right)}', self.pc - 1)
+
+  def ADD_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() + right)
+
+  def SUB_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() - right)
+
+  def MUL_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() * right)
+
+  def DIV_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() / right)
+
+  def MOD_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() % right)
+
+  def LT_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() < right)
+
+  def GT_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() > right)
+
+  def LE_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() <= right)
+
+  def GE_NUM(self):
+    right = self.POP()
+    self.PUSH(self.POP() >= right)
+
+  def POPN(self, n):
+    for i in range(n):
+      self.POP()
+
+  def LOAD_LOCAL2(self, slots):
+    self.LOAD_LOCAL(slots[0])
+    self.LOAD_LOCAL(slots[1])
+
+  def LOAD_GLOBAL2(self, slots):
+    self.LOAD_GLOBAL(slots[0])
+    self.LOAD_GLOBAL(slots[1])
+
+  def ADD_NUM_CONST(self, value):
+    self.PUSH(self.POP() + value)
+
+  def SUB_NUM_CONST(self, value):
+    self.PUSH(self.POP() - value)
+
+  def MUL_NUM_CONST(self, value):
+    self.PUSH(self.POP() * value)
+
+  def DIV_NUM_CONST(self, value):
+    self.PUSH(self.POP() / value)
+
+  def JMPZ_LT_NUM(self, target):
+    self.LT_NUM()
+    self.JMPZ(target)
+
+  def JMPZ_GT_NUM(self, target):
+    self.GT_NUM()
+    self.JMPZ(target)
+
+  def JMPZ_LE_NUM(self, target):
+    self.LE_NUM()
+    self.JMPZ(target)
+
+  def JMPZ_GE_NUM(self, target):
+    self.GE_NUM()
+    self.JMPZ(target)
+
+  def INC_LOCAL(self, operands):
+    slot, value = operands
+    self.LOAD_LOCAL(slot)
+    self.ADD_NUM_CONST(value)
+    self.STORE_LOCAL(slot)
+
+  def INC_GLOBAL(self, operands):
+    slot, value = operands
+    self.LOAD_GLOBAL(slot)
+    self.ADD_NUM_CONST(value)
+    self.STORE_GLOBAL(slot)
+
+  def FOR_PREP(self, operands):
+    base, var, is_global, has_step, target = operands
+    if len(self.frames) > 0:
+      base += self.frames[-1].fp
+    start = self.stack[base]
+    if type(start) is not float or type(self.stack[base + 1]) is not float or (has_step and type(self.stack[base + 2]) is not float):
+      self.error(f'For loop start, end and step must be numbers.', self.pc - 1)
+    up = start < self.stack[base + 1]
+    if not has_step:
+      self.stack[base + 2] = 1.0 if up else -1.0
+    self.stack[base + 3] = up
+    if start <= self.stack[base + 1] if up else start >= self.stack[base + 1]:
+      self.store_var(var, is_global, start)
     else:
-      vm_error(f'Error on NE between {lefttype} and {righttype}', self.pc - 1)
+      self.pc = target
+
+  def FOR_LOOP(self, operands):
+    base, var, is_global, target = operands
+    if len(self.frames) > 0:
+      base += self.frames[-1].fp
+    i = self.stack[base] + self.stack[base + 2]
+    self.stack[base] = i
+    if i <= self.stack[base + 1] if self.stack[base + 3] else i >= self.stack[base + 1]:
+      self.store_var(var, is_global, i)
+      self.pc = target
+
+  def store_var(self, slot, is_global, value):
+    if is_global:
+      self.globals[slot] = value
+    else:
+      if len(self.frames) > 0:
+        slot += self.frames[-1].fp
+      self.stack[slot] = value
 
   def PRINT(self):
-    valtype, val = self.POP()
-    print(codecs.escape_decode(bytes(stringify(val), "utf-8"))[0].decode("utf-8"), end='')
+    val = self.POP()
+    self.output.write(stringify(val))
 
   def PRINTLN(self):
-    valtype, val = self.POP()
-    print(codecs.escape_decode(bytes(stringify(val), "utf-8"))[0].decode("utf-8"), end='\n')
-
-  def LABEL(self, name):
-    pass
+    val = self.POP()
+    self.output.write(stringify(val) + '\n')
 
-  def JMP(self, label):
-    self.pc = self.labels[label]
+  def JMP(self, target):
+    self.pc = target
 
-  def JMPZ(self, label):
-    valtype, val = self.POP()
+  def JMPZ(self, target):
+    val = self.POP()
     if val == 0 or val == False:
-      self.pc = self.labels[label]
-
-  def JSR(self, label):
-    numargstype, numargs = self.POP() # <-- pop the numargs (the last value that was pushed to the top of the stack before JSR)
-    base_pointer = self.sp - numargs
-    new_frame = Frame(name=label, ret_pc=self.pc, fp=base_pointer)
-    self.frames.append(new_frame)
-    self.pc = self.labels[label] # <-- jump to the subroutine
+      self.pc = target
+
+  def JSR(self, operands):
+    numargs, target = operands
+    caller_fp = self.frames[-1].fp if self.frames else 0
+    depth = len(self.frames)
+    if depth == len(self.frame_pool):
+      self.frame_pool.append(Frame(target, self.pc, self.sp - numargs, caller_fp))
+    frame = self.frame_pool[depth] # <-- frame records are preallocated, and reused by every call at the same depth
+    frame.target, frame.ret_pc, frame.fp, frame.ret_fp = target, self.pc, self.sp - numargs, caller_fp
+    self.frames.append(frame)
+    self.pc = target # <-- jump to the subroutine
+
+  def TAIL_JSR(self, operands):
+    numargs, target = operands
+    frame = self.frames[-1]
+    del self.stack[frame.fp:self.sp - numargs] # <-- the args become the first slots of the current frame
+    self.sp = frame.fp + numargs
+    frame.target = target
+    self.pc = target
 
   def RTS(self):
-    result = self.stack[self.sp - 1]    # fetch the result of the function that was left in the top of the stack just before the RTS
-    while self.sp > self.frames[-1].fp: # Remove all the values of the current active frame from the stack
-      self.POP()
-    self.PUSH(result)                   # set the top of the stack with the return value from the function
-    self.pc = self.frames[-1].ret_pc    # set the returning PC to the one stored in the last call frame
-    self.frames.pop()                   # remove the frame object from the list
+    frame = self.frames.pop()
+    self.stack[frame.fp] = self.stack[self.sp - 1] # move the result of the function to the first slot of the frame
+    del self.stack[frame.fp + 1:]                  # and remove all the other values of the frame from the stack
+    self.sp = frame.fp + 1
+    self.pc = frame.ret_pc
 
   def LOAD_GLOBAL(self, slot):
     self.PUSH(self.globals[slot])
@@ -308,8 +901,6 @@ class VM:
       slot += self.frames[-1].fp
     self.stack[slot] = self.POP()
 
-  def SET_SLOT(self, slot):
-    pass
-
   def HALT(self):
     self.is_running = False
+    self.output.flush()
@@ -0,0 +1,91 @@
+# Compares the stack VM and the register VM head-to-head on Pinky programs. Both back ends compile
+# the same (optimized) AST, and for every program the tool reports:
+#
+#   - the number of instructions of the code (static count)
+#   - the number of instructions executed, i.e. the number of dispatches (dynamic count)
+#   - the best run time of each VM
+#   - whether both VMs printed the same output
+#
+#      python3 vmcompare.py scripts/*.pinky
+#      python3 vmcompare.py --repeat 5 scripts/mandel.pinky
+import io
+import time
+import argparse
+import contextlib
+from lexer import *
+from parser import *
+from optimizer import *
+from compiler import *
+from peephole import *
+from assembler import *
+from vm import *
+from regcompiler import *
+from regvm import *
+
+class CountingCode(list):
+  '''
+  Prepared code that counts the instructions fetched by the dispatch loop of a VM
+  '''
+  def __init__(self, code):
+    super().__init__(code)
+    self.fetches = 0
+
+  def __getitem__(self, pc):
+    self.fetches += 1
+    return list.__getitem__(self, pc)
+
+def run_program(vm, program, count=False):
+  '''
+  Runs an assembled program and returns its output, run time and number of executed instructions
+  '''
+  vm.program = program
+  code = vm.prepare(program.code)
+  if count:
+    code = CountingCode(code)
+  output = io.StringIO()
+  with contextlib.redirect_stdout(output):
+    start = time.perf_counter()
+    try:
+      vm.execute(code)
+    except PinkyError as error:
+      report_error(error)
+    elapsed = time.perf_counter() - start
+  return output.getvalue(), elapsed, code.fetches if count else None
+
+def compare(source, repeat):
+  tokens = Lexer(source).tokenize()
+  ast = Parser(tokens).parse()
+  ast = Optimizer().optimize(ast)
+  programs = {
+    'stack': (VM, Assembler().assemble(Peephole().optimize(Compiler().generate_code(ast)))),
+    'register': (RegisterVM, Assembler(REG_JUMP_OPS).assemble(RegisterCompiler().generate_code(ast))),
+  }
+  results = {}
+  for name, (vm_class, program) in programs.items():
+    output, _, executed = run_program(vm_class(), program, count=True)
+    elapsed = min(run_program(vm_class(), program)[1] for _ in range(repeat))
+    results[name] = (len(program.code), executed, elapsed, output)
+  return results
+
+def reduction(stack, register):
+  return f'{100 * (stack - register) / stack:.1f}%' if stack else '-'
+
+if __name__ == '__main__':
+  argparser = argparse.ArgumentParser(description='Compare the stack VM and the register VM on Pinky programs.')
+  argparser.add_argument('files', nargs='+', help='Pinky source files')
+  argparser.add_argument('--repeat', type=int, default=3, help='number of timed runs per VM (the best one is reported)')
+  args = argparser.parse_args()
+
+  print(f'{Colors.MAGENTA}{"program":<32}{"vm":<10}{"static":>10}{"executed":>14}{"time":>10}{Colors.WHITE}')
+  for filename in args.files:
+    with open(filename) as file:
+      source = file.read()
+    results = compare(source, args.repeat)
+    for name, (static, executed, elapsed, _) in results.items():
+      print(f'{filename:<32}{name:<10}{static:>10}{executed:>14}{elapsed:>9.3f}s')
+    (stack_static, stack_executed, stack_time, stack_output) = results['stack']
+    (reg_static, reg_executed, reg_time, reg_output) = results['register']
+    same = 'same output' if stack_output == reg_output else f'{Colors.RED}different output{Colors.WHITE}'
+    print(f'{"":<32}{"saved":<10}{reduction(stack_static, reg_static):>10}{reduction(stack_executed, reg_executed):>14}'
+          f'{stack_time / reg_time if reg_time else 0:>9.2f}x  {same}')
+    print()
@@ -0,0 +1,114 @@
+from utils import *
+from vm import *
+
+###############################################################################
+# The VM profiler collects, for a run of VM.run(program, profiler):
+#
+#   - the number of executions and the cumulative time of every opcode
+#   - the number of executions and the cumulative time of every PC, and the stack of functions that
+#     executed it (a tuple with the PC of every called function, from the outermost call)
+#
+# PCs map back to Pinky source lines through the line table of the program, and function PCs to
+# their labels (program.names). The collapsed stacks have one line per stack of functions with the
+# number of instructions executed in it, e.g. "START;dragon;sin 12345", which flame graph tools
+# (flamegraph.pl, speedscope, ...) read directly.
+#
+#      python3 pinky.py -q --profile scripts/dragon.pinky
+#      python3 pinky.py -q --profile --collapsed dragon.folded scripts/dragon.pinky
+###############################################################################
+
+MAIN_NAME = 'START' # <-- the code outside functions runs under the label of the entry point
+
+class VMProfiler:
+  def __init__(self):
+    self.program = None
+    self.op_counts = [0] * len(OPCODE_NAMES)
+    self.op_times = [0.0] * len(OPCODE_NAMES)
+    self.pc_counts = []
+    self.pc_times = []
+    self.pc_stacks = []
+    self.stack_counts = {}
+
+  def start(self, program, code):
+    self.program = program
+    self.pc_counts = [0] * len(code)
+    self.pc_times = [0.0] * len(code)
+    self.pc_stacks = [()] * len(code)
+
+  def function_name(self, stack):
+    '''
+    The name of the function that runs on top of a stack of function PCs
+    '''
+    return self.program.names.get(stack[-1], str(stack[-1])) if stack else MAIN_NAME
+
+  def total_count(self):
+    return sum(self.op_counts)
+
+  def total_time(self):
+    return sum(self.op_times)
+
+  def opcodes(self):
+    '''
+    Returns (name, count, time) for every executed opcode, from the most executed one
+    '''
+    rows = [(OPCODE_NAMES[op], count, self.op_times[op]) for op, count in enumerate(self.op_counts) if count]
+    return sorted(rows, key=lambda row: -row[1])
+
+  def functions(self):
+    '''
+    Returns (name, count, time) for every function, with the instructions executed in its own code
+    '''
+    totals = {}
+    for pc, count in enumerate(self.pc_counts):
+      if count:
+        name = self.function_name(self.pc_stacks[pc])
+        total_count, total_time = totals.get(name, (0, 0.0))
+        totals[name] = (total_count + count, total_time + self.pc_times[pc])
+    return sorted(((name, count, time) for name, (count, time) in totals.items()), key=lambda row: -row[2])
+
+  def lines(self):
+    '''
+    Returns (function name, line, count, time) for every source line, from the slowest one
+    '''
+    totals = {}
+    for pc, count in enumerate(self.pc_counts):
+      if count:
+        key = (self.function_name(self.pc_stacks[pc]), self.program.line_for(pc))
+        total_count, total_time = totals.get(key, (0, 0.0))
+        totals[key] = (total_count + count, total_time + self.pc_times[pc])
+    return sorted(((name, line, count, time) for (name, line), (count, time) in totals.items()), key=lambda row: -row[3])
+
+  def collapsed(self):
+    '''
+    Returns the collapsed stacks: one "outer;inner;... count" line per stack of functions
+    '''
+    lines = []
+    for stack, count in sorted(self.stack_counts.items()):
+      names = [MAIN_NAME] + [self.program.names.get(pc, str(pc)) for pc in stack]
+      lines.append(f'{";".join(names)} {count}')
+    return lines
+
+  def report(self, limit=15, file=None):
+    '''
+    Prints the flat report: the opcode histogram, the hot functions and the hot source lines
+    '''
+    total_count = self.total_count() or 1
+    total_time = self.total_time() or 1.0
+    print(f'{Colors.MAGENTA}{"opcode":<20}{"count":>12}{"%":>8}{"time":>11}{"%":>8}{"ns/op":>9}{Colors.WHITE}', file=file)
+    for name, count, time in self.opcodes()[:limit]:
+      print(f'{name:<20}{count:>12}{100 * count / total_count:>7.1f}%{time:>10.4f}s{100 * time / total_time:>7.1f}%'
+            f'{1e9 * time / count:>9.0f}', file=file)
+    print(file=file)
+    print(f'{Colors.MAGENTA}{"function":<20}{"count":>12}{"%":>8}{"time":>11}{"%":>8}{Colors.WHITE}', file=file)
+    for name, count, time in self.functions()[:limit]:
+      print(f'{name:<20}{count:>12}{100 * count / total_count:>7.1f}%{time:>10.4f}s{100 * time / total_time:>7.1f}%', file=file)
+    print(file=file)
+    print(f'{Colors.MAGENTA}{"function":<20}{"line":>6}{"count":>12}{"%":>8}{"time":>11}{"%":>8}{Colors.WHITE}', file=file)
+    for name, line, count, time in self.lines()[:limit]:
+      print(f'{name:<20}{line if line is not None else "-":>6}{count:>12}{100 * count / total_count:>7.1f}%'
+            f'{time:>10.4f}s{100 * time / total_time:>7.1f}%', file=file)
+
+  def save_collapsed(self, filename):
+    with open(filename, 'w') as file:
+      for line in self.collapsed():
+        file.write(line + '\n')